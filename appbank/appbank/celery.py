@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from django.conf import settings
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'appbank.settings')
@@ -17,5 +18,21 @@ app.conf.beat_schedule = {
     'call_credit_payment_every_1_minute': {
         'task': 'bank.tasks.call_credit_payment',
         'schedule': crontab(minute='*/1')
+    },
+    'call_snapshot_balances_every_5_minutes': {
+        'task': 'bank.tasks.call_snapshot_balances',
+        'schedule': crontab(minute='*/5')
+    },
+    'call_purge_idempotency_keys_every_hour': {
+        'task': 'bank.tasks.call_purge_idempotency_keys',
+        'schedule': crontab(minute=0)
+    },
+    'call_refresh_account_summaries_every_day': {
+        'task': 'bank.tasks.call_refresh_account_summaries',
+        'schedule': crontab(minute=5, hour=0)
+    },
+    'call_fold_hot_credits': {
+        'task': 'bank.tasks.call_fold_hot_credits',
+        'schedule': settings.BANK_HOT_FOLD_SECONDS
     }
 }
\ No newline at end of file
@@ -1,12 +1,13 @@
 from pathlib import Path
 import os
+import sys
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv('SECRET_KEY')
 
-DEBUG = os.getenv('DEBUG', 'True')
+DEBUG = os.getenv('DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS').split(' ')
 
@@ -21,7 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     # Local
-    'bank',
+    'bank.apps.BankConfig',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'bank.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,6 +47,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bank.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'appbank.urls'
@@ -79,9 +82,55 @@ DATABASES = {
         'PASSWORD': os.getenv('SQL_PASSWORD', 'password'),
         'HOST': os.getenv('SQL_HOST', 'localhost'),
         'PORT': os.getenv('SQL_PORT', '5432'),
+        # Seconds a connection is kept open between requests and tasks,
+        # 0 closes it after each one. With SQL_HOST pointing at pgbouncer
+        # in transaction mode server side cursors must be disabled
+        'CONN_MAX_AGE': int(os.getenv('SQL_CONN_MAX_AGE', 60)),
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('SQL_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True',
     }
 }
 
+# Read replica for list/retrieve actions, enabled by SQL_REPLICA_HOST or
+# SQL_REPLICA_DATABASE. Locally it can be a second SQLite file, e.g.
+# SQL_REPLICA_DATABASE=replica.sqlite3 after copying db.sqlite3 to it
+if os.getenv('SQL_REPLICA_HOST') or os.getenv('SQL_REPLICA_DATABASE'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('SQL_REPLICA_DATABASE', DATABASES['default']['NAME']),
+        'HOST': os.getenv('SQL_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.getenv('SQL_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['bank.routers.PrimaryReplicaRouter']
+
+# Request metrics on /metrics, requests over a budget are logged.
+# An empty budget turns its check off. Scrapes need METRICS_TOKEN as a
+# bearer token, without one /metrics is only served in DEBUG
+_query_budget = os.getenv('METRICS_QUERY_BUDGET', '20')
+_time_budget = os.getenv('METRICS_TIME_BUDGET', '1.0')
+BANK_METRICS = {
+    'PATH': '/metrics',
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),
+    'QUERY_BUDGET': int(_query_budget) if _query_budget else None,
+    'TIME_BUDGET': float(_time_budget) if _time_budget else None,
+}
+
+# Seconds a client reads from the primary after a successful write,
+# longer than the replication lag
+BANK_REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+# Ping a reused connection on its first use in a request or task and
+# reconnect if the server has dropped it
+BANK_DB_HEALTH_CHECKS = os.getenv('SQL_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+
+# Account ids, balances and tokens are cached in Redis, so writes,
+# jobs and logouts of one process reach the others. LOCAL_CACHES keeps
+# them in the process, only for a single process and for the test run,
+# which has no Redis
+LOCAL_CACHES = os.getenv('LOCAL_CACHES', str(sys.argv[1:2] == ['test'])) == 'True'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -132,10 +181,37 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # enable session auth if you want to use drf web api
         # 'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'bank.authentication.CachedTokenAuthentication',
     ],
 }
 
+# Action, transaction and transfer history pages
+BANK_HISTORY_PAGE_SIZE = int(os.getenv('BANK_HISTORY_PAGE_SIZE', 3))
+BANK_HISTORY_MAX_PAGE_SIZE = int(os.getenv('BANK_HISTORY_MAX_PAGE_SIZE', 100))
+
+# Largest payroll batch accepted by transfer/batch/
+BANK_TRANSFER_BATCH_MAX_ITEMS = int(os.getenv('BANK_TRANSFER_BATCH_MAX_ITEMS', 5000))
+# Longest deposit and credit schedule projected by schedule/
+BANK_SCHEDULE_MAX_PERIODS = int(os.getenv('BANK_SCHEDULE_MAX_PERIODS', 120))
+
+# Responses of money moving requests with an Idempotency-Key header are
+# kept for TTL seconds in STORE ('redis' or 'db'), a duplicate that comes
+# while the first request runs waits up to LOCK_TTL seconds for its response
+BANK_IDEMPOTENCY = {
+    'STORE': os.getenv('IDEMPOTENCY_STORE', 'db'),
+    'TTL': int(os.getenv('IDEMPOTENCY_TTL', 24 * 60 * 60)),
+    'LOCK_TTL': int(os.getenv('IDEMPOTENCY_LOCK_TTL', 10)),
+}
+
+# Authenticated tokens are kept in a per-process LRU for TTL seconds,
+# SHARED adds a Redis tier that all web processes see. Without it a
+# logout only reaches the process that served it
+BANK_TOKEN_CACHE = {
+    'MAX_SIZE': int(os.getenv('TOKEN_CACHE_MAX_SIZE', 10000)),
+    'TTL': int(os.getenv('TOKEN_CACHE_TTL', 300)),
+    'SHARED': os.getenv('TOKEN_CACHE_SHARED', str(not LOCAL_CACHES)) == 'True',
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 REDIS_HOST = 'redis'
@@ -145,9 +221,63 @@ REDIS_PORT = '6379'
 REDIS_LOCAL_HOST = '0.0.0.0'
 # REDIS_HOST = REDIS_LOCAL_HOST
 
-CELERY_BROKER_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT
-CELERY_RESULT_BACKEND = 'redis://' + REDIS_HOST + ':' + REDIS_PORT
+REDIS_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT
+
+if LOCAL_CACHES:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL + '/1',
+        }
+    }
+
+BANK_BALANCE_CACHE_TTL = int(os.getenv('BALANCE_CACHE_TTL', 300))
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_IMPORTS = ("bank.tasks", )
\ No newline at end of file
+CELERY_IMPORTS = ("bank.tasks", )
+CELERY_WORKER_CONCURRENCY = int(os.getenv('CELERY_WORKER_CONCURRENCY', 4))
+# Long accrual jobs run on the batch queue with their own workers, so they
+# can't hold up short tasks on the interactive queue, which is the default
+# for every task without a route. Folding hot credits stays interactive,
+# it is short and hot balances lag while it waits
+CELERY_TASK_DEFAULT_QUEUE = 'interactive'
+CELERY_TASK_ROUTES = {
+    'bank.tasks.call_make_interest': {'queue': 'batch'},
+    'bank.tasks.call_credit_payment': {'queue': 'batch'},
+    'bank.tasks.run_job_shard': {'queue': 'batch'},
+    'bank.tasks.finish_job': {'queue': 'batch'},
+    'bank.tasks.release_job_lease': {'queue': 'batch'},
+    'bank.tasks.call_snapshot_balances': {'queue': 'batch'},
+    'bank.tasks.call_purge_idempotency_keys': {'queue': 'batch'},
+    'bank.tasks.call_refresh_account_summaries': {'queue': 'batch'},
+}
+# A worker reserves this many tasks per process. Batch workers override it
+# with 1, so a queued shard isn't stuck behind a long one on a busy process
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', 4))
+# Batch tasks are acknowledged when they finish, a task of a lost worker is
+# delivered again and resumes from its job checkpoint. The soft limit ends
+# a run before its lease expires, the hard limit kills a stuck process
+BANK_BATCH_SOFT_TIME_LIMIT = int(os.getenv('BANK_BATCH_SOFT_TIME_LIMIT', 540))
+BANK_BATCH_TIME_LIMIT = int(os.getenv('BANK_BATCH_TIME_LIMIT', 570))
+# Unacknowledged tasks are delivered again after this, it must be longer
+# than any batch task can run
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': BANK_BATCH_TIME_LIMIT + 60}
+
+# Interest and credit jobs are split into this many shards per beat tick,
+# 1 runs a job as a single task
+BANK_JOB_SHARDS = int(os.getenv('BANK_JOB_SHARDS', 1))
+# A tick holds a lease until its last shard is done, the lease expires
+# after this many seconds if a worker dies
+BANK_JOB_LEASE_SECONDS = int(os.getenv('BANK_JOB_LEASE_SECONDS', 600))
+# Pending credits of hot accounts are folded into their balances this often
+BANK_HOT_FOLD_SECONDS = float(os.getenv('BANK_HOT_FOLD_SECONDS', 5))
\ No newline at end of file
@@ -3,8 +3,11 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from bank.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path(settings.BANK_METRICS['PATH'].lstrip('/'), metrics_view, name='metrics'),
     path('rest-auth/', include('rest_auth.urls')),
     path('rest-auth/registration/', include('rest_auth.registration.urls')),
     path('api/bank/', include('bank.urls', namespace='api')),
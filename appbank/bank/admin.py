@@ -9,3 +9,12 @@ admin.site.register(Transaction)
 admin.site.register(Transfer)
 admin.site.register(Deposit)
 admin.site.register(Credit)
+admin.site.register(Product)
+admin.site.register(LedgerEntry)
+admin.site.register(BalanceSnapshot)
+admin.site.register(LedgerWatermark)
+admin.site.register(HotCredit)
+admin.site.register(IdempotencyKey)
+admin.site.register(AccountSummary)
+admin.site.register(JobRun)
+admin.site.register(JobCheckpoint)
@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class BankConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bank'
+
+    def ready(self):
+        # connect cache invalidation signals
+        from . import authentication, cache  # noqa: F401
+
+        # Celery's Django fixup already closes obsolete connections around
+        # every task, like request_started/finished do for requests
+        from celery.signals import task_prerun
+        from django.core.signals import request_started
+        from .db import check_connections
+        request_started.connect(check_connections, dispatch_uid='bank.check_connections')
+        task_prerun.connect(check_connections, dispatch_uid='bank.check_connections')
+
+        # request metrics count the queries of every connection
+        from django.db.backends.signals import connection_created
+        from .middleware import install_query_recorder
+        connection_created.connect(install_query_recorder, dispatch_uid='bank.install_query_recorder')
@@ -0,0 +1,114 @@
+"""Async read endpoints for the ASGI server.
+
+Django 3.1 has no async ORM, so queries run through sync_to_async in the
+shared thread pool (thread_sensitive=False) instead of the single thread
+that sync views are serialized on. The event loop keeps serving other
+connections while a query or a slow client is waiting"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+from rest_framework import exceptions
+
+from .authentication import CachedTokenAuthentication
+from .cache import account_id_for_user
+from .models import *
+from .serializers import *
+
+
+def database_sync_to_async(func):
+    """Run ORM code in a pool thread and recycle the thread's connection
+       the way it is done at the end of a sync request"""
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def _error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def authenticated(view):
+    """Token authentication for async views, sets request.user"""
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await database_sync_to_async(CachedTokenAuthentication().authenticate)(request)
+        except exceptions.AuthenticationFailed as e:
+            return _error(str(e.detail), 401)
+        if result is None:
+            return _error('Authentication credentials were not provided.', 401)
+
+        request.user = result[0]
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.BANK_HISTORY_PAGE_SIZE))
+    except ValueError:
+        limit = settings.BANK_HISTORY_PAGE_SIZE
+
+    return max(1, min(limit, settings.BANK_HISTORY_MAX_PAGE_SIZE))
+
+
+@database_sync_to_async
+def _history_page(user, model, serializer_class, account_field, limit, before_id):
+    """Newest first page of an account history, keyset on id"""
+    queryset = model.objects.filter(**{account_field: account_id_for_user(user)})
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    rows = list(queryset.order_by('-id')[:limit + 1])
+
+    return serializer_class(rows[:limit], many=True).data, len(rows) > limit
+
+
+def history_view(model, serializer_class, account_field='account_id'):
+    @authenticated
+    async def view(request):
+        try:
+            before_id = int(request.GET['before_id']) if 'before_id' in request.GET else None
+        except ValueError:
+            return _error('before_id must be an integer', 400)
+
+        limit = _limit(request)
+        results, has_more = await _history_page(
+            request.user, model, serializer_class, account_field, limit, before_id
+        )
+        next_url = None
+        if has_more:
+            next_url = request.build_absolute_uri(f'{request.path}?limit={limit}&before_id={results[-1]["id"]}')
+
+        return JsonResponse({'next': next_url, 'results': results})
+
+    return view
+
+
+@database_sync_to_async
+def _retrieve(queryset, serializer_class, pk):
+    instance = queryset.filter(pk=pk).first()
+    return serializer_class(instance).data if instance is not None else None
+
+
+def detail_view(model, serializer_class):
+    @authenticated
+    async def view(request, pk):
+        data = await _retrieve(model.objects.filter(user=request.user), serializer_class, pk)
+        if data is None:
+            return _error('Not found.', 404)
+
+        return JsonResponse(data)
+
+    return view
+
+
+account_detail = detail_view(Account, AccountSerializer)
+profile_detail = detail_view(Profile, ProfileSerializer)
+action_list = history_view(Action, ActionSerializer)
+transaction_list = history_view(Transaction, TransactionSerializer)
+transfer_list = history_view(Transfer, TransferSerializer, account_field='from_account_id')
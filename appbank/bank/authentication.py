@@ -0,0 +1,187 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+from redis.exceptions import RedisError
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """Bounded LRU of token key -> (user, token) with expiring entries and
+       an optional shared tier in Redis. The shared tier holds the user id
+       of a token as JSON, its users are read from the primary"""
+
+    def __init__(self, max_size, ttl, shared=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared_key(self, key):
+        return f'bank:token:{key}'
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _dump(self, value):
+        user, token = value
+        return json.dumps({'user_id': user.pk, 'created': token.created.isoformat()})
+
+    def _load(self, key, data):
+        payload = json.loads(data)
+        user = get_user_model().objects.using('default').filter(pk=payload['user_id'], is_active=True).first()
+        if user is None:
+            return None
+        return user, Token(key=key, user=user, created=parse_datetime(payload['created']))
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        value = self._get_local(key)
+        if value is not None and not self.shared:
+            self._count('hits')
+            return value
+
+        if self.shared:
+            try:
+                # a token revoked by another process is only gone from the
+                # shared tier, so local hits are confirmed there
+                if value is not None and get_redis().exists(self._shared_key(key)):
+                    self._count('hits')
+                    return value
+                data = get_redis().get(self._shared_key(key))
+            except RedisError:
+                # a revoked token can't be told from a valid one, the
+                # caller reads the database
+                logger.warning('Token cache: Redis is not available', exc_info=True)
+                data = None
+            value = self._load(key, data) if data is not None else None
+            if value is not None:
+                self._set_local(key, value)
+                self._count('shared_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        self._set_local(key, value)
+        if self.shared:
+            try:
+                get_redis().set(self._shared_key(key), self._dump(value), ex=self.ttl)
+            except RedisError:
+                logger.warning('Token cache: Redis is not available', exc_info=True)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared:
+            # while Redis is down get() doesn't serve local hits either
+            try:
+                get_redis().delete(self._shared_key(key))
+            except RedisError:
+                logger.warning('Token cache: Redis is not available', exc_info=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+            }
+
+
+token_cache = TokenCache(
+    max_size=settings.BANK_TOKEN_CACHE['MAX_SIZE'],
+    ttl=settings.BANK_TOKEN_CACHE['TTL'],
+    shared=settings.BANK_TOKEN_CACHE['SHARED'],
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the Token and User query for
+       recently seen tokens. Tokens are read from the primary"""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # a token issued moments ago may not be on the replica yet
+        try:
+            token = Token.objects.using('default').select_related('user').get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        token_cache.set(key, (token.user, token))
+
+        return token.user, token
+
+
+@receiver(post_delete, sender=Token)
+def revoke_token(sender, instance, **kwargs):
+    """Logout through rest_auth deletes the token"""
+    token_cache.invalidate(instance.key)
+
+
+def _credentials(user):
+    return user.__dict__.get('password'), user.__dict__.get('is_active')
+
+
+@receiver(post_init, sender=get_user_model())
+def remember_credentials(sender, instance, **kwargs):
+    instance._loaded_credentials = _credentials(instance)
+
+
+@receiver(post_save, sender=get_user_model())
+def revoke_user_tokens(sender, instance, created, **kwargs):
+    """Tokens of users whose password changed or who were deactivated
+       must not be served from the cache. Other saves, like the last_login
+       update of every login, keep them"""
+    if not created and _credentials(instance) != instance._loaded_credentials:
+        for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+            token_cache.invalidate(key)
+    instance._loaded_credentials = _credentials(instance)
@@ -0,0 +1,2 @@
+"""Performance benchmarks of model operations, API endpoints and batch
+jobs, run with `manage.py run_benchmarks`"""
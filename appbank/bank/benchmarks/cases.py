@@ -0,0 +1,257 @@
+"""Benchmark cases. A case gets the context and returns (prepare, run):
+   prepare() builds the arguments of one iteration untimed, run(*args)
+   is the timed operation. Admin-only list actions are left out, they
+   return every account of the dataset in one response"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Max
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from bank.models import *
+from bank.services import credit_payment, make_interest
+
+
+CASES = []
+
+POOL_BALANCE = Decimal('100000000.00')
+BATCH_ITEMS = 100
+
+
+def register(group, name, factory):
+    CASES.append((group, name, factory))
+
+
+def case(group):
+    def decorator(func):
+        register(group, func.__name__, func)
+        return func
+    return decorator
+
+
+class Context:
+    """Pool accounts with balances large enough for every case and an
+       API client authenticated with the token of each of them"""
+
+    def __init__(self, dataset, seed=0):
+        self.rng = random.Random(seed)
+        self.pool = dataset.pool
+        Account.objects.filter(pk__in=self.pool).update(balance=POOL_BALANCE)
+        users = dict(Account.objects.filter(pk__in=self.pool).values_list('pk', 'user'))
+        self.clients = {}
+        for account_id in self.pool:
+            token, _ = Token.objects.get_or_create(user_id=users[account_id])
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+            self.clients[account_id] = client
+
+    def account(self):
+        return Account.objects.get(pk=self.rng.choice(self.pool))
+
+    def two_accounts(self):
+        from_pk, to_pk = self.rng.sample(self.pool, 2)
+        return Account.objects.get(pk=from_pk), Account.objects.get(pk=to_pk)
+
+    def client(self):
+        account_id = self.rng.choice(self.pool)
+        return self.clients[account_id], account_id
+
+    def deposit(self, amount=Decimal('100.00')):
+        account = self.account()
+        return Deposit.make_deposit(amount, account), account
+
+    def credit(self, amount=Decimal('100.00')):
+        account = self.account()
+        return Credit.make_credit(amount, account), account
+
+
+def request(method, url, data=None):
+    """Run one API request, error statuses are failures"""
+    def run(client):
+        response = getattr(client, method)(url, data, format='json')
+        if response.status_code >= 400:
+            raise(ValueError(f'HTTP {response.status_code}'))
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+
+    return run
+
+
+# Model operations
+
+@case('model')
+def make_action(ctx):
+    return lambda: (ctx.account(),), lambda account: Action.make_action(Decimal('1.00'), account)
+
+
+@case('model')
+def make_transaction(ctx):
+    return lambda: (ctx.account(),), lambda account: Transaction.make_transaction(Decimal('1.00'), account, 'shop')
+
+
+@case('model')
+def make_transfer(ctx):
+    return ctx.two_accounts, lambda from_account, to_account: Transfer.make_transfer(Decimal('1.00'), from_account, to_account)
+
+
+@case('model')
+def make_batch_transfer(ctx):
+    def prepare():
+        account = ctx.account()
+        recipients = [pk for pk in ctx.pool if pk != account.pk]
+        return account, [(ctx.rng.choice(recipients), Decimal('1.00')) for _ in range(BATCH_ITEMS)]
+
+    return prepare, lambda account, items: Transfer.make_batch_transfer(items, account)
+
+
+@case('model')
+def make_deposit(ctx):
+    return lambda: (ctx.account(),), lambda account: Deposit.make_deposit(Decimal('10.00'), account)
+
+
+@case('model')
+def update_deposit(ctx):
+    return ctx.deposit, lambda deposit, account: Deposit.update_deposit(deposit, Decimal('1.00'), account)
+
+
+@case('model')
+def close_deposit(ctx):
+    return ctx.deposit, lambda deposit, account: Deposit.close_deposit(deposit, account)
+
+
+@case('model')
+def make_credit(ctx):
+    return lambda: (ctx.account(),), lambda account: Credit.make_credit(Decimal('10.00'), account)
+
+
+@case('model')
+def update_credit(ctx):
+    return ctx.credit, lambda credit, account: Credit.update_credit(credit, Decimal('1.00'), account)
+
+
+# API actions, each on the account of a random pool user
+
+def _get(path):
+    def factory(ctx):
+        def prepare():
+            client, account_id = ctx.client()
+            return client, path(account_id) if callable(path) else path
+        return prepare, lambda client, url: request('get', url)(client)
+    return factory
+
+
+register('api', 'account_retrieve', _get(lambda account_id: reverse('bank:account-detail', args=[account_id])))
+register('api', 'account_summary', _get(reverse('bank:account-summary')))
+register('api', 'action_list', _get(reverse('bank:action-list')))
+register('api', 'transaction_list', _get(reverse('bank:transaction-list')))
+register('api', 'transfer_list', _get(reverse('bank:transfer-list')))
+register('api', 'transfer_list_cursor', _get(reverse('bank:transfer-list') + '?pagination=cursor'))
+register('api', 'deposit_list', _get(reverse('bank:deposit-list')))
+register('api', 'credit_list', _get(reverse('bank:credit-list')))
+register('api', 'statement_ndjson_30d', _get(
+    lambda account_id: reverse('bank:statement-list') + '?output=ndjson&date_from=' +
+    (timezone.localdate() - timedelta(days=30)).isoformat()
+))
+
+
+@case('api')
+def profile_retrieve(ctx):
+    def prepare():
+        client, account_id = ctx.client()
+        profile_id = Profile.objects.filter(user__account=account_id).values_list('pk', flat=True).first()
+        return client, reverse('bank:profile-detail', args=[profile_id])
+
+    return prepare, lambda client, url: request('get', url)(client)
+
+
+@case('api')
+def profile_update(ctx):
+    retrieve, _ = profile_retrieve(ctx)
+    return retrieve, lambda client, url: request('put', url, {'first_name': 'Bench', 'last_name': 'Mark'})(client)
+
+
+def _post(name, url, data):
+    register('api', name, lambda ctx: (lambda: (ctx.client()[0],), request('post', url, data)))
+
+
+_post('action_create', reverse('bank:action-list'), {'amount': '1.00'})
+_post('transaction_create', reverse('bank:transaction-list'), {'amount': '1.00', 'merchant': 'shop'})
+_post('deposit_create', reverse('bank:deposit-list'), {'amount': '1.00'})
+_post('credit_create', reverse('bank:credit-list'), {'amount': '1.00'})
+
+
+@case('api')
+def transfer_create(ctx):
+    def prepare():
+        client, account_id = ctx.client()
+        return client, ctx.rng.choice([pk for pk in ctx.pool if pk != account_id])
+
+    def run(client, to_account):
+        request('post', reverse('bank:transfer-list'), {'to_account': to_account, 'amount': '1.00'})(client)
+
+    return prepare, run
+
+
+@case('api')
+def transfer_batch(ctx):
+    def prepare():
+        client, account_id = ctx.client()
+        recipients = [pk for pk in ctx.pool if pk != account_id]
+        items = [{'to_account': ctx.rng.choice(recipients), 'amount': '1.00'} for _ in range(BATCH_ITEMS)]
+        return client, {'items': items}
+
+    return prepare, lambda client, data: request('post', reverse('bank:transfer-batch'), data)(client)
+
+
+def _on_own(model, action):
+    """Prepare a row of the client's account for a detail action"""
+    def prepare_for(ctx):
+        def prepare():
+            client, account_id = ctx.client()
+            account = Account.objects.get(pk=account_id)
+            if model is Deposit:
+                instance = Deposit.make_deposit(Decimal('100.00'), account)
+            else:
+                instance = Credit.make_credit(Decimal('100.00'), account)
+                if action == 'destroy':
+                    Credit.update_credit(instance, instance.amount, account)
+            return client, reverse(f'bank:{model.__name__.lower()}-detail', args=[instance.pk])
+        return prepare
+    return prepare_for
+
+
+def _detail(name, model, action, method, data=None):
+    prepare_for = _on_own(model, action)
+    register('api', name, lambda ctx: (prepare_for(ctx), lambda client, url: request(method, url, data)(client)))
+
+
+_detail('deposit_update', Deposit, 'update', 'put', {'amount': '1.00'})
+_detail('deposit_destroy', Deposit, 'destroy', 'delete')
+_detail('credit_update', Credit, 'update', 'put', {'amount': '1.00'})
+_detail('credit_destroy', Credit, 'destroy', 'delete')
+
+
+# Batch jobs over the whole dataset, every run is at a period when all
+# rows are due
+
+def _all_due(queryset):
+    def prepare():
+        last = queryset.aggregate(last=Max('next_due_at'))['last']
+        return (max(timezone.now(), last) if last else timezone.now(),)
+
+    return prepare
+
+
+@case('job')
+def make_interest_job(ctx):
+    return _all_due(Deposit.objects.all()), lambda period: make_interest(period=period)
+
+
+@case('job')
+def credit_payment_job(ctx):
+    return _all_due(Credit.objects.filter(amount__gt=0)), lambda period: credit_payment(period=period)
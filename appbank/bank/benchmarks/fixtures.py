@@ -0,0 +1,140 @@
+"""Seeded benchmark dataset. Rows are written with bulk inserts and
+without signals, so millions of them take minutes, not hours. Seeded
+history has no ledger entries, run benchmarks on a dedicated database"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from bank.models import *
+
+
+PREFIX = 'bench-'
+PASSWORD = 'benchmark'
+BATCH_SIZE = 10000
+HISTORY_DAYS = 365
+
+
+class Dataset:
+    """Seeded accounts; operations run on a pool of them"""
+
+    def __init__(self, account_ids, pool_size=100):
+        self.account_ids = account_ids
+        self.pool = account_ids[:pool_size]
+
+    def describe(self):
+        return {
+            'accounts': len(self.account_ids),
+            'actions': Action.objects.count(),
+            'transactions': Transaction.objects.count(),
+            'transfers': Transfer.objects.count(),
+            'deposits': Deposit.objects.count(),
+            'credits': Credit.objects.count(),
+        }
+
+
+def bench_users():
+    return get_user_model().objects.filter(username__startswith=PREFIX)
+
+
+def load():
+    account_ids = list(Account.objects.filter(user__in=bench_users()).order_by('pk').values_list('pk', flat=True))
+    return Dataset(account_ids) if account_ids else None
+
+
+@contextmanager
+def explicit_dates(*models):
+    """Let bulk inserts keep the given dates instead of auto_now_add"""
+    fields = [model._meta.get_field('date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _batches(count, batch_size):
+    for start in range(0, count, batch_size):
+        yield range(start, min(start + batch_size, count))
+
+
+def seed(accounts=10000, history=100000, seed=0, batch_size=BATCH_SIZE, log=None):
+    """Create accounts with profiles and summaries, history rows spread
+       over the last year and deposits and credits for a fifth of the
+       accounts. Returns the dataset"""
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    password = make_password(PASSWORD)
+    account_ids = []
+
+    for batch in _batches(accounts, batch_size):
+        with transaction.atomic():
+            names = [f'{PREFIX}{i}' for i in batch]
+            get_user_model().objects.bulk_create(get_user_model()(username=name, password=password) for name in names)
+            user_ids = list(get_user_model().objects.filter(username__in=names).values_list('pk', flat=True))
+            Account.objects.bulk_create(
+                Account(user_id=user_id, balance=Decimal(rng.randrange(100000, 10000000)) / 100) for user_id in user_ids
+            )
+            Profile.objects.bulk_create(Profile(user_id=user_id) for user_id in user_ids)
+            ids = list(Account.objects.filter(user_id__in=user_ids).values_list('pk', flat=True))
+            AccountSummary.objects.bulk_create(AccountSummary(account_id=account_id) for account_id in ids)
+            account_ids.extend(ids)
+        log(f'accounts: {len(account_ids)}/{accounts}')
+
+    now = timezone.now()
+    date = lambda: now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 24 * 60 * 60))
+    amount = lambda: Decimal(rng.randrange(100, 100000)) / 100
+    account = lambda: rng.choice(account_ids)
+
+    with explicit_dates(Action, Transaction, Transfer, Deposit, Credit):
+        for batch in _batches(history, batch_size):
+            actions, transactions, transfers = [], [], []
+            for _ in batch:
+                kind = rng.random()
+                if kind < 0.4:
+                    actions.append(Action(account_id=account(), amount=amount(), date=date()))
+                elif kind < 0.7:
+                    transactions.append(Transaction(account_id=account(), amount=amount(), merchant='shop', date=date()))
+                else:
+                    from_account, to_account = rng.sample(account_ids, 2)
+                    transfers.append(Transfer(from_account_id=from_account, to_account_id=to_account, amount=amount(), date=date()))
+
+            with transaction.atomic():
+                Action.objects.bulk_create(actions)
+                Transaction.objects.bulk_create(transactions)
+                Transfer.objects.bulk_create(transfers)
+            log(f'history: {batch.stop}/{history}')
+
+        holders = rng.sample(account_ids, len(account_ids) // 5)
+        for batch in _batches(len(holders), batch_size):
+            deposits, credits = [], []
+            for i in batch:
+                deposits.append(Deposit(account_id=holders[i], amount=amount(), date=date()))
+                total = amount()
+                credits.append(Credit(account_id=holders[i], amount=total, total_amount=total, date=date()))
+
+            with transaction.atomic():
+                Deposit.objects.bulk_create(deposits)
+                Credit.objects.bulk_create(credits)
+                for field, rows in (('deposit_total', deposits), ('credit_outstanding', credits)):
+                    AccountSummary.record(**{field: {row.account_id: row.amount for row in rows}})
+        log(f'deposits and credits: {len(holders)}')
+
+    return Dataset(sorted(account_ids))
+
+
+def drop():
+    """Delete everything seeded and done by benchmarks"""
+    accounts = Account.objects.filter(user__in=bench_users())
+    LedgerEntry.objects.filter(posting__in=LedgerEntry.objects.filter(account__in=accounts).values('posting')).delete()
+    BalanceSnapshot.objects.filter(account__in=accounts).delete()
+    Transfer.objects.filter(to_account__in=accounts).delete()
+    accounts.delete()
+    bench_users().delete()
@@ -0,0 +1,76 @@
+import math
+import statistics
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def measure(group, name, prepare, run, iterations, warmup=1):
+    """Time run(*prepare()) iterations times. prepare() is not timed.
+       An iteration that raises counts as an error and is not timed"""
+    for _ in range(warmup):
+        try:
+            run(*prepare())
+        except Exception:
+            pass
+
+    latencies = []
+    queries = 0
+    errors = []
+    for _ in range(iterations):
+        args = prepare()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            try:
+                run(*args)
+            except Exception as e:
+                errors.append(f'{type(e).__name__}: {e}')
+                continue
+            latencies.append(time.perf_counter() - started)
+        queries += len(captured)
+
+    latencies.sort()
+    seconds = sum(latencies)
+    ms = lambda value: round(value * 1000, 3)
+
+    return {
+        'group': group,
+        'name': name,
+        'iterations': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'seconds': round(seconds, 6),
+        'ops_per_second': round(len(latencies) / seconds, 1) if seconds else 0.0,
+        'mean_ms': ms(statistics.mean(latencies)) if latencies else 0.0,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]) if latencies else 0.0,
+        'queries_per_op': round(queries / len(latencies), 2) if latencies else 0.0,
+    }
+
+
+def compare(results, baseline):
+    """p50 latency and query count changes against a previous run"""
+    previous = {(row['group'], row['name']): row for row in baseline['results']}
+    changes = []
+    for row in results:
+        before = previous.get((row['group'], row['name']))
+        if before is None or not before['p50_ms']:
+            continue
+        changes.append({
+            'group': row['group'],
+            'name': row['name'],
+            'p50_change': round(row['p50_ms'] / before['p50_ms'] - 1, 3),
+            'queries_change': round(row['queries_per_op'] - before['queries_per_op'], 2),
+        })
+
+    return changes
@@ -0,0 +1,95 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Account
+from .signals import balances_changed, balances_invalidated
+
+
+ACCOUNT_ID_TIMEOUT = 60 * 60
+
+
+def _account_id_key(user_id):
+    return f'bank:account-id:{user_id}'
+
+
+def account_id_for_user(user):
+    """Id of the user's account, cached across requests"""
+    key = _account_id_key(user.pk)
+    account_id = cache.get(key)
+    if account_id is None:
+        account_id = Account.objects.values_list('pk', flat=True).get(user=user)
+        cache.set(key, account_id, ACCOUNT_ID_TIMEOUT)
+
+    return account_id
+
+
+def _balance_key(account_id):
+    return f'bank:balance:{account_id}'
+
+
+def cached_balance(account_id):
+    """Balance of an account, loaded from the primary on a miss.
+       Incoming transfers of a hot account are not in its balance column,
+       so its balance is the snapshot plus the ledger entries after it.
+       add() doesn't overwrite a value written through meanwhile"""
+    key = _balance_key(account_id)
+    balance = cache.get(key)
+    if balance is None:
+        balance, is_hot = Account.objects.using('default').values_list('balance', 'is_hot').get(pk=account_id)
+        if is_hot:
+            balance = Account(pk=account_id).ledger_balance(using='default')
+        cache.add(key, balance, settings.BANK_BALANCE_CACHE_TTL)
+
+    return balance
+
+
+def balance_etag(account_id, balance):
+    digest = hashlib.sha1(f'{account_id}:{balance}'.encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def write_balances_through(balances):
+    """Drop cached balances now and write the new ones once the
+       transaction commits. Readers in between reload committed values,
+       after a rollback the next read reloads them"""
+    cache.delete_many([_balance_key(account_id) for account_id in balances])
+    transaction.on_commit(lambda: cache.set_many(
+        {_balance_key(account_id): balance for account_id, balance in balances.items()},
+        settings.BANK_BALANCE_CACHE_TTL,
+    ))
+
+
+@receiver(post_save, sender=Account)
+def cache_account_id(sender, instance, **kwargs):
+    """Write the user to account mapping through on every account save"""
+    cache.set(_account_id_key(instance.user_id), instance.pk, ACCOUNT_ID_TIMEOUT)
+
+
+@receiver(post_save, sender=Account)
+def cache_saved_balance(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'balance' in update_fields:
+        write_balances_through({instance.pk: instance.balance})
+
+
+@receiver(balances_changed)
+def cache_changed_balances(sender, balances, **kwargs):
+    write_balances_through(balances)
+
+
+@receiver(balances_invalidated)
+def forget_changed_balances(sender, account_ids, **kwargs):
+    """Drop cached balances now and again once the transaction commits,
+       the next read loads the committed balance"""
+    keys = [_balance_key(account_id) for account_id in account_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_delete, sender=Account)
+def forget_account_id(sender, instance, **kwargs):
+    cache.delete_many([_account_id_key(instance.user_id), _balance_key(instance.pk)])
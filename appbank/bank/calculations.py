@@ -0,0 +1,98 @@
+"""Interest and repayment math on columns of amounts.
+   Amounts are int64 arrays of minor units and rates are exact fractions,
+   so every result is rounded once, half to even, and the jobs and the
+   schedule projections book the same cents"""
+from decimal import Decimal
+from fractions import Fraction
+
+import numpy as np
+
+
+MINOR_UNITS = 100
+MONTHLY_INTEREST_RATE = Fraction(5, 100) / 12
+CREDIT_PAYMENT_SHARE = Fraction(1, 10)
+
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+def to_minor(amounts):
+    """int64 array of minor units from an iterable of Decimals. Batch
+       jobs read columns of minor units from the database instead"""
+    scaled = np.array(list(amounts), dtype=object) * MINOR_UNITS
+    minor = scaled.astype(np.int64)
+    fractional = scaled != minor
+    if fractional.any():
+        raise(ValueError(f'{scaled[fractional][0] / MINOR_UNITS} has more than two decimal places'))
+
+    return minor
+
+
+def to_decimal(minor):
+    """List of Decimals from an array of minor units"""
+    return [Decimal(value).scaleb(-2) for value in minor.tolist()]
+
+
+def scale(minor, rate):
+    """minor * rate rounded half to even, rate is a Fraction"""
+    rate = Fraction(rate)
+    if minor.size and int(np.abs(minor).max()) * abs(rate.numerator) > _INT64_MAX:
+        raise(ValueError('Amounts are too large for exact calculation'))
+
+    quotient, remainder = np.divmod(minor * rate.numerator, rate.denominator)
+    twice = 2 * remainder
+    round_up = (twice > rate.denominator) | ((twice == rate.denominator) & (quotient % 2 == 1))
+
+    return quotient + round_up
+
+
+def scale_by(minor, keys, rates):
+    """scale() with a rate per row, picked by the row's key from {key: rate}"""
+    keys = list(keys)
+    result = np.zeros_like(minor)
+    for key in set(keys):
+        mask = np.fromiter((row_key == key for row_key in keys), dtype=bool, count=len(keys))
+        result[mask] = scale(minor[mask], rates[key])
+
+    return result
+
+
+def accrue(minor, rate=MONTHLY_INTEREST_RATE):
+    """Interest of one period for every amount"""
+    return scale(minor, rate)
+
+
+def repay(minor, due):
+    """Payment of one period and the amount left for every credit.
+       A payment is the due share of the total amount and never more than
+       what is left, a credit is paid off when nothing is left"""
+    payments = np.maximum(np.minimum(due, minor), 0)
+
+    return payments, minor - payments
+
+
+def project_deposits(minor, periods, rate=MONTHLY_INTEREST_RATE):
+    """Interest and amounts of the next periods, arrays of shape
+       (deposits, periods). Column k is what accrual k + 1 books"""
+    interest = np.zeros((len(minor), periods), dtype=np.int64)
+    amounts = np.zeros((len(minor), periods), dtype=np.int64)
+    current = minor
+    for period in range(periods):
+        interest[:, period] = accrue(current, rate)
+        current = current + interest[:, period]
+        amounts[:, period] = current
+
+    return interest, amounts
+
+
+def project_credits(minor, total_minor, periods, share=CREDIT_PAYMENT_SHARE):
+    """Payments and amounts left of the next periods, arrays of shape
+       (credits, periods). Payments are zero after a credit is paid off"""
+    payments = np.zeros((len(minor), periods), dtype=np.int64)
+    amounts = np.zeros((len(minor), periods), dtype=np.int64)
+    due = scale(total_minor, share)
+    current = minor
+    for period in range(periods):
+        payments[:, period], current = repay(current, due)
+        amounts[:, period] = current
+
+    return payments, amounts
@@ -0,0 +1,87 @@
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+
+
+# SQLSTATE serialization_failure and deadlock_detected
+RETRYABLE_PGCODES = ('40001', '40P01')
+
+_retries = 0
+_retries_lock = threading.Lock()
+
+
+def is_conflict(error):
+    """Error is a lock conflict that is safe to retry"""
+    pgcode = getattr(error.__cause__, 'pgcode', None)
+    if pgcode is not None:
+        return pgcode in RETRYABLE_PGCODES
+
+    return 'database is locked' in str(error)
+
+
+def conflict_retries():
+    """Number of retries made by retry_on_conflict in this process"""
+    return _retries
+
+
+def retry_on_conflict(attempts=5, base_delay=0.01, max_delay=0.5):
+    """Retry a transaction on serialization failures and deadlocks with
+       jittered exponential backoff. Inside an outer transaction the error
+       is raised as is, only the outermost block can be replayed"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            global _retries
+
+            for attempt in range(attempts):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    if attempt == attempts - 1 or connection.in_atomic_block or not is_conflict(e):
+                        raise
+
+                with _retries_lock:
+                    _retries += 1
+                delay = min(max_delay, base_delay * 2 ** attempt)
+                time.sleep(random.uniform(delay / 2, delay))
+
+        return wrapper
+
+    return decorator
+
+
+def check_connections(**kwargs):
+    """Check reused connections on their first use in a request or Celery
+       task, like CONN_HEALTH_CHECKS of Django 4.1. A connection that is
+       no longer usable is closed, so the query reconnects instead of
+       failing, requests that don't touch a database don't ping it.
+       Connected to the start of requests and tasks, after Django's own
+       close_old_connections"""
+    if not settings.BANK_DB_HEALTH_CHECKS:
+        return
+
+    for conn in connections.all():
+        if conn.connection is not None:
+            _check_on_first_use(conn)
+            conn.health_check_pending = True
+
+
+def _check_on_first_use(conn):
+    """Wrap ensure_connection() of a connection once, it runs before every
+       cursor and transaction"""
+    if getattr(conn, 'health_check_pending', None) is not None:
+        return
+    ensure_connection = conn.ensure_connection
+
+    def checked_ensure_connection():
+        if conn.health_check_pending:
+            conn.health_check_pending = False
+            if conn.connection is not None and not conn.in_atomic_block and not conn.is_usable():
+                conn.close()
+        ensure_connection()
+
+    conn.ensure_connection = checked_ensure_connection
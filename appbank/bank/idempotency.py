@@ -0,0 +1,158 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+from .redis_client import get_redis
+
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+
+class RedisIdempotencyStore:
+    """Stored responses and short locks in Redis, evicted by key TTL"""
+
+    def _key(self, scope, kind='response'):
+        user_id, key = scope
+        return f'bank:idempotency:{kind}:{user_id}:{key}'
+
+    def get(self, scope):
+        data = get_redis().get(self._key(scope))
+        return json.loads(data) if data is not None else None
+
+    def save(self, scope, record, ttl):
+        get_redis().set(self._key(scope), json.dumps(record), ex=ttl)
+
+    def lock(self, scope, ttl):
+        return bool(get_redis().set(self._key(scope, 'lock'), 1, nx=True, ex=ttl))
+
+    def unlock(self, scope):
+        get_redis().delete(self._key(scope, 'lock'))
+
+
+class DatabaseIdempotencyStore:
+    """Stored responses in IdempotencyKey rows. A row without a response
+       is the lock of a request in progress"""
+
+    def get(self, scope):
+        user_id, key = scope
+        row = IdempotencyKey.objects.filter(
+            user_id=user_id, key=key, status_code__isnull=False, expires_at__gt=timezone.now()
+        ).first()
+        if row is None:
+            return None
+
+        return {'fingerprint': row.fingerprint, 'status': row.status_code, 'data': json.loads(row.response)}
+
+    def save(self, scope, record, ttl):
+        user_id, key = scope
+        IdempotencyKey.objects.filter(user_id=user_id, key=key).update(
+            fingerprint=record['fingerprint'],
+            status_code=record['status'],
+            response=json.dumps(record['data']),
+            expires_at=timezone.now() + timedelta(seconds=ttl),
+        )
+
+    def lock(self, scope, ttl):
+        user_id, key = scope
+        now = timezone.now()
+        IdempotencyKey.objects.filter(user_id=user_id, key=key, expires_at__lte=now).delete()
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(user_id=user_id, key=key, expires_at=now + timedelta(seconds=ttl))
+        except IntegrityError:
+            return False
+
+        return True
+
+    def unlock(self, scope):
+        user_id, key = scope
+        IdempotencyKey.objects.filter(user_id=user_id, key=key, status_code__isnull=True).delete()
+
+
+STORES = {
+    'redis': RedisIdempotencyStore,
+    'db': DatabaseIdempotencyStore,
+}
+
+
+def get_store():
+    return STORES[settings.BANK_IDEMPOTENCY['STORE']]()
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(f'{request.method} {request.path} {body}'.encode()).hexdigest()
+
+
+def _replay(record, fingerprint):
+    if record['fingerprint'] != fingerprint:
+        content = {"error": "Idempotency-Key was already used with another request"}
+        return Response(content, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    return Response(record['data'], status=record['status'], headers={'Idempotent-Replayed': 'true'})
+
+
+def _wait_for_record(store, scope, timeout):
+    """Collapse a concurrent duplicate into the response of the first request"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        record = store.get(scope)
+        if record is not None:
+            return record
+
+    return None
+
+
+def idempotent(view_method):
+    """Replay the stored response for a repeated Idempotency-Key header
+       instead of running the view again"""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            content = {"error": f"Idempotency-Key can't be longer than {MAX_KEY_LENGTH}"}
+            return Response(content, status=status.HTTP_400_BAD_REQUEST)
+
+        options = settings.BANK_IDEMPOTENCY
+        store = get_store()
+        scope = (request.user.pk, key)
+        fingerprint = _fingerprint(request)
+
+        record = store.get(scope)
+        if record is None and not store.lock(scope, options['LOCK_TTL']):
+            record = _wait_for_record(store, scope, options['LOCK_TTL'])
+            if record is None:
+                content = {"error": "A request with this Idempotency-Key is in progress"}
+                return Response(content, status=status.HTTP_409_CONFLICT)
+
+        if record is None:
+            try:
+                # the first request may have finished before the lock was taken
+                record = store.get(scope)
+                if record is None:
+                    response = view_method(self, request, *args, **kwargs)
+                    if response.status_code < 500:
+                        data = json.loads(json.dumps(response.data, cls=JSONEncoder))
+                        store.save(scope, {'fingerprint': fingerprint, 'status': response.status_code, 'data': data},
+                                   options['TTL'])
+                    return response
+            finally:
+                store.unlock(scope)
+
+        return _replay(record, fingerprint)
+
+    return wrapper
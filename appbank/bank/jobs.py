@@ -0,0 +1,104 @@
+"""Checkpointed batch jobs.
+   A job is a batch step registered with @step. A run of a job is
+   identified by its period and covers one or more primary key ranges,
+   every range has a checkpoint that is moved in the transaction of the
+   batch it follows. A row is changed at most once per period because the
+   batch that changes it commits together with the checkpoint past it, and
+   a resumed run starts after the last committed batch"""
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import JobCheckpoint, JobRun
+
+
+logger = logging.getLogger(__name__)
+
+STEPS = {}
+
+
+def step(job):
+    """Register the batch step of a job. The step is called with the
+       period and options of a run and returns a batch function, which
+       takes the primary key to continue after and a range and returns
+       (last primary key, rows) or None when the range is done"""
+    def register(factory):
+        STEPS[job] = factory
+        return factory
+
+    return register
+
+
+def start(job, period, ranges=(None,)):
+    """Create a run with a checkpoint for each range, so shards that never
+       start are still resumable. Runs of the job that are still marked
+       running were interrupted, the caller holds the job's lease"""
+    JobRun.objects.filter(job=job, status=JobRun.RUNNING).exclude(period=period).update(
+        status=JobRun.FAILED, error='interrupted', finished_at=timezone.now()
+    )
+    run, created = JobRun.objects.get_or_create(job=job, period=period)
+    if created:
+        JobCheckpoint.objects.bulk_create(
+            JobCheckpoint(run=run, lo=pk_range[0], hi=pk_range[1]) if pk_range else JobCheckpoint(run=run)
+            for pk_range in ranges
+        )
+
+    return run
+
+
+def run(job, period, pk_range=None, **options):
+    """Run the range of a job for a period from its checkpoint, returns the
+       number of rows this call changed"""
+    job_run, _ = JobRun.objects.get_or_create(job=job, period=period)
+    lo, hi = pk_range or (None, None)
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(run=job_run, lo=lo, hi=hi)
+
+    return _run_checkpoint(job_run, checkpoint, options)
+
+
+def resume(job_run, **options):
+    """Finish the open checkpoints of a run, returns the number of rows"""
+    rows = sum(
+        _run_checkpoint(job_run, checkpoint, options)
+        for checkpoint in job_run.checkpoints.filter(done=False).order_by('pk')
+    )
+    _finish(job_run)
+
+    return rows
+
+
+def _run_checkpoint(job_run, checkpoint, options):
+    if checkpoint.done:
+        return 0
+
+    batch = STEPS[job_run.job](job_run.period, **options)
+    last_pk = checkpoint.last_pk
+    rows = 0
+    try:
+        while True:
+            with transaction.atomic():
+                result = batch(last_pk, checkpoint.pk_range)
+                if result is None:
+                    break
+                last_pk, count = result
+                JobCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                    last_pk=last_pk, rows=F('rows') + count, batches=F('batches') + 1, updated_at=timezone.now()
+                )
+            rows += count
+    except Exception as e:
+        JobRun.objects.filter(pk=job_run.pk).update(status=JobRun.FAILED, error=str(e), finished_at=timezone.now())
+        logger.exception('%s: run %s failed after primary key %s', job_run.job, job_run.pk, last_pk)
+        raise
+
+    JobCheckpoint.objects.filter(pk=checkpoint.pk).update(done=True, updated_at=timezone.now())
+    _finish(job_run)
+
+    return rows
+
+
+def _finish(job_run):
+    """Mark a run done once all of its ranges are"""
+    if not job_run.checkpoints.filter(done=False).exists():
+        JobRun.objects.filter(pk=job_run.pk).update(status=JobRun.DONE, error='', finished_at=timezone.now())
@@ -0,0 +1,28 @@
+from uuid import uuid4
+
+from .redis_client import get_redis
+
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _lease_key(name):
+    return f'bank:lease:{name}'
+
+
+def acquire_lease(name, ttl):
+    """Take a lease for ttl seconds. Returns token or None if it is taken"""
+    token = uuid4().hex
+    if get_redis().set(_lease_key(name), token, nx=True, ex=ttl):
+        return token
+    return None
+
+
+def release_lease(name, token):
+    """Release a lease only if it is still held with this token"""
+    return bool(get_redis().eval(RELEASE_SCRIPT, 1, _lease_key(name), token))
@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from bank.models import Account
+
+
+class Command(BaseCommand):
+    help = ('Run a request-sized query inside the request_started/request_finished cycle with '
+            'a connection per request and with a persistent connection and compare the cost')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per mode')
+        parser.add_argument('--max-age', type=int, default=None,
+                            help='CONN_MAX_AGE of the persistent mode (default: settings, at least 60)')
+
+    def handle(self, *args, **options):
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        max_age = options['max_age'] or max(configured or 0, 60)
+        connects = []
+
+        def count(sender, connection, **kwargs):
+            connects.append(connection.alias)
+
+        connection_created.connect(count)
+
+        try:
+            for mode, age in (('per-request', 0), ('persistent', max_age)):
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = age
+                del connects[:]
+                latencies = self.run(options['requests'])
+
+                self.stdout.write(
+                    f'{mode:<12} connections {len(connects):>6}  '
+                    f'mean {statistics.mean(latencies) * 1000:.3f} ms  '
+                    f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.3f} ms'
+                )
+        finally:
+            connection_created.disconnect(count)
+            connection.settings_dict['CONN_MAX_AGE'] = configured
+            connection.close()
+
+    def run(self, requests):
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            Account.objects.filter(pk=0).exists()
+            request_finished.send(sender=self.__class__)
+            latencies.append(time.perf_counter() - started)
+
+        return sorted(latencies)
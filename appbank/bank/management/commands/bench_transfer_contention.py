@@ -0,0 +1,120 @@
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+
+from bank.db import conflict_retries
+from bank.models import Account, BalanceSnapshot, LedgerEntry, Transfer
+from bank.services import fold_hot_credits
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent transfers between a few hot accounts and check that no update is lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=4, help='Number of hot accounts')
+        parser.add_argument('--transfers', type=int, default=500, help='Total number of transfers')
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent threads')
+        parser.add_argument('--amount', type=Decimal, default=Decimal('1.00'), help='Amount of every transfer')
+        parser.add_argument('--single-target', action='store_true',
+                            help='Every transfer pays the first account, like customers paying one merchant')
+        parser.add_argument('--hot', action='store_true',
+                            help='Flag the receiving accounts hot, so payments go to the pending sub-ledger')
+        parser.add_argument('--keep', action='store_true', help="Don't delete benchmark accounts")
+
+    def handle(self, *args, **options):
+        if options['accounts'] < 2:
+            raise CommandError('At least two accounts are needed')
+
+        initial = Decimal('1000000.00')
+        accounts = self.create_accounts(options['accounts'], initial)
+        pks = [account.pk for account in accounts]
+        amount = options['amount']
+        retries_before = conflict_retries()
+        if options['hot']:
+            Account.objects.filter(pk__in=pks[:1] if options['single_target'] else pks).update(is_hot=True)
+
+        def pick():
+            if options['single_target']:
+                return random.choice(pks[1:]), pks[0]
+            return random.sample(pks, 2)
+
+        def transfer(_):
+            from_pk, to_pk = pick()
+            started = time.perf_counter()
+            try:
+                Transfer.make_transfer(amount, Account(pk=from_pk), Account(pk=to_pk))
+                ok = True
+            except Exception:
+                ok = False
+            finally:
+                connection.close()
+
+            return ok, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = list(pool.map(transfer, range(options['transfers'])))
+        elapsed = time.perf_counter() - started
+        folded = fold_hot_credits() if options['hot'] else None
+
+        latencies = sorted(latency for _, latency in results)
+        done = sum(1 for ok, _ in results if ok)
+        expected = self.expected_balances(pks, initial)
+        lost = [
+            pk for pk, balance in Account.objects.filter(pk__in=pks).values_list('pk', 'balance')
+            if balance != expected[pk]
+        ]
+
+        self.stdout.write(f'transfers:    {done}/{len(results)} in {elapsed:.2f}s')
+        self.stdout.write(f'throughput:   {done / elapsed:.1f} transfers/s')
+        self.stdout.write(f'latency p50:  {statistics.median(latencies) * 1000:.1f} ms')
+        self.stdout.write(f'latency p95:  {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms')
+        self.stdout.write(f'retries:      {conflict_retries() - retries_before}')
+        if folded is not None:
+            self.stdout.write(f'fold:         {folded["rows"]} credits in {folded["seconds"] * 1000:.1f} ms')
+        self.stdout.write(f'lost updates: {len(lost)}')
+
+        if not options['keep']:
+            self.cleanup(accounts)
+
+        if lost:
+            raise CommandError(f'Balances of accounts {lost} do not match transfers')
+
+    def create_accounts(self, count, balance):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        users = [
+            get_user_model().objects.create_user(username=f'{prefix}-{i}', password=prefix)
+            for i in range(count)
+        ]
+        accounts = Account.objects.filter(user__in=users)
+        accounts.update(balance=balance)
+
+        return list(accounts)
+
+    def expected_balances(self, pks, initial):
+        expected = dict.fromkeys(pks, initial)
+        sent = Transfer.objects.filter(from_account__in=pks).values('from_account').annotate(total=Sum('amount'))
+        received = Transfer.objects.filter(to_account__in=pks).values('to_account').annotate(total=Sum('amount'))
+
+        for row in sent:
+            expected[row['from_account']] -= row['total']
+        for row in received:
+            expected[row['to_account']] += row['total']
+
+        return expected
+
+    def cleanup(self, accounts):
+        users = [account.user_id for account in accounts]
+        Transfer.objects.filter(from_account__in=accounts).delete()
+        LedgerEntry.objects.filter(posting__in=LedgerEntry.objects.filter(account__in=accounts).values('posting')).delete()
+        BalanceSnapshot.objects.filter(account__in=accounts).delete()
+        Account.objects.filter(pk__in=[account.pk for account in accounts]).delete()
+        get_user_model().objects.filter(pk__in=users).delete()
@@ -0,0 +1,115 @@
+import random
+import re
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from bank.models import *
+from bank.views import ActionViewSet, TransactionViewSet, TransferViewSet, DepositViewSet, CreditViewSet
+from bank.services import CREDIT_BATCH_SIZE, INTEREST_BATCH_SIZE
+from bank.statements import STATEMENT_LEDGER_KINDS
+
+# PostgreSQL "Seq Scan on bank_action", SQLite "SCAN bank_action" or
+# "SCAN TABLE bank_action" without an index
+SEQ_SCAN = re.compile(r'Seq Scan on (bank_\w+)|\bSCAN (?:TABLE )?(bank_\w+)\b(?! USING)')
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the API and batch job queries and fail on sequential scans of bank tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed this many rows per history table and roll them back at the end')
+        parser.add_argument('--accounts', type=int, default=1000, help='Accounts to spread seeded rows over')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'], options['accounts'])
+            failures = self.explain_all()
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError('Sequential scans in: ' + ', '.join(failures))
+        self.stdout.write(self.style.SUCCESS('No sequential scans'))
+
+    def queries(self, account_id):
+        """The querysets behind the API list endpoints and the batch jobs"""
+        now = timezone.now()
+        for name, viewset in (
+            ('action', ActionViewSet),
+            ('transaction', TransactionViewSet),
+            ('transfer', TransferViewSet),
+            ('deposit', DepositViewSet),
+            ('credit', CreditViewSet),
+        ):
+            view = viewset()
+            view._account_id = account_id
+            queryset = view.get_queryset()
+            yield f'{name} list', queryset[:3]
+            if name in ('action', 'transaction', 'transfer'):
+                yield f'{name} cursor page', queryset.order_by('-date', '-id')[:4]
+
+        for queryset in (
+            Transfer.objects.filter(to_account_id=account_id),
+            Action.objects.filter(account_id=account_id),
+            LedgerEntry.objects.filter(account_id=account_id, kind__in=STATEMENT_LEDGER_KINDS),
+        ):
+            yield f'statement {queryset.model._meta.model_name}', queryset.filter(
+                date__gte=now
+            ).order_by('date', 'id')
+
+        yield 'ledger balance delta', LedgerEntry.objects.filter(account_id=account_id, id__gt=0).values('amount')
+        yield 'make_interest batch', Deposit.objects.filter(
+            next_due_at__lte=now, pk__gt=0
+        ).order_by('pk')[:INTEREST_BATCH_SIZE]
+        yield 'credit_payment batch', Credit.objects.filter(
+            amount__gt=0, next_due_at__lte=now, pk__gt=0
+        ).order_by('pk')[:CREDIT_BATCH_SIZE]
+
+    def explain_all(self):
+        account_id = Account.objects.order_by('pk').values_list('pk', flat=True).first() or 0
+        failures = []
+
+        for name, queryset in self.queries(account_id):
+            plan = queryset.explain()
+            scans = {table for match in SEQ_SCAN.finditer(plan) for table in match.groups() if table}
+            if scans:
+                failures.append(name)
+            self.stdout.write(f'{name}: {"SEQ SCAN " + ", ".join(sorted(scans)) if scans else "ok"}')
+            if self.verbosity > 1:
+                self.stdout.write(plan)
+
+        return failures
+
+    def seed(self, rows, accounts):
+        prefix = f'explain-{random.randrange(10 ** 9)}'
+        get_user_model().objects.bulk_create(
+            get_user_model()(username=f'{prefix}-{i}') for i in range(accounts)
+        )
+        users = get_user_model().objects.filter(username__startswith=prefix)
+        Account.objects.bulk_create(Account(user=user, balance=Decimal('1000.00')) for user in users)
+        ids = list(Account.objects.filter(user__in=users).values_list('pk', flat=True))
+
+        def account():
+            return random.choice(ids)
+
+        amount = Decimal('10.00')
+        for model, make in (
+            (Action, lambda: Action(account_id=account(), amount=amount)),
+            (Transaction, lambda: Transaction(account_id=account(), amount=amount, merchant='shop')),
+            (Transfer, lambda: Transfer(from_account_id=account(), to_account_id=account(), amount=amount)),
+            (Deposit, lambda: Deposit(account_id=account(), amount=amount)),
+            (Credit, lambda: Credit(account_id=account(), amount=random.choice((0, amount)), total_amount=amount)),
+            (LedgerEntry, lambda: LedgerEntry(posting=uuid.uuid4(), kind='seed', book=LedgerEntry.ACCOUNT,
+                                              account_id=account(), amount=amount)),
+        ):
+            model.objects.bulk_create((make() for _ in range(rows)), batch_size=5000)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q, Sum
+
+from bank import jobs, services  # noqa: F401 registers the job steps
+from bank.locks import acquire_lease, release_lease
+from bank.models import JobRun
+
+
+class Command(BaseCommand):
+    help = 'List, inspect and resume checkpointed batch job runs'
+
+    def add_arguments(self, parser):
+        commands = parser.add_subparsers(dest='command', required=True)
+
+        runs = commands.add_parser('list', help='Latest runs with their progress')
+        runs.add_argument('--job', help='Only runs of this job')
+        runs.add_argument('--status', choices=[status for status, _ in JobRun.STATUS_CHOICES])
+        runs.add_argument('--limit', type=int, default=20)
+
+        show = commands.add_parser('show', help='A run and the checkpoints of its ranges')
+        show.add_argument('run', type=int)
+
+        resume = commands.add_parser('resume', help='Finish a run from its checkpoints')
+        resume.add_argument('run', type=int, nargs='?')
+        resume.add_argument('--all', action='store_true', help='Resume every run that is not done')
+
+    def handle(self, *args, **options):
+        getattr(self, f'handle_{options["command"]}')(options)
+
+    def runs(self):
+        return JobRun.objects.annotate(
+            rows=Sum('checkpoints__rows'),
+            ranges=Count('checkpoints'),
+            done_ranges=Count('checkpoints', filter=Q(checkpoints__done=True)),
+        )
+
+    def get_run(self, pk):
+        try:
+            return self.runs().get(pk=pk)
+        except JobRun.DoesNotExist:
+            raise CommandError(f'No run {pk}')
+
+    def describe(self, run):
+        return (f'{run.pk:>6}  {run.job:<16} {run.period.isoformat()}  {run.status:<8} '
+                f'{run.rows or 0:>9} rows  {run.done_ranges}/{run.ranges} ranges')
+
+    def handle_list(self, options):
+        runs = self.runs().order_by('-started_at', '-pk')
+        if options['job']:
+            runs = runs.filter(job=options['job'])
+        if options['status']:
+            runs = runs.filter(status=options['status'])
+
+        for run in runs[:options['limit']]:
+            self.stdout.write(self.describe(run))
+
+    def handle_show(self, options):
+        run = self.get_run(options['run'])
+        self.stdout.write(self.describe(run))
+        self.stdout.write(f'started:  {run.started_at.isoformat()}')
+        self.stdout.write(f'finished: {run.finished_at.isoformat() if run.finished_at else "-"}')
+        if run.error:
+            self.stdout.write(f'error:    {run.error}')
+
+        for checkpoint in run.checkpoints.order_by('pk'):
+            pk_range = f'[{checkpoint.lo}, {checkpoint.hi})' if checkpoint.pk_range else 'all'
+            self.stdout.write(
+                f'  {pk_range:<24} after {checkpoint.last_pk:<10} {checkpoint.rows:>9} rows '
+                f'{checkpoint.batches:>6} batches  {"done" if checkpoint.done else "open"}'
+            )
+
+    def handle_resume(self, options):
+        if options['all']:
+            runs = list(JobRun.objects.exclude(status=JobRun.DONE).order_by('period', 'pk'))
+        elif options['run'] is not None:
+            runs = [self.get_run(options['run'])]
+        else:
+            raise CommandError('Give a run or --all')
+
+        for run in runs:
+            if run.status == JobRun.DONE:
+                self.stdout.write(f'Run {run.pk} is done')
+                continue
+            if run.job not in jobs.STEPS:
+                raise CommandError(f'Unknown job {run.job}')
+
+            # a tick of the same job must not run next to the resumed run
+            token = acquire_lease(run.job, settings.BANK_JOB_LEASE_SECONDS)
+            if token is None:
+                raise CommandError(f'{run.job} is running, try again later')
+            try:
+                rows = jobs.resume(run)
+            finally:
+                release_lease(run.job, token)
+
+            self.stdout.write(f'Run {run.pk} resumed: {rows} rows')
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from bank.models import Account
+
+
+class Command(BaseCommand):
+    help = ('Open many concurrent keep-alive connections against running servers and compare '
+            'throughput and latency, e.g. runserver (WSGI) against uvicorn appbank.asgi (ASGI)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='label=base url, e.g. wsgi=http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Request path, may be repeated (default: async and sync history endpoints)')
+        parser.add_argument('--connections', type=int, default=1000, help='Concurrent connections')
+        parser.add_argument('--requests', type=int, default=10, help='Requests per connection')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Timeout of one request in seconds')
+        parser.add_argument('--token', help='Auth token, a throwaway user is created when omitted')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            label, _, url = target.rpartition('=')
+            parts = urlsplit(url)
+            if parts.scheme != 'http' or not parts.hostname:
+                raise CommandError(f'{target}: only http://host[:port] urls are supported')
+            targets.append((label or url, parts.hostname, parts.port or 80))
+
+        token, user = options['token'], None
+        if token is None:
+            user = get_user_model().objects.create_user(username=f'loadtest-{uuid.uuid4().hex[:8]}')
+            token = Token.objects.create(user=user).key
+
+        results = []
+        try:
+            for label, host, port in targets:
+                for path in options['paths'] or self.default_paths(user):
+                    result = asyncio.run(self.run(host, port, path, token, options))
+                    results.append({'target': label, 'path': path, **result})
+        finally:
+            if user is not None:
+                Account.objects.filter(user=user).delete()
+                user.delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            self.stdout.write(
+                f"{result['target']:<8} {result['path']:<28} {result['ok']:>7}/{result['requests']:<7} "
+                f"{result['rps']:>9.1f} req/s  p50 {result['p50_ms']:>8.1f} ms  "
+                f"p99 {result['p99_ms']:>8.1f} ms  errors {result['errors']}"
+            )
+
+    def default_paths(self, user):
+        paths = ['/api/bank/async/action/', '/api/bank/action/']
+        if user is not None:
+            pk = Account.objects.get(user=user).pk
+            paths += [f'/api/bank/async/account/{pk}/', f'/api/bank/account/{pk}/']
+        return paths
+
+    async def run(self, host, port, path, token, options):
+        request = (
+            f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n'
+            f'Authorization: Token {token}\r\nAccept: application/json\r\n\r\n'
+        ).encode()
+        latencies = []
+        errors = []
+
+        async def client():
+            reader = writer = None
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    writer.write(request)
+                    status, keep_alive = await asyncio.wait_for(self.read_response(reader), options['timeout'])
+                    if status != 200:
+                        errors.append(f'HTTP {status}')
+                        continue
+                    latencies.append(time.perf_counter() - started)
+                    if not keep_alive:
+                        writer.close()
+                        reader, writer = await asyncio.open_connection(host, port)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                errors.append(type(e).__name__)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['connections'])))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        percentile = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 if latencies else 0.0
+
+        return {
+            'connections': options['connections'],
+            'requests': options['connections'] * options['requests'],
+            'ok': len(latencies),
+            'errors': len(errors),
+            'error_kinds': sorted(set(errors)),
+            'seconds': elapsed,
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+        }
+
+    async def read_response(self, reader):
+        """Read one HTTP/1.1 response, return status and keep-alive flag"""
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await reader.read()
+            return status, False
+
+        return status, headers.get('connection', '').lower() != 'close'
@@ -0,0 +1,95 @@
+import json
+import platform
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from bank.benchmarks import fixtures
+from bank.benchmarks.cases import CASES, Context
+from bank.benchmarks.runner import compare, measure
+
+
+class Command(BaseCommand):
+    help = ('Benchmark model operations, API actions and batch jobs on a seeded dataset and write '
+            'latency percentiles, throughput and query counts as JSON. Writes to the configured '
+            'database, use a dedicated one')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=10000,
+                            help='Accounts to seed, e.g. 1000000 for the full-size dataset')
+        parser.add_argument('--history', type=int, default=100000,
+                            help='History rows to seed, e.g. 10000000 for the full-size dataset')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of dataset and cases')
+        parser.add_argument('--reseed', action='store_true', help='Drop a seeded dataset and seed again')
+        parser.add_argument('--drop', action='store_true', help='Drop the seeded dataset and exit')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed runs of model and API cases')
+        parser.add_argument('--job-iterations', type=int, default=1, help='Timed runs of batch jobs')
+        parser.add_argument('--only', action='append', default=[],
+                            help='Run cases whose group or name contains this, may be repeated')
+        parser.add_argument('--output', default='benchmark-results.json', help='JSON file with the results')
+        parser.add_argument('--baseline', help='JSON file of a previous run to compare with')
+
+    def handle(self, *args, **options):
+        if options['drop'] or options['reseed']:
+            fixtures.drop()
+            if options['drop']:
+                return
+
+        dataset = fixtures.load()
+        if dataset is None:
+            dataset = fixtures.seed(
+                accounts=options['accounts'],
+                history=options['history'],
+                seed=options['seed'],
+                log=lambda message: self.stdout.write(message),
+            )
+        if len(dataset.pool) < 2:
+            raise CommandError('At least two accounts are needed')
+
+        ctx = Context(dataset, seed=options['seed'])
+        results = []
+        for group, name, factory in CASES:
+            if options['only'] and not any(part in group or part in name for part in options['only']):
+                continue
+
+            iterations = options['job_iterations'] if group == 'job' else options['iterations']
+            result = measure(group, name, *factory(ctx), iterations=iterations, warmup=0 if group == 'job' else 1)
+            results.append(result)
+            self.stdout.write(
+                f"{group:<6} {name:<24} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                f"p99 {result['p99_ms']:>9.2f} ms  {result['ops_per_second']:>8.1f} op/s  "
+                f"{result['queries_per_op']:>6.1f} queries  errors {result['errors']}"
+            )
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'commit': self.commit(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'dataset': dataset.describe(),
+            'iterations': options['iterations'],
+            'job_iterations': options['job_iterations'],
+            'results': results,
+        }
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                report['changes'] = compare(results, json.load(f))
+            for change in report['changes']:
+                self.stdout.write(
+                    f"{change['group']:<6} {change['name']:<24} p50 {change['p50_change']:+.1%}  "
+                    f"queries {change['queries_change']:+.1f}"
+                )
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
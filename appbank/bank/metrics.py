@@ -0,0 +1,56 @@
+"""Per-view request metrics in the Prometheus text format.
+   With PROMETHEUS_MULTIPROC_DIR set every worker process writes its
+   samples there and /metrics adds up all of them"""
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client import CONTENT_TYPE_LATEST
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+REQUEST_LATENCY = Histogram(
+    'bank_request_duration_seconds', 'Request latency', ['view', 'method'], buckets=LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    'bank_request_db_queries', 'Database queries of a request', ['view', 'method'], buckets=QUERY_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    'bank_request_db_duration_seconds', 'Time a request spent in database queries', ['view', 'method'],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSES = Counter('bank_responses', 'Responses by status code', ['view', 'method', 'status'])
+BUDGET_EXCEEDED = Counter(
+    'bank_request_budget_exceeded', 'Requests over the query or time budget', ['view', 'method', 'budget']
+)
+
+
+def observe(view, method, status, seconds, queries, db_seconds):
+    REQUEST_LATENCY.labels(view, method).observe(seconds)
+    REQUEST_QUERIES.labels(view, method).observe(queries)
+    REQUEST_DB_TIME.labels(view, method).observe(db_seconds)
+    RESPONSES.labels(view, method, status).inc()
+
+
+def exceeded(view, method, budget):
+    BUDGET_EXCEEDED.labels(view, method, budget).inc()
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, protected by METRICS_TOKEN. Without a
+       token it is only served in DEBUG"""
+    token = settings.BANK_METRICS['TOKEN']
+    if not token and not settings.DEBUG:
+        return HttpResponseForbidden()
+    if token and request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+        return HttpResponseForbidden()
+
+    registry = REGISTRY
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
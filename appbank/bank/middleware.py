@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from . import metrics
+from .redis_client import get_redis
+from .routers import has_replica, set_replica_reads
+
+
+logger = logging.getLogger(__name__)
+
+READ_ACTIONS = ('list', 'retrieve')
+READ_VIEW_NAMES = ('admin:bank_account_changelist',)
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _pin_key(credential):
+    return 'bank:pin-primary:' + hashlib.sha256(credential.encode()).hexdigest()
+
+
+def _client_key(request):
+    """Token or session of the client, users of token authentication are
+       not known before the view runs"""
+    credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return _pin_key(credential)
+
+
+def _issued_keys(response):
+    """Token or session a login or registration has just given the client,
+       its next requests send them"""
+    keys = []
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and isinstance(data.get('key'), str):
+        keys.append(_pin_key('Token ' + data['key']))
+    session = response.cookies.get(settings.SESSION_COOKIE_NAME)
+    if session is not None and session.value:
+        keys.append(_pin_key(session.value))
+    return keys
+
+
+def pin_to_primary(request, response=None):
+    """Pin the client of a write, with the response also the credential
+       issued to it"""
+    keys = [_client_key(request)] + (_issued_keys(response) if response is not None else [])
+    keys = [key for key in keys if key is not None]
+    if not keys:
+        return
+    try:
+        for key in keys:
+            get_redis().set(key, 1, ex=settings.BANK_REPLICA_PIN_SECONDS)
+    except RedisError:
+        logger.warning('Could not pin client to the primary database', exc_info=True)
+
+
+def is_pinned(request):
+    key = _client_key(request)
+    if key is None:
+        return False
+    try:
+        return bool(get_redis().exists(key))
+    except RedisError:
+        # reading stale data is worse than loading the primary
+        return True
+
+
+def is_read_view(request, view_func):
+    actions = getattr(view_func, 'actions', None)
+    if actions is not None:
+        return actions.get(request.method.lower()) in READ_ACTIONS
+
+    match = request.resolver_match
+    return match is not None and match.view_name in READ_VIEW_NAMES
+
+
+class ReplicaRoutingMiddleware:
+    """Send reads of list and retrieve actions and the admin account list
+       to the replica. A client that has just written is pinned to the
+       primary for BANK_REPLICA_PIN_SECONDS, so it reads its own writes
+       while the replica catches up"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # under ASGI the handler awaits the middleware and its view hook
+            # instead of running them in the one thread of sync code
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not has_replica():
+            return self.get_response(request)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            set_replica_reads(False)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(request, response)
+
+        return response
+
+    async def __acall__(self, request):
+        if not has_replica():
+            return await self.get_response(request)
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            set_replica_reads(False)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            await sync_to_async(pin_to_primary, thread_sensitive=False)(request, response)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if has_replica() and request.method in SAFE_METHODS and is_read_view(request, view_func):
+            set_replica_reads(not is_pinned(request))
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if has_replica() and request.method in SAFE_METHODS and is_read_view(request, view_func):
+            pinned = await sync_to_async(is_pinned, thread_sensitive=False)(request)
+            set_replica_reads(not pinned)
+
+
+class QueryStats:
+    """Number of queries and the time spent in them. Async views run their
+       queries in pool threads, so the counts are updated under a lock"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self.count += 1
+                self.seconds += seconds
+
+
+_query_stats = ContextVar('bank_query_stats', default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    """execute_wrapper of every connection, adds the query to the stats of
+       the current request. The context is copied into the threads that
+       run sync code, so queries of sync_to_async calls are counted too"""
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    """connection_created receiver, connections of every thread get the
+       wrapper when they connect"""
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+class MetricsMiddleware:
+    """Latency, query count and database time of every request by view,
+       exported on /metrics. Requests over BANK_METRICS budgets are
+       logged with a warning"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if request.path == settings.BANK_METRICS['PATH']:
+            return self.get_response(request)
+
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self.observe(request, response, time.perf_counter() - started, stats)
+
+        return response
+
+    async def __acall__(self, request):
+        if request.path == settings.BANK_METRICS['PATH']:
+            return await self.get_response(request)
+
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self.observe(request, response, time.perf_counter() - started, stats)
+
+        return response
+
+    def observe(self, request, response, seconds, stats):
+        # unmatched paths share one label, so scanners can't add series
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        metrics.observe(view, request.method, response.status_code, seconds, stats.count, stats.seconds)
+        self.check_budget(view, request.method, seconds, stats)
+
+    def check_budget(self, view, method, seconds, stats):
+        budget = settings.BANK_METRICS
+        over = []
+        if budget['QUERY_BUDGET'] is not None and stats.count > budget['QUERY_BUDGET']:
+            over.append('queries')
+        if budget['TIME_BUDGET'] is not None and seconds > budget['TIME_BUDGET']:
+            over.append('time')
+
+        for kind in over:
+            metrics.exceeded(view, method, kind)
+        if over:
+            logger.warning(
+                '%s %s over budget: %.3fs (budget %ss), %d queries in %.3fs (budget %s)',
+                method, view, seconds, budget['TIME_BUDGET'], stats.count, stats.seconds, budget['QUERY_BUDGET'],
+            )
@@ -0,0 +1,55 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:02
+
+import uuid
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def post_opening_balances(apps, schema_editor):
+    """Existing balances become opening postings of the ledger"""
+    Account = apps.get_model('bank', 'Account')
+    LedgerEntry = apps.get_model('bank', 'LedgerEntry')
+
+    entries = []
+    for account_id, balance in Account.objects.exclude(balance=0).values_list('pk', 'balance').iterator():
+        posting = uuid.uuid4()
+        entries.append(LedgerEntry(posting=posting, kind='opening', book='account', account_id=account_id, amount=balance))
+        entries.append(LedgerEntry(posting=posting, kind='opening', book='cash', amount=-balance))
+    LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, primary_key=True, serialize=False, to='bank.account')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_entry_id', models.BigIntegerField(db_index=True)),
+                ('date', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posting', models.UUIDField(db_index=True)),
+                ('kind', models.CharField(max_length=32)),
+                ('book', models.CharField(choices=[('account', 'Customer account'), ('cash', 'Cash'), ('merchant', 'Merchants'), ('deposit', 'Deposits'), ('credit', 'Credits')], max_length=16)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='bank.account')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['account', 'id'], name='bank_ledger_account_cbaa63_idx'),
+        ),
+        migrations.RunPython(post_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0002_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='action',
+            index=models.Index(fields=['account', '-date', '-id'], name='bank_action_account_3ac54c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', '-date', '-id'], name='bank_transa_account_85bc05_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['from_account', '-date', '-id'], name='bank_transf_from_ac_3fc4c0_idx'),
+        ),
+    ]
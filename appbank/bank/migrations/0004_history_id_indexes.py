@@ -0,0 +1,37 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0003_history_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='action',
+            index=models.Index(fields=['account', '-id'], name='bank_action_account_8a7dbf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(fields=['account', '-id'], name='bank_credit_account_cc1936_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(condition=models.Q(amount__gt=0), fields=['id'], name='bank_credit_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(fields=['account', '-id'], name='bank_deposi_account_7ee1c1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', '-id'], name='bank_transa_account_0f4295_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['from_account', '-id'], name='bank_transf_from_ac_0723bb_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0004_history_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['to_account', '-date', '-id'], name='bank_transf_to_acco_460bbc_idx'),
+        ),
+    ]
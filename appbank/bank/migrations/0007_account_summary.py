@@ -0,0 +1,94 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:32
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+import django.db.models.deletion
+
+
+WINDOW_DAYS = 30
+
+
+def fill_summaries(apps, schema_editor):
+    """Summaries and activity buckets of the existing accounts"""
+    Account = apps.get_model('bank', 'Account')
+    AccountSummary = apps.get_model('bank', 'AccountSummary')
+    AccountActivityDay = apps.get_model('bank', 'AccountActivityDay')
+
+    def totals(model_name, field):
+        rows = apps.get_model('bank', model_name).objects.values('account').annotate(total=Sum(field))
+        return {row['account']: row['total'] for row in rows}
+
+    deposits = totals('Deposit', 'amount')
+    credits = totals('Credit', 'amount')
+
+    since = timezone.localdate() - timedelta(days=WINDOW_DAYS - 1)
+    days = Counter()
+    for model_name, account_fields in (
+        ('Action', ('account',)),
+        ('Transaction', ('account',)),
+        ('Transfer', ('from_account', 'to_account')),
+    ):
+        model = apps.get_model('bank', model_name)
+        for account_field in account_fields:
+            rows = (
+                model.objects.annotate(day=TruncDate('date')).filter(day__gte=since)
+                .values(account_field, 'day').annotate(movements=Count('id'))
+            )
+            for row in rows:
+                days[row[account_field], row['day']] += row['movements']
+
+    AccountActivityDay.objects.bulk_create(
+        (AccountActivityDay(account_id=account_id, day=day, movements=movements)
+         for (account_id, day), movements in days.items()),
+        batch_size=1000,
+    )
+    counts = Counter()
+    for (account_id, _), movements in days.items():
+        counts[account_id] += movements
+
+    AccountSummary.objects.bulk_create(
+        (AccountSummary(
+            account_id=account_id,
+            deposit_total=deposits.get(account_id, 0),
+            credit_outstanding=credits.get(account_id, 0),
+            tx_count_30d=counts[account_id],
+        ) for account_id in Account.objects.values_list('pk', flat=True).iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0006_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountSummary',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='bank.account')),
+                ('deposit_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('credit_outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tx_count_30d', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AccountActivityDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('movements', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bank.account')),
+            ],
+            options={
+                'unique_together': {('account', 'day')},
+            },
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
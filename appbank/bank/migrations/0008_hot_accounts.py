@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0007_account_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='is_hot',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='HotCredit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bank.account')),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:48
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+
+
+def create_default_products(apps, schema_editor):
+    """The terms that used to be hard-coded, as editable default products"""
+    Product = apps.get_model('bank', 'Product')
+    Product.objects.bulk_create([
+        Product(kind='deposit', name='Deposit', is_default=True, annual_rate=Decimal('0.05'), periods_per_year=12),
+        Product(kind='credit', name='Credit', is_default=True, markup=Decimal('0.1'), repayment_share=Decimal('0.1')),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0008_hot_accounts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('deposit', 'Deposit'), ('credit', 'Credit')], max_length=16)),
+                ('name', models.CharField(max_length=255)),
+                ('is_default', models.BooleanField(default=False)),
+                ('annual_rate', models.DecimalField(decimal_places=6, default=0, max_digits=8)),
+                ('periods_per_year', models.PositiveSmallIntegerField(default=12)),
+                ('markup', models.DecimalField(decimal_places=6, default=0, max_digits=8)),
+                ('repayment_share', models.DecimalField(decimal_places=6, default=0, max_digits=8)),
+                ('interval', models.DurationField(default=datetime.timedelta(seconds=60))),
+            ],
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='next_due_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='deposit',
+            name='next_due_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(condition=models.Q(amount__gt=0), fields=['next_due_at'], name='bank_credit_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(condition=models.Q(is_default=True), fields=('kind',), name='bank_product_one_default'),
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='bank.product'),
+        ),
+        migrations.AddField(
+            model_name='deposit',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='bank.product'),
+        ),
+        migrations.RunPython(create_default_products, migrations.RunPython.noop),
+    ]
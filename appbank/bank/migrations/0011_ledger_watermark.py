@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0010_job_runs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_entry_id', models.BigIntegerField(default=0)),
+                ('date', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -2,8 +2,19 @@ from django.db import models, transaction
 from django.conf import settings
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from fractions import Fraction
+
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.utils import timezone
 from django.db.models.signals import post_save
 
+from . import calculations
+from .db import retry_on_conflict
+from .signals import balances_changed, balances_invalidated
+
 
 class Account(models.Model):
     """User's account for checking balance"""
@@ -14,16 +25,46 @@ class Account(models.Model):
     )
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
+    # Incoming transfers of a hot account are written to HotCredit instead
+    # of its row, for merchant and payout accounts that many customers pay
+    is_hot = models.BooleanField(default=False)
 
     def __str__(self) -> str:
         return f'{self.user.username} id - {self.id}'
 
+    def settle(self):
+        """Lock the account and re-read its balance, folding the pending
+           credits of a hot account into it, so the change that follows is
+           checked against the exact total and no concurrent F() delta of a
+           transfer is overwritten. Must be called inside a transaction"""
+        locked = Account.objects.select_for_update().only('pk', 'balance', 'is_hot').get(pk=self.pk)
+        if locked.is_hot:
+            HotCredit.fold([locked])
+        self.balance = locked.balance
+        self.is_hot = locked.is_hot
+
+    def ledger_balance(self, using=None):
+        """Balance from the latest snapshot plus ledger entries after it"""
+        snapshot = BalanceSnapshot.objects.using(using).filter(account=self).first()
+        balance, last_entry_id = (snapshot.balance, snapshot.last_entry_id) if snapshot else (0, 0)
+        delta = LedgerEntry.objects.using(using).filter(
+            account=self, id__gt=last_entry_id
+        ).aggregate(total=Sum('amount'))['total']
+
+        return balance + (delta or 0)
+
 @receiver(post_save, sender=User)
 def create_user_account(sender, instance, created, **kwargs):
     """Create account after registration"""
     if created:
         Account.objects.create(user=instance)
 
+@receiver(post_save, sender=Account)
+def create_account_summary(sender, instance, created, **kwargs):
+    """Every account has a summary row, so summaries are only updated"""
+    if created:
+        AccountSummary.objects.create(account=instance)
+
 class Profile(models.Model):
     """User's customizable profile"""
     first_name = models.CharField(max_length=255, blank=True)
@@ -48,6 +89,12 @@ class Action(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-date', '-id']),
+            models.Index(fields=['account', '-id']),
+        ]
+
     def __str__(self) -> str:
         return f'[{self.pk}] Account id {self.account.pk} ' +\
             f'was changed on {str(self.amount)}'
@@ -55,12 +102,20 @@ class Action(models.Model):
     @classmethod
     def make_action(cls, amount, account):
         """Making action logic"""
-        if account.balance + amount < 0:
-            raise(ValueError('Not enough money'))
+        with transaction.atomic():
+            account.settle()
+            if account.balance + amount < 0:
+                raise(ValueError('Not enough money'))
 
-        account.balance += amount
-        account.save()
-        action = cls.objects.create(amount=amount, account=account)
+            account.balance += amount
+            account.save(update_fields=['balance'])
+            action = cls.objects.create(amount=amount, account=account)
+            LedgerEntry.post(
+                'action',
+                (LedgerEntry.ACCOUNT, account, amount),
+                (LedgerEntry.CASH, None, -amount),
+            )
+            AccountSummary.record(movements={account.pk: 1})
 
         return account, action
 
@@ -72,6 +127,12 @@ class Transaction(models.Model):
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
     merchant = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-date', '-id']),
+            models.Index(fields=['account', '-id']),
+        ]
+
     def __str__(self) -> str:
         return f'[{self.pk}] Account number {self.account.pk} ' +\
             f'sent {str(self.amount)} to {self.merchant}'
@@ -82,12 +143,20 @@ class Transaction(models.Model):
         if amount < 0:
             raise(ValueError("Amount can't be negative"))
 
-        if account.balance < amount:
-            raise(ValueError("Not enough money"))
+        with transaction.atomic():
+            account.settle()
+            if account.balance < amount:
+                raise(ValueError("Not enough money"))
 
-        account.balance -= amount
-        account.save()
-        tran = cls.objects.create(amount=amount, account=account, merchant=merchant)
+            account.balance -= amount
+            account.save(update_fields=['balance'])
+            tran = cls.objects.create(amount=amount, account=account, merchant=merchant)
+            LedgerEntry.post(
+                'transaction',
+                (LedgerEntry.ACCOUNT, account, -amount),
+                (LedgerEntry.MERCHANT, None, amount),
+            )
+            AccountSummary.record(movements={account.pk: 1})
 
         return tran
 
@@ -98,54 +167,265 @@ class Transfer(models.Model):
     from_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='from_account')
     to_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='to_account')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_account', '-date', '-id']),
+            models.Index(fields=['from_account', '-id']),
+            models.Index(fields=['to_account', '-date', '-id']),
+        ]
+
     def __str__(self) -> str:
         return f'[{self.pk}] Account number {self.from_account.pk} ' +\
             f'sent {str(self.amount)} to {self.to_account.pk}'
 
     
     @classmethod
+    @retry_on_conflict()
     def make_transfer(cls, amount, from_account, to_account):
-        """Making transfer logic"""
+        """Making transfer logic.
+           Both accounts are locked in primary key order, so two opposite
+           transfers can't deadlock, and balances change by F() deltas.
+           A hot recipient is not locked, it gets a HotCredit row instead"""
         if amount < 0:
             raise(ValueError("Amount can't be negative"))
 
         if from_account == to_account:
             raise(ValueError('Chose another account'))
 
-        if from_account.balance < amount:
-            raise(ValueError("Not enough money"))
-
         with transaction.atomic():
-            from_account.balance -= amount
-            to_account.balance += amount
-            from_account.save()
-            to_account.save()
+            locked = Account.objects.select_for_update().filter(
+                Q(pk=from_account.pk) | Q(pk=to_account.pk, is_hot=False)
+            ).order_by('pk').only('pk', 'balance', 'is_hot')
+            locked = {account.pk: account for account in locked}
+            sender = locked[from_account.pk]
+            if sender.is_hot:
+                HotCredit.fold([sender])
+
+            if sender.balance < amount:
+                raise(ValueError("Not enough money"))
+
+            Account.objects.filter(pk=from_account.pk).update(balance=F('balance') - amount)
+            if to_account.pk in locked:
+                Account.objects.filter(pk=to_account.pk).update(balance=F('balance') + amount)
+            else:
+                HotCredit.objects.create(account=to_account, amount=amount)
             transf = cls.objects.create(amount=amount, from_account=from_account, to_account=to_account)
+            LedgerEntry.post(
+                'transfer',
+                (LedgerEntry.ACCOUNT, from_account, -amount),
+                (LedgerEntry.ACCOUNT, to_account, amount),
+            )
+
+            from_account.balance = sender.balance - amount
+            balances = {from_account.pk: from_account.balance}
+            movements = {from_account.pk: 1}
+            if to_account.pk in locked:
+                to_account.balance = locked[to_account.pk].balance + amount
+                balances[to_account.pk] = to_account.balance
+                movements[to_account.pk] = 1
+            else:
+                balances_invalidated.send(cls, account_ids=[to_account.pk])
+            balances_changed.send(cls, balances=balances)
+            AccountSummary.record(movements=movements)
 
         return transf
 
+    @classmethod
+    @retry_on_conflict()
+    def make_batch_transfer(cls, items, from_account, partial=False):
+        """Many (to_account id, amount) transfers from one account.
+           Recipients are checked and locked with one query and the batch is
+           written with bulk statements in one transaction. Without partial
+           any bad item fails the whole batch, with partial bad items are
+           skipped and returned as {index: error}. Hot recipients are not
+           locked, they get HotCredit rows"""
+        errors = {}
+        recipients = {to_account for to_account, _ in items}
+
+        with transaction.atomic():
+            locked = Account.objects.select_for_update().filter(
+                Q(pk=from_account.pk) | Q(pk__in=recipients, is_hot=False)
+            ).order_by('pk').only('pk', 'balance', 'is_hot')
+            locked = {account.pk: account for account in locked}
+            sender = locked[from_account.pk]
+            if sender.is_hot:
+                HotCredit.fold([sender])
+            missing = recipients - locked.keys()
+            hot = Account.objects.filter(pk__in=missing, is_hot=True).only('pk').in_bulk() if missing else {}
+            accepted = []
+
+            for index, (to_account, amount) in enumerate(items):
+                if amount < 0:
+                    error = "Amount can't be negative"
+                elif to_account == from_account.pk:
+                    error = 'Chose another account'
+                elif to_account not in locked and to_account not in hot:
+                    error = 'No such account'
+                elif sender.balance < amount:
+                    error = 'Not enough money'
+                else:
+                    sender.balance -= amount
+                    if to_account in hot:
+                        accepted.append((index, hot[to_account], amount))
+                        continue
+                    locked[to_account].balance += amount
+                    accepted.append((index, locked[to_account], amount))
+                    continue
+
+                if not partial:
+                    raise(ValueError(f'Item {index}: {error}'))
+                errors[index] = error
+
+            transfers = cls.objects.bulk_create(
+                cls(amount=amount, from_account=sender, to_account=to_account)
+                for _, to_account, amount in accepted
+            )
+            if transfers and transfers[0].pk is None:
+                # only PostgreSQL returns the keys of a bulk insert, the sender
+                # is locked so its newest transfers are the ones just inserted
+                pks = cls.objects.filter(from_account=sender).order_by('-pk').values_list('pk', flat=True)
+                for transfer, pk in zip(transfers, reversed(list(pks[:len(transfers)]))):
+                    transfer.pk = pk
+            changed = [sender] + list({
+                to_account.pk: to_account for _, to_account, _ in accepted if to_account.pk in locked
+            }.values())
+            Account.objects.bulk_update(changed, ['balance'])
+            balances_changed.send(cls, balances={account.pk: account.balance for account in changed})
+            HotCredit.objects.bulk_create(
+                HotCredit(account=to_account, amount=amount)
+                for _, to_account, amount in accepted if to_account.pk in hot
+            )
+            credited_hot = {to_account.pk for _, to_account, _ in accepted if to_account.pk in hot}
+            if credited_hot:
+                balances_invalidated.send(cls, account_ids=list(credited_hot))
+            LedgerEntry.post_many('transfer', [
+                ((LedgerEntry.ACCOUNT, sender, -amount), (LedgerEntry.ACCOUNT, to_account, amount))
+                for _, to_account, amount in accepted
+            ])
+            movements = {sender.pk: len(accepted)}
+            for _, to_account, _ in accepted:
+                if to_account.pk in locked:
+                    movements[to_account.pk] = movements.get(to_account.pk, 0) + 1
+            if accepted:
+                AccountSummary.record(movements=movements)
+
+        from_account.balance = sender.balance
+
+        return dict(zip((index for index, _, _ in accepted), transfers)), errors
+
+
+class Product(models.Model):
+    """Terms of deposits or credits. Deposits and credits without a
+       product get the default product of their kind, or DEFAULT_TERMS
+       when there is none"""
+    DEPOSIT = 'deposit'
+    CREDIT = 'credit'
+    KIND_CHOICES = (
+        (DEPOSIT, 'Deposit'),
+        (CREDIT, 'Credit'),
+    )
+    DEFAULT_TERMS = {
+        DEPOSIT: {'name': 'Deposit', 'annual_rate': Decimal('0.05'), 'periods_per_year': 12},
+        CREDIT: {'name': 'Credit', 'markup': Decimal('0.1'), 'repayment_share': Decimal('0.1')},
+    }
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    name = models.CharField(max_length=255)
+    is_default = models.BooleanField(default=False)
+    # Deposits get annual_rate / periods_per_year every interval
+    annual_rate = models.DecimalField(max_digits=8, decimal_places=6, default=0)
+    periods_per_year = models.PositiveSmallIntegerField(default=12)
+    # A credit of amount owes amount * (1 + markup) and pays
+    # repayment_share of that every interval
+    markup = models.DecimalField(max_digits=8, decimal_places=6, default=0)
+    repayment_share = models.DecimalField(max_digits=8, decimal_places=6, default=0)
+    interval = models.DurationField(default=timedelta(minutes=1))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind'], condition=Q(is_default=True), name='bank_product_one_default'),
+        ]
+
+    def __str__(self) -> str:
+        return f'[{self.pk}] {self.kind} {self.name}'
+
+    @property
+    def period_rate(self):
+        return Fraction(self.annual_rate) / self.periods_per_year
+
+    @property
+    def share(self):
+        return Fraction(self.repayment_share)
+
+    @classmethod
+    def default(cls, kind):
+        product = cls.objects.filter(kind=kind, is_default=True).first()
+        return product or cls(kind=kind, is_default=True, **cls.DEFAULT_TERMS[kind])
+
+    @classmethod
+    def terms(cls, kind):
+        """{product id: product} of a kind, None is the default product"""
+        products = {product.pk: product for product in cls.objects.filter(kind=kind)}
+        default = next((product for product in products.values() if product.is_default), None)
+        products[None] = default or cls(kind=kind, is_default=True, **cls.DEFAULT_TERMS[kind])
+
+        return products
+
+    @classmethod
+    def resolve(cls, product, kind):
+        """Product of a new deposit or credit"""
+        if product is None:
+            return cls.default(kind)
+        if product.kind != kind:
+            raise(ValueError(f'Not a {kind} product'))
+        return product
+
+    def next_due(self, due_at, period):
+        """Due date after an accrual or payment at period, missed intervals
+           are skipped instead of being booked all at once"""
+        next_due_at = due_at + self.interval
+        return next_due_at if next_due_at > period else period + self.interval
+
 
 class Deposit(models.Model):
     """Deposit some money to taking more money after time"""
     date = models.DateTimeField(auto_now_add=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, null=True, blank=True, on_delete=models.PROTECT)
+    # The interest job only reads deposits that are due
+    next_due_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-id']),
+        ]
 
     def __str__(self) -> str:
         return f'[{self.pk}] Account number {self.account.pk} put {str(self.amount)} on a deposit'
 
     @classmethod
-    def make_deposit(cls, amount, account):
+    def make_deposit(cls, amount, account, product=None):
         """Making deposit logic"""
         if amount < 0:
             raise(ValueError("Amount can't be negative"))
-        if amount > account.balance:
-            raise(ValueError("Not enough money"))
-        
+        if product is not None:
+            Product.resolve(product, Product.DEPOSIT)
+
         with transaction.atomic():
+            account.settle()
+            if amount > account.balance:
+                raise(ValueError("Not enough money"))
+
             account.balance -= amount
-            account.save()
-            dep = cls.objects.create(amount=amount, account=account)
+            account.save(update_fields=['balance'])
+            dep = cls.objects.create(amount=amount, account=account, product=product)
+            LedgerEntry.post(
+                'deposit',
+                (LedgerEntry.ACCOUNT, account, -amount),
+                (LedgerEntry.DEPOSIT, None, amount),
+            )
+            AccountSummary.record(deposit_total={account.pk: amount})
 
         return dep
 
@@ -158,11 +438,34 @@ class Deposit(models.Model):
             raise(ValueError("Not enough money"))
 
         with transaction.atomic():
+            account.settle()
             account.balance += amount
             instance.amount -= amount
 
-            account.save()
+            account.save(update_fields=['balance'])
             instance.save()
+            LedgerEntry.post(
+                'deposit_withdraw',
+                (LedgerEntry.ACCOUNT, account, amount),
+                (LedgerEntry.DEPOSIT, None, -amount),
+            )
+            AccountSummary.record(deposit_total={account.pk: -amount})
+
+    @staticmethod
+    def close_deposit(instance, account):
+        """Destroy deposit and transfer of balance to account"""
+        with transaction.atomic():
+            if instance.amount > 0:
+                account.settle()
+                account.balance += instance.amount
+                account.save(update_fields=['balance'])
+                LedgerEntry.post(
+                    'deposit_close',
+                    (LedgerEntry.ACCOUNT, account, instance.amount),
+                    (LedgerEntry.DEPOSIT, None, -instance.amount),
+                )
+                AccountSummary.record(deposit_total={account.pk: -instance.amount})
+            instance.delete()
 
 
 class Credit(models.Model):
@@ -171,24 +474,48 @@ class Credit(models.Model):
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, null=True, blank=True, on_delete=models.PROTECT)
+    next_due_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-id']),
+            # credit_payment only walks credits that are not paid off
+            models.Index(fields=['id'], condition=models.Q(amount__gt=0), name='bank_credit_open_idx'),
+            # and of those only the ones that are due
+            models.Index(fields=['next_due_at'], condition=models.Q(amount__gt=0), name='bank_credit_due_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'[{self.pk}] Account number {self.account.pk} borrow {str(self.amount)}'
 
     @classmethod
-    def make_credit(cls, amount, account):
-        """Making credit logic"""
+    def make_credit(cls, amount, account, product=None):
+        """Making credit logic.
+           Credits that are not paid off yet count against the limit, the
+           summary row is locked so concurrent credits can't both pass"""
         if amount < 0:
             raise(ValueError("Amount can't be negative"))
-        if amount > account.balance * 100:
-            raise(ValueError("Reduce your credit amount"))
-        
-        credit_amount = amount + amount/10
+
+        terms = Product.resolve(product, Product.CREDIT)
+        minor = calculations.to_minor([amount])
+        credit_amount = calculations.to_decimal(minor + calculations.scale(minor, Fraction(terms.markup)))[0]
 
         with transaction.atomic():
+            account.settle()
+            summary = AccountSummary.objects.select_for_update().only('credit_outstanding').get(account=account)
+            if amount + summary.credit_outstanding > account.balance * 100:
+                raise(ValueError("Reduce your credit amount"))
+
             account.balance += amount
-            account.save()
-            cre = cls.objects.create(amount=credit_amount,total_amount=credit_amount, account=account)
+            account.save(update_fields=['balance'])
+            cre = cls.objects.create(amount=credit_amount,total_amount=credit_amount, account=account, product=product)
+            LedgerEntry.post(
+                'credit',
+                (LedgerEntry.ACCOUNT, account, amount),
+                (LedgerEntry.CREDIT, None, -amount),
+            )
+            AccountSummary.record(credit_outstanding={account.pk: credit_amount})
 
         return cre
 
@@ -201,10 +528,278 @@ class Credit(models.Model):
             raise(ValueError("The amount entered is greater than the credit amount"))
 
         with transaction.atomic():
+            account.settle()
             account.balance -= amount
             instance.amount -= amount
 
-            account.save()
+            account.save(update_fields=['balance'])
             instance.save()
+            LedgerEntry.post(
+                'credit_repayment',
+                (LedgerEntry.ACCOUNT, account, -amount),
+                (LedgerEntry.CREDIT, None, amount),
+            )
+            AccountSummary.record(credit_outstanding={account.pk: -amount})
+
+
+class LedgerEntry(models.Model):
+    """Append-only double-entry ledger line.
+       A posting is a group of entries that sums to zero. Customer accounts
+       are on the account book, the other side of a posting is on one of the
+       bank books"""
+    ACCOUNT = 'account'
+    CASH = 'cash'
+    MERCHANT = 'merchant'
+    DEPOSIT = 'deposit'
+    CREDIT = 'credit'
+    BOOK_CHOICES = (
+        (ACCOUNT, 'Customer account'),
+        (CASH, 'Cash'),
+        (MERCHANT, 'Merchants'),
+        (DEPOSIT, 'Deposits'),
+        (CREDIT, 'Credits'),
+    )
 
-    
+    posting = models.UUIDField(db_index=True)
+    kind = models.CharField(max_length=32)
+    book = models.CharField(max_length=16, choices=BOOK_CHOICES)
+    account = models.ForeignKey(Account, null=True, blank=True, on_delete=models.PROTECT)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'id']),
+        ]
+
+    def __str__(self) -> str:
+        return f'[{self.pk}] {self.kind} {self.book} {self.account_id} {str(self.amount)}'
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise(ValueError('Ledger entries are append-only'))
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def post(cls, kind, *legs):
+        """Write one posting from (book, account, amount) legs"""
+        return cls.post_many(kind, [legs])
+
+    @classmethod
+    def post_many(cls, kind, postings):
+        """Write many postings of one kind with a single insert"""
+        entries = []
+        for legs in postings:
+            if sum(amount for _, _, amount in legs) != 0:
+                raise(ValueError('Posting is not balanced'))
+
+            posting = uuid.uuid4()
+            entries.extend(
+                cls(posting=posting, kind=kind, book=book, account=account, amount=amount)
+                for book, account, amount in legs
+            )
+
+        return cls.objects.bulk_create(entries)
+
+
+class HotCredit(models.Model):
+    """Incoming transfer of a hot account that is not in its balance yet.
+       Paying a hot account inserts a row instead of updating the contended
+       account row, fold() moves the rows into the balance. The ledger has
+       the entries already, so ledger_balance() includes pending credits"""
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    date = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f'[{self.pk}] Account id {self.account_id} pending {str(self.amount)}'
+
+    @classmethod
+    def fold(cls, accounts, upto=None):
+        """Add pending credits up to a primary key to the balances of
+           locked accounts and delete them, returns the number of credits"""
+        accounts = {account.pk: account for account in accounts}
+        pending = cls.objects.filter(account_id__in=accounts)
+        if upto is not None:
+            pending = pending.filter(pk__lte=upto)
+        pending = list(pending.values_list('pk', 'account_id', 'amount'))
+        if not pending:
+            return 0
+
+        credited = {}
+        movements = {}
+        for _, account_id, amount in pending:
+            credited[account_id] = credited.get(account_id, 0) + amount
+            movements[account_id] = movements.get(account_id, 0) + 1
+        for account_id, amount in credited.items():
+            accounts[account_id].balance += amount
+
+        Account.objects.bulk_update([accounts[pk] for pk in credited], ['balance'])
+        cls.objects.filter(pk__in=[pk for pk, _, _ in pending]).delete()
+        balances_changed.send(cls, balances={pk: accounts[pk].balance for pk in credited})
+        AccountSummary.record(movements=movements)
+
+        return len(pending)
+
+
+class BalanceSnapshot(models.Model):
+    """Materialized account balance up to a ledger entry"""
+    account = models.OneToOneField(Account, primary_key=True, on_delete=models.PROTECT)
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_entry_id = models.BigIntegerField(db_index=True)
+    date = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f'Account id {self.account_id} has {str(self.balance)} after entry {self.last_entry_id}'
+
+
+class LedgerWatermark(models.Model):
+    """Ledger entries up to last_entry_id are folded into the balance
+       snapshots, the snapshot run reads only the entries after it.
+       There is one row"""
+    ID = 1
+
+    last_entry_id = models.BigIntegerField(default=0)
+    date = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f'Snapshots are complete up to entry {self.last_entry_id}'
+
+
+def _per_account(deltas, output_field):
+    """CASE expression picking the delta of each account of an UPDATE"""
+    return Case(
+        *(When(account_id=account_id, then=Value(delta)) for account_id, delta in deltas.items()),
+        default=Value(0),
+        output_field=output_field,
+    )
+
+
+class AccountSummary(models.Model):
+    """Per-account aggregates kept up to date by the model methods and the
+       batch jobs, so reading them is one primary key lookup.
+       tx_count_30d counts actions, transactions and transfers sent or
+       received during the last SUMMARY_WINDOW_DAYS days"""
+    SUMMARY_WINDOW_DAYS = 30
+
+    account = models.OneToOneField(Account, primary_key=True, on_delete=models.CASCADE)
+    deposit_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    credit_outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tx_count_30d = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'Account id {self.account_id} deposits {str(self.deposit_total)} ' +\
+            f'credits {str(self.credit_outstanding)} movements {self.tx_count_30d}'
+
+    @classmethod
+    def record(cls, deposit_total=None, credit_outstanding=None, movements=None, expired_movements=None):
+        """Add {account id: delta} changes to the summaries of many accounts
+           with one UPDATE. Movements are also counted in today's activity
+           bucket, expired movements are buckets that left the window"""
+        counts = dict(movements or {})
+        for account_id, count in (expired_movements or {}).items():
+            counts[account_id] = counts.get(account_id, 0) - count
+
+        changes = {}
+        account_ids = set()
+        for field, deltas, output_field in (
+            ('deposit_total', deposit_total, models.DecimalField()),
+            ('credit_outstanding', credit_outstanding, models.DecimalField()),
+            ('tx_count_30d', counts, models.IntegerField()),
+        ):
+            if deltas:
+                changes[field] = F(field) + _per_account(deltas, output_field)
+                account_ids.update(deltas)
+
+        if not changes:
+            return
+        cls.objects.filter(account_id__in=account_ids).update(**changes)
+
+        if movements:
+            today = timezone.localdate()
+            AccountActivityDay.objects.bulk_create(
+                (AccountActivityDay(account_id=account_id, day=today) for account_id in movements),
+                ignore_conflicts=True,
+            )
+            AccountActivityDay.objects.filter(account_id__in=movements, day=today).update(
+                movements=F('movements') + _per_account(movements, models.IntegerField())
+            )
+
+
+class AccountActivityDay(models.Model):
+    """Money movements of an account on one day, tx_count_30d is the sum
+       of the buckets inside the window"""
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    day = models.DateField()
+    movements = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('account', 'day')
+
+    def __str__(self) -> str:
+        return f'Account id {self.account_id} had {self.movements} movements on {self.day}'
+
+
+class IdempotencyKey(models.Model):
+    """Stored response of a request sent with an Idempotency-Key header"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.TextField(blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self) -> str:
+        return f'{self.user_id} {self.key} {self.status_code}'
+
+
+class JobRun(models.Model):
+    """One run of a batch job for a period, see bank.jobs"""
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    job = models.CharField(max_length=64)
+    period = models.DateTimeField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=RUNNING)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('job', 'period')
+        indexes = [
+            models.Index(fields=['job', 'status']),
+        ]
+
+    def __str__(self) -> str:
+        return f'[{self.pk}] {self.job} {self.period.isoformat()} {self.status}'
+
+
+class JobCheckpoint(models.Model):
+    """High-watermark of a run over a primary key range, [lo, hi) or the
+       whole table. It is moved in the transaction of the batch it follows,
+       so it never points past or before committed work"""
+    run = models.ForeignKey(JobRun, on_delete=models.CASCADE, related_name='checkpoints')
+    lo = models.BigIntegerField(null=True, blank=True)
+    hi = models.BigIntegerField(null=True, blank=True)
+    last_pk = models.BigIntegerField(default=0)
+    rows = models.PositiveIntegerField(default=0)
+    batches = models.PositiveIntegerField(default=0)
+    done = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f'Run {self.run_id} [{self.lo}, {self.hi}) after {self.last_pk}: {self.rows} rows'
+
+    @property
+    def pk_range(self):
+        return None if self.lo is None else (self.lo, self.hi)
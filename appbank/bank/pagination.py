@@ -0,0 +1,43 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class HistoryCursorPagination(CursorPagination):
+    """Keyset pages over (date, id), newest first. A page costs the same
+       at any depth and needs no COUNT(*)"""
+    ordering = ('-date', '-id')
+    page_size = settings.BANK_HISTORY_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.BANK_HISTORY_MAX_PAGE_SIZE
+
+
+class HistoryPagination(PageNumberPagination):
+    """Page numbers as before, keyset pages when a client asks for them
+       with ?pagination=cursor or follows a cursor link"""
+    page_size = settings.BANK_HISTORY_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.BANK_HISTORY_MAX_PAGE_SIZE
+    cursor_pagination_class = HistoryCursorPagination
+
+    def use_cursor(self, request):
+        params = request.query_params
+        return params.get('pagination') == 'cursor' or self.cursor_pagination_class.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = self.cursor_pagination_class() if self.use_cursor(request) else None
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_html_context()
+
+        return super().get_html_context()
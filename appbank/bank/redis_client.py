@@ -0,0 +1,13 @@
+import redis
+from django.conf import settings
+
+
+_client = None
+
+
+def get_redis():
+    """Connection to the Redis server that Celery already uses as a broker"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+REPLICA = 'replica'
+
+_replica_reads = ContextVar('bank_replica_reads', default=False)
+
+
+def replica_reads_enabled():
+    return _replica_reads.get()
+
+
+def set_replica_reads(enabled):
+    """Send reads of the current request to the replica, if there is one"""
+    _replica_reads.set(enabled)
+
+
+@contextmanager
+def read_from_replica():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def has_replica():
+    return REPLICA in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    """Writes and reads go to the primary unless reads of the current
+       request were explicitly sent to the replica. Locking reads
+       (select_for_update) are routed as writes by Django"""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and has_replica():
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 
 from .models import *
@@ -11,6 +12,14 @@ class AccountSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'balance')
 
 
+class AccountSummarySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = AccountSummary
+        fields = ('account', 'deposit_total', 'credit_outstanding', 'tx_count_30d')
+        read_only_fields = fields
+
+
 class ProfileSerializer(serializers.ModelSerializer):
     
     class Meta:
@@ -42,18 +51,70 @@ class TransferSerializer(serializers.ModelSerializer):
         fields = ('id', 'from_account', 'to_account', 'amount', 'date')
         read_only_fields = ('id', 'date', 'from_account')
 
-    
-class DepositSerializer(serializers.ModelSerializer):
+
+
+class TransferBatchItemSerializer(serializers.Serializer):
+    to_account = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class TransferBatchSerializer(serializers.Serializer):
+    items = TransferBatchItemSerializer(many=True, allow_empty=False)
+    partial = serializers.BooleanField(default=False)
+
+    def validate_items(self, items):
+        if len(items) > settings.BANK_TRANSFER_BATCH_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f'No more than {settings.BANK_TRANSFER_BATCH_MAX_ITEMS} transfers in a batch'
+            )
+        return items
+
+
+class ScheduleSerializer(serializers.Serializer):
+    periods = serializers.IntegerField(min_value=1, default=12)
+
+    def validate_periods(self, periods):
+        if periods > settings.BANK_SCHEDULE_MAX_PERIODS:
+            raise serializers.ValidationError(
+                f'No more than {settings.BANK_SCHEDULE_MAX_PERIODS} periods in a schedule'
+            )
+        return periods
+
+
+class ProductSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Product
+        fields = (
+            'id', 'kind', 'name', 'is_default', 'annual_rate', 'periods_per_year',
+            'markup', 'repayment_share', 'interval',
+        )
+        read_only_fields = fields
+
+
+class ProductTermsMixin:
+    """Product is chosen when a deposit or credit is opened and can't be
+       changed afterwards"""
+
+    def validate(self, attrs):
+        if self.instance is not None:
+            attrs.pop('product', None)
+        return attrs
+
+
+class DepositSerializer(ProductTermsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Deposit
-        fields = ('id', 'date', 'amount', 'account')
-        read_only_fields = ('id', 'date', 'account')
+        fields = ('id', 'date', 'amount', 'account', 'product', 'next_due_at')
+        read_only_fields = ('id', 'date', 'account', 'next_due_at')
+        extra_kwargs = {'product': {'queryset': Product.objects.filter(kind=Product.DEPOSIT)}}
 
 
-class CreditSerializer(serializers.ModelSerializer):
+class CreditSerializer(ProductTermsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Credit
-        fields = ('id', 'date', 'total_amount', 'amount', 'account')
-        read_only_fields = ('id', 'date', 'account', 'total_amount')
\ No newline at end of file
+        fields = ('id', 'date', 'total_amount', 'amount', 'account', 'product', 'next_due_at')
+        read_only_fields = ('id', 'date', 'account', 'total_amount', 'next_due_at')
+        extra_kwargs = {'product': {'queryset': Product.objects.filter(kind=Product.CREDIT)}}
\ No newline at end of file
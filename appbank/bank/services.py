@@ -1,40 +1,322 @@
+import logging
+import time
+from datetime import timedelta
+
+import numpy as np
 from django.db import transaction
+from django.db.models import BigIntegerField, F, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
 
+from . import calculations, jobs
 from .models import *
+from .signals import balances_changed
+
+
+logger = logging.getLogger(__name__)
+
+INTEREST_BATCH_SIZE = 1000
+CREDIT_BATCH_SIZE = 1000
+SUMMARY_BATCH_SIZE = 1000
+HOT_FOLD_BATCH_SIZE = 100
+# Ledger entries younger than this are left for the next snapshot run,
+# so credits of hot accounts in transactions that are still open are
+# not skipped
+SNAPSHOT_SETTLE_SECONDS = 5
+
+
+def _report(job, rows, started):
+    """Log and return throughput of a batch job"""
+    seconds = time.monotonic() - started
+    rows_per_second = rows / seconds if seconds else 0.0
+    logger.info('%s: %d rows in %.3fs (%.0f rows/s)', job, rows, seconds, rows_per_second)
+
+    return {'job': job, 'rows': rows, 'seconds': seconds, 'rows_per_second': rows_per_second}
+
+
+def shard_ranges(queryset, shards):
+    """Split primary key space of queryset into [lo, hi) ranges"""
+    bounds = queryset.aggregate(lo=Min('pk'), hi=Max('pk'))
+    if bounds['lo'] is None:
+        return []
+
+    lo, hi = bounds['lo'], bounds['hi'] + 1
+    step = -(-(hi - lo) // shards)
+
+    return [(start, min(start + step, hi)) for start in range(lo, hi, step)]
+
+
+def _minor_units(field):
+    """Amount column as integer minor units, computed by the database so
+       the batches get int64 columns without converting Decimals"""
+    return Cast(Round(F(field) * calculations.MINOR_UNITS), BigIntegerField())
+
 
+def _column(values):
+    return np.fromiter(values, dtype=np.int64, count=len(values))
 
-def make_interest():
-    """Add some procent for deposit"""
-    deposits = Deposit.objects.all()
-    for deposit in deposits:
-        pr = 0.05 / 12
-        amount = float(deposit.amount)
-        interest = amount * pr
-        amount += interest
-        deposit.amount = amount
-        deposit.save()
 
+def _in_range(queryset, pk_range):
+    if pk_range is None:
+        return queryset
+    lo, hi = pk_range
+    return queryset.filter(pk__gte=lo, pk__lt=hi)
 
-def credit_payment():
+
+def make_interest(period=None, batch_size=INTEREST_BATCH_SIZE, pk_range=None):
+    """Add some procent for deposit.
+       Only deposits due at period are read, in primary key batches. The
+       interest of a batch is computed on its column of amounts at the rates
+       of the deposits' products and written with one bulk UPDATE that also
+       moves next_due_at. Batches are checkpointed by bank.jobs, so an
+       interrupted run of the period is resumed instead of repeated"""
+    started = time.monotonic()
+    if period is None:
+        period = timezone.now()
+
+    rows = jobs.run('make_interest', period, pk_range, batch_size=batch_size)
+
+    return _report('make_interest', rows, started)
+
+
+@jobs.step('make_interest')
+def _interest_batches(period, batch_size=INTEREST_BATCH_SIZE):
+    products = Product.terms(Product.DEPOSIT)
+    rates = {pk: product.period_rate for pk, product in products.items()}
+
+    def batch(last_pk, pk_range):
+        rows = list(
+            _in_range(Deposit.objects.all(), pk_range).select_for_update()
+            .filter(next_due_at__lte=period, pk__gt=last_pk)
+            .annotate(minor=_minor_units('amount'))
+            .order_by('pk')
+            .values_list('pk', 'account_id', 'minor', 'product_id', 'next_due_at')[:batch_size]
+        )
+        if not rows:
+            return None
+
+        pks, account_ids, amounts, product_ids, due_at = zip(*rows)
+        minor = _column(amounts)
+        interest = calculations.scale_by(minor, product_ids, rates)
+        accounts, index = np.unique(_column(account_ids), return_inverse=True)
+        totals = np.zeros(len(accounts), dtype=np.int64)
+        np.add.at(totals, index, interest)
+        interest_by_account = dict(zip(accounts.tolist(), calculations.to_decimal(totals)))
+        Deposit.objects.bulk_update([
+            Deposit(pk=pk, amount=amount, next_due_at=products[product_id].next_due(next_due_at, period))
+            for pk, amount, product_id, next_due_at
+            in zip(pks, calculations.to_decimal(minor + interest), product_ids, due_at)
+        ], ['amount', 'next_due_at'])
+        LedgerEntry.post_many('interest', [
+            ((LedgerEntry.DEPOSIT, None, value), (LedgerEntry.CASH, None, -value))
+            for value in interest_by_account.values() if value
+        ])
+        AccountSummary.record(deposit_total=interest_by_account)
+
+        return pks[-1], len(rows)
+
+    return batch
+
+
+def credit_payment(period=None, batch_size=CREDIT_BATCH_SIZE, pk_range=None):
     """Take procent from account balance and decrease credit amount.
-       If credit is over, auto-delete the credit"""
-    credits = Credit.objects.all()
-    for credit in credits:
-        payment = float(credit.total_amount)/10
-        account = credit.account
-
-        if credit.amount > 0:
-            with transaction.atomic():
-
-                amount = float(credit.amount) - payment
-                if amount <= 0:
-                    credit.account.balance = float(account.balance) - float(credit.amount)
-
-                    credit.amount = 0
-                    account.save()
-                    credit.delete()
-                else:
-                    credit.account.balance = float(account.balance) - payment
-                    account.save()
-                    credit.amount = amount
-                    credit.save()
+       If credit is over, auto-delete the credit.
+       Credits due at period are handled in primary key ordered batches:
+       payments of a batch are computed on its columns of amounts with the
+       shares of the credits' products, accounts are loaded with one query
+       and every batch is written with bulk updates and one bulk delete in
+       the transaction of its bank.jobs checkpoint"""
+    started = time.monotonic()
+    if period is None:
+        period = timezone.now()
+
+    rows = jobs.run('credit_payment', period, pk_range, batch_size=batch_size)
+
+    return _report('credit_payment', rows, started)
+
+
+@jobs.step('credit_payment')
+def _credit_payment_batches(period, batch_size=CREDIT_BATCH_SIZE):
+    products = Product.terms(Product.CREDIT)
+    shares = {pk: product.share for pk, product in products.items()}
+
+    def batch(last_pk, pk_range):
+        credits = list(
+            _in_range(Credit.objects.all(), pk_range).select_for_update()
+            .filter(amount__gt=0, next_due_at__lte=period, pk__gt=last_pk)
+            .annotate(minor=_minor_units('amount'), total_minor=_minor_units('total_amount'))
+            .order_by('pk')
+            .values_list('pk', 'account_id', 'minor', 'total_minor', 'product_id', 'next_due_at')[:batch_size]
+        )
+        if not credits:
+            return None
+
+        pks, account_ids, amounts, total_amounts, product_ids, due_at = zip(*credits)
+        payments, left = calculations.repay(
+            _column(amounts),
+            calculations.scale_by(_column(total_amounts), product_ids, shares)
+        )
+        accounts = (
+            Account.objects.select_for_update()
+            .filter(pk__in=set(account_ids))
+            .order_by('pk')
+            .only('pk', 'balance', 'is_hot')
+        )
+        accounts = {account.pk: account for account in accounts}
+        # the new balance of a hot account includes its pending credits
+        hot = [account for account in accounts.values() if account.is_hot]
+        if hot:
+            HotCredit.fold(hot)
+        open_credits = []
+        closed_pks = []
+        postings = []
+        repaid = {}
+
+        for pk, account_id, payment, amount, product_id, next_due_at in zip(
+            pks, account_ids, calculations.to_decimal(payments), calculations.to_decimal(left),
+            product_ids, due_at
+        ):
+            account = accounts[account_id]
+            if amount <= 0:
+                closed_pks.append(pk)
+            else:
+                open_credits.append(
+                    Credit(pk=pk, amount=amount, next_due_at=products[product_id].next_due(next_due_at, period))
+                )
+
+            account.balance -= payment
+            repaid[account.pk] = repaid.get(account.pk, 0) - payment
+            postings.append((
+                (LedgerEntry.ACCOUNT, account, -payment),
+                (LedgerEntry.CREDIT, None, payment),
+            ))
+
+        Account.objects.bulk_update(accounts.values(), ['balance'])
+        balances_changed.send(Credit, balances={pk: account.balance for pk, account in accounts.items()})
+        Credit.objects.bulk_update(open_credits, ['amount', 'next_due_at'])
+        if closed_pks:
+            Credit.objects.filter(pk__in=closed_pks).delete()
+        LedgerEntry.post_many('credit_payment', postings)
+        AccountSummary.record(credit_outstanding=repaid)
+
+        return pks[-1], len(credits)
+
+    return batch
+
+
+def snapshot_balances(settle_seconds=SNAPSHOT_SETTLE_SECONDS):
+    """Fold ledger entries written since the previous run into balance
+       snapshots. Must not run concurrently with itself.
+       Every snapshot keeps the last entry of its account it folded and
+       takes the committed entries after it, entries of an account are
+       written under its row lock and commit in id order. Credits of hot
+       accounts are written without the lock, entries younger than
+       settle_seconds are left for the next run so they can commit.
+       Only entries after the LedgerWatermark are read, so a run costs
+       the entries written since the previous one, not the history"""
+    started = time.monotonic()
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    watermark, _ = LedgerWatermark.objects.get_or_create(pk=LedgerWatermark.ID)
+    new_entries = LedgerEntry.objects.filter(account__isnull=False, id__gt=watermark.last_entry_id)
+    bounds = new_entries.aggregate(
+        fresh=Min('id', filter=Q(date__gt=cutoff)),
+        last=Max('id', filter=Q(date__lte=cutoff)),
+    )
+    folded = BalanceSnapshot.objects.filter(account=OuterRef('account')).values('last_entry_id')
+    deltas = {
+        account_id: (total, last)
+        for account_id, total, last in new_entries.filter(date__lte=cutoff)
+        .annotate(folded=Coalesce(Subquery(folded), 0))
+        .filter(id__gt=F('folded'))
+        .values('account')
+        .annotate(total=Sum('amount'), last=Max('id'))
+        .values_list('account', 'total', 'last')
+    }
+    # entries left for the next run keep the watermark below them
+    if bounds['fresh'] is not None:
+        low = bounds['fresh'] - 1
+    else:
+        low = bounds['last'] or watermark.last_entry_id
+
+    with transaction.atomic():
+        snapshots = BalanceSnapshot.objects.select_for_update().in_bulk(deltas.keys())
+        new_snapshots = []
+        for account_id, (total, last) in deltas.items():
+            snapshot = snapshots.get(account_id)
+            if snapshot is None:
+                snapshot = BalanceSnapshot(account_id=account_id, balance=0)
+                new_snapshots.append(snapshot)
+            snapshot.balance += total
+            snapshot.last_entry_id = last
+
+        BalanceSnapshot.objects.bulk_update(snapshots.values(), ['balance', 'last_entry_id'])
+        BalanceSnapshot.objects.bulk_create(new_snapshots)
+        if low != watermark.last_entry_id:
+            LedgerWatermark.objects.filter(pk=watermark.pk).update(last_entry_id=low, date=timezone.now())
+
+    return _report('snapshot_balances', len(deltas), started)
+
+
+def fold_hot_credits(batch_size=HOT_FOLD_BATCH_SIZE):
+    """Fold pending credits of hot accounts into their balances.
+       Accounts of a batch are locked while their credits are folded, only
+       credits that existed when the run started are taken, so a steady
+       stream of payments can't keep the run going"""
+    started = time.monotonic()
+    upto = HotCredit.objects.aggregate(last=Max('id'))['last']
+    rows = 0
+
+    while upto is not None:
+        with transaction.atomic():
+            account_ids = list(
+                HotCredit.objects.filter(pk__lte=upto)
+                .order_by('account_id').values_list('account_id', flat=True).distinct()[:batch_size]
+            )
+            if not account_ids:
+                break
+
+            accounts = Account.objects.select_for_update().filter(pk__in=account_ids).order_by('pk').only('pk', 'balance')
+            rows += HotCredit.fold(accounts, upto=upto)
+
+    return _report('fold_hot_credits', rows, started)
+
+
+def refresh_account_summaries(today=None, batch_size=SUMMARY_BATCH_SIZE):
+    """Move the tx_count_30d window: activity buckets that fell out of it
+       are subtracted from their summaries and deleted. Buckets of past
+       days don't change any more, so this can run next to the writers"""
+    started = time.monotonic()
+    if today is None:
+        today = timezone.localdate()
+    cutoff = today - timedelta(days=AccountSummary.SUMMARY_WINDOW_DAYS - 1)
+    expired = AccountActivityDay.objects.filter(day__lt=cutoff)
+    rows = 0
+
+    while True:
+        with transaction.atomic():
+            account_ids = list(
+                expired.order_by('account_id').values_list('account_id', flat=True).distinct()[:batch_size]
+            )
+            if not account_ids:
+                break
+
+            movements = dict(
+                expired.filter(account_id__in=account_ids)
+                .values('account_id')
+                .annotate(total=Sum('movements'))
+                .values_list('account_id', 'total')
+            )
+            AccountSummary.record(expired_movements=movements)
+            expired.filter(account_id__in=account_ids).delete()
+
+        rows += len(account_ids)
+
+    return _report('refresh_account_summaries', rows, started)
+
+
+def purge_idempotency_keys():
+    """Delete expired stored responses of the database idempotency store"""
+    started = time.monotonic()
+    rows, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+
+    return _report('purge_idempotency_keys', rows, started)
@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+
+# Sent inside the transaction that changed account balances without
+# Account.save(), with balances={account id: new balance}
+balances_changed = Signal()
+
+# Sent inside the transaction that changed account balances without
+# knowing the new ones, with account_ids=[account id, ...]
+balances_invalidated = Signal()
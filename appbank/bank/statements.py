@@ -0,0 +1,83 @@
+import csv
+import heapq
+import json
+
+from .models import Action, LedgerEntry, Transaction, Transfer
+
+
+STATEMENT_CHUNK_SIZE = 2000
+STATEMENT_FIELDS = ('date', 'type', 'id', 'amount', 'counterparty')
+# deposit and credit movements have no history table of their own, they
+# are read from the account book of the ledger
+STATEMENT_LEDGER_KINDS = (
+    'deposit', 'deposit_withdraw', 'deposit_close', 'credit', 'credit_repayment', 'credit_payment',
+)
+
+
+def _between(queryset, date_from, date_to):
+    if date_from is not None:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(date__lt=date_to)
+    return queryset
+
+
+def _stream(queryset, kind, sign, counterparty, date_from, date_to):
+    """Rows of one history table in date order, read with a server-side cursor"""
+    queryset = _between(queryset, date_from, date_to)
+    fields = ('date', 'id', 'amount') + ((counterparty,) if counterparty else ())
+    for row in queryset.order_by('date', 'id').values_list(*fields).iterator(chunk_size=STATEMENT_CHUNK_SIZE):
+        yield (row[0], kind, row[1], sign * row[2], row[3] if counterparty else '')
+
+
+def _ledger_stream(account_id, date_from, date_to):
+    """Deposit and credit movements of an account in date order. Their id
+       is the one of the ledger entry and the type its posting kind"""
+    queryset = _between(
+        LedgerEntry.objects.filter(account_id=account_id, book=LedgerEntry.ACCOUNT, kind__in=STATEMENT_LEDGER_KINDS),
+        date_from, date_to
+    )
+    fields = ('date', 'kind', 'id', 'amount')
+    for date, kind, pk, amount in queryset.order_by('date', 'id').values_list(*fields).iterator(chunk_size=STATEMENT_CHUNK_SIZE):
+        yield (date, kind, pk, amount, '')
+
+
+def statement_rows(account_id, date_from=None, date_to=None):
+    """All movements of an account balance merged in date order.
+       Interest accrues on the deposit and reaches the balance with the
+       deposit withdrawal or close. Memory use does not depend on the
+       history length"""
+    streams = (
+        _stream(Action.objects.filter(account_id=account_id), 'action', 1, None, date_from, date_to),
+        _stream(Transaction.objects.filter(account_id=account_id), 'transaction', -1, 'merchant', date_from, date_to),
+        _stream(Transfer.objects.filter(from_account_id=account_id), 'transfer_out', -1, 'to_account', date_from, date_to),
+        _stream(Transfer.objects.filter(to_account_id=account_id), 'transfer_in', 1, 'from_account', date_from, date_to),
+        _ledger_stream(account_id, date_from, date_to),
+    )
+
+    return heapq.merge(*streams, key=lambda row: (row[0], row[1], row[2]))
+
+
+class Echo:
+    """File-like object that hands written lines back to the csv writer"""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(STATEMENT_FIELDS)
+    for date, kind, pk, amount, counterparty in rows:
+        yield writer.writerow((date.isoformat(), kind, pk, amount, counterparty))
+
+
+def render_ndjson(rows):
+    for date, kind, pk, amount, counterparty in rows:
+        yield json.dumps({
+            'date': date.isoformat(),
+            'type': kind,
+            'id': pk,
+            'amount': str(amount),
+            'counterparty': counterparty,
+        }) + '\n'
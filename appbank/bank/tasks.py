@@ -1,11 +1,150 @@
-from celery import shared_task
-from bank.services import make_interest, credit_payment
+import logging
 
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from bank import jobs
+from bank.locks import acquire_lease, release_lease
+from bank.models import Credit, Deposit
+from bank.services import (
+    make_interest, credit_payment, shard_ranges, snapshot_balances, purge_idempotency_keys,
+    refresh_account_summaries, fold_hot_credits,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Options of the tasks routed to the batch queue, see CELERY_TASK_ROUTES
+BATCH_TASK = {
+    'acks_late': True,
+    'reject_on_worker_lost': True,
+    'soft_time_limit': settings.BANK_BATCH_SOFT_TIME_LIMIT,
+    'time_limit': settings.BANK_BATCH_TIME_LIMIT,
+}
+
+JOBS = {
+    'make_interest': (make_interest, Deposit.objects.all()),
+    'credit_payment': (credit_payment, Credit.objects.filter(amount__gt=0)),
+}
+
+
+def _run_job(job, shards):
+    """Run a job inline or fan it out over shards, one tick at a time.
+       A tick with nothing due ends after one index lookup"""
+    if shards is None:
+        shards = settings.BANK_JOB_SHARDS
+    func, queryset = JOBS[job]
+    tick = timezone.now()
+    due = queryset.filter(next_due_at__lte=tick)
+    if not due.exists():
+        return {'job': job, 'rows': 0}
+
+    token = acquire_lease(job, settings.BANK_JOB_LEASE_SECONDS)
+    if token is None:
+        logger.warning('%s: previous tick is still running, skipped', job)
+        return None
+
+    # once the chord is sent its callback releases the lease
+    sent = False
+    try:
+        ranges = shard_ranges(due, shards) if shards > 1 else []
+        if len(ranges) < 2:
+            jobs.start(job, tick)
+            return func(period=tick)
+
+        jobs.start(job, tick, ranges)
+        callback = finish_job.s(job, token)
+        callback.link_error(release_job_lease.si(job, token))
+        chord(group(run_job_shard.s(job, lo, hi, tick.isoformat()) for lo, hi in ranges))(callback)
+        sent = True
+    finally:
+        if not sent:
+            release_lease(job, token)
+
+    return {'job': job, 'shards': len(ranges)}
+
+
+@shared_task(**BATCH_TASK)
+def run_job_shard(job, lo, hi, period):
+    func, _ = JOBS[job]
+    result = func(pk_range=(lo, hi), period=parse_datetime(period))
+    result['shard'] = [lo, hi]
+
+    return result
+
+
+@shared_task(**BATCH_TASK)
+def finish_job(results, job, token):
+    """Aggregate shard results and release the tick lease"""
+    try:
+        summary = {
+            'job': job,
+            'rows': sum(result['rows'] for result in results),
+            'seconds': max(result['seconds'] for result in results),
+            'shards': [
+                {'shard': result['shard'], 'rows': result['rows'], 'seconds': result['seconds']}
+                for result in results
+            ],
+        }
+        for shard in summary['shards']:
+            logger.info('%s: shard %s %d rows in %.3fs', job, shard['shard'], shard['rows'], shard['seconds'])
+        logger.info('%s: %d rows in %d shards, slowest shard %.3fs',
+                    job, summary['rows'], len(results), summary['seconds'])
+    finally:
+        release_lease(job, token)
+
+    return summary
+
+
+@shared_task(**BATCH_TASK)
+def release_job_lease(job, token):
+    release_lease(job, token)
+
+
+@shared_task(**BATCH_TASK)
+def call_make_interest(shards=None):
+    return _run_job('make_interest', shards)
+
+@shared_task(**BATCH_TASK)
+def call_credit_payment(shards=None):
+    return _run_job('credit_payment', shards)
+
+@shared_task(**BATCH_TASK)
+def call_snapshot_balances():
+    token = acquire_lease('snapshot_balances', settings.BANK_JOB_LEASE_SECONDS)
+    if token is None:
+        logger.warning('snapshot_balances: previous run is still running, skipped')
+        return None
+    try:
+        return snapshot_balances()
+    finally:
+        release_lease('snapshot_balances', token)
+
+@shared_task(**BATCH_TASK)
+def call_purge_idempotency_keys():
+    return purge_idempotency_keys()
+
+@shared_task(**BATCH_TASK)
+def call_refresh_account_summaries():
+    token = acquire_lease('refresh_account_summaries', settings.BANK_JOB_LEASE_SECONDS)
+    if token is None:
+        logger.warning('refresh_account_summaries: previous run is still running, skipped')
+        return None
+    try:
+        return refresh_account_summaries()
+    finally:
+        release_lease('refresh_account_summaries', token)
 
-@shared_task
-def call_make_interest():
-    make_interest()
 
 @shared_task
-def call_credit_payment():
-    credit_payment()
\ No newline at end of file
+def call_fold_hot_credits():
+    token = acquire_lease('fold_hot_credits', settings.BANK_JOB_LEASE_SECONDS)
+    if token is None:
+        logger.warning('fold_hot_credits: previous run is still running, skipped')
+        return None
+    try:
+        return fold_hot_credits()
+    finally:
+        release_lease('fold_hot_credits', token)
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+
+from bank.models import Account
+
+
+def sample_account(username='test', balance=None, is_hot=False):
+    """Account of a new user, saved again only when a balance or
+       the hot mode is given"""
+    account = Account.objects.get(user=get_user_model().objects.create_user(username=username, password='ghbrjkmxbr'))
+    if balance is not None or is_hot:
+        if balance is not None:
+            account.balance = balance
+        account.is_hot = is_hot
+        account.save()
+    return account
+
+
+class FakeRedis:
+    """In-memory stand-in for the commands the bank sends to Redis"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, key):
+        self.data.pop(key, None)
@@ -0,0 +1,62 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from bank.cache import account_id_for_user
+from bank.models import *
+from bank.views import ActionViewSet
+
+ACTION_URL = reverse('bank:action-list')
+DEPOSIT_URL = reverse('bank:deposit-list')
+
+
+@mock.patch.object(ActionViewSet, 'pagination_class', None)
+class AccountResolverTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.account = Account.objects.get(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_account_id_is_cached_on_account_creation(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(account_id_for_user(self.user), self.account.pk)
+
+    def test_list_filters_by_cached_account_id(self):
+        with self.assertNumQueries(1):
+            res = self.client.get(ACTION_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_list_after_cache_miss(self):
+        cache.clear()
+
+        with self.assertNumQueries(2):
+            self.client.get(ACTION_URL)
+        with self.assertNumQueries(1):
+            self.client.get(ACTION_URL)
+
+    def test_update_resolves_account_once(self):
+        self.account.balance = Decimal('1000.00')
+        self.account.save()
+        deposit = Deposit.make_deposit(Decimal('100.00'), self.account)
+
+        # deposit, account, savepoint pair, account lock, account and deposit
+        # saves, ledger insert, summary update
+        with self.assertNumQueries(9):
+            res = self.client.put(DEPOSIT_URL + f'{deposit.pk}/', {'amount': 10})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deleted_account_is_forgotten(self):
+        user = get_user_model().objects.create_user(username='test2', password='ghbrjkmxbr')
+        Account.objects.filter(user=user).delete()
+
+        with self.assertRaises(Account.DoesNotExist):
+            account_id_for_user(user)
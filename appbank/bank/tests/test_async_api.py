@@ -0,0 +1,92 @@
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from bank.authentication import token_cache
+from bank.models import *
+
+ACTION_URL = reverse('bank:async-action-list')
+TRANSFER_URL = reverse('bank:async-transfer-list')
+
+
+def account_url(pk):
+    return reverse('bank:async-account-detail', args=[pk])
+
+
+class AsyncReadApiTest(TransactionTestCase):
+    """Queries of async views run in pool threads with their own connections,
+       so data has to be committed"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.account = Account.objects.get(user=self.user)
+        self.token = Token.objects.create(user=self.user).key
+        self.client = AsyncClient()
+
+    def get(self, url, data=None, token=None):
+        # AsyncClient of Django 3.1 takes raw header names as extra and
+        # drops the data, so the query string goes into the url
+        if data:
+            url += '?' + urlencode(data)
+        return self.client.get(url, authorization='Token ' + (token or self.token))
+
+    async def test_account_balance(self):
+        res = await self.get(account_url(self.account.pk))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'id': self.account.pk, 'balance': '0.00'})
+
+    async def test_other_account_is_not_found(self):
+        res = await self.get(account_url(self.account.pk + 100))
+
+        self.assertEqual(res.status_code, 404)
+
+    async def test_authentication_required(self):
+        res = await AsyncClient().get(account_url(self.account.pk))
+
+        self.assertEqual(res.status_code, 401)
+
+    async def test_invalid_token(self):
+        res = await self.get(ACTION_URL, token='wrong')
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_history_is_paged_by_id(self):
+        actions = [Action.objects.create(account=self.account, amount=Decimal(i)) for i in range(1, 6)]
+
+        res = self.async_get(ACTION_URL, {'limit': 3})
+
+        body = res.json()
+        self.assertEqual([row['id'] for row in body['results']], [a.pk for a in actions[:1:-1]])
+        self.assertIn(f'before_id={actions[2].pk}', body['next'])
+
+        res = self.async_get(ACTION_URL, {'limit': 3, 'before_id': actions[2].pk})
+
+        body = res.json()
+        self.assertEqual([row['id'] for row in body['results']], [actions[1].pk, actions[0].pk])
+        self.assertIsNone(body['next'])
+
+    def test_transfers_are_outgoing_only(self):
+        other = Account.objects.get(user=get_user_model().objects.create_user(username='test2', password='x'))
+        sent = Transfer.objects.create(from_account=self.account, to_account=other, amount=Decimal('1.00'))
+        Transfer.objects.create(from_account=other, to_account=self.account, amount=Decimal('2.00'))
+
+        res = self.async_get(TRANSFER_URL)
+
+        self.assertEqual([row['id'] for row in res.json()['results']], [sent.pk])
+
+    def test_bad_before_id(self):
+        res = self.async_get(ACTION_URL, {'before_id': 'x'})
+
+        self.assertEqual(res.status_code, 400)
+
+    def async_get(self, url, data=None):
+        return async_to_sync(self.get)(url, data)
@@ -0,0 +1,162 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from redis.exceptions import ConnectionError
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from bank.authentication import TokenCache, token_cache
+from bank.models import Account
+from bank.tests.helpers import FakeRedis
+
+ACCOUNT_URL = reverse('bank:account-list')
+LOGOUT_URL = '/rest-auth/logout/'
+
+
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.token = Token.objects.create(user=self.user)
+        self.url = ACCOUNT_URL + str(Account.objects.get(user=self.user).pk) + '/'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_is_not_queried_twice(self):
+        self.client.get(self.url)
+        hits = token_cache.hits
+
+        # the balance is cached as well
+        with self.assertNumQueries(0):
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.hits, hits + 1)
+
+    def test_invalid_token_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token wrong')
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_revokes_cached_token(self):
+        self.client.get(self.url)
+
+        self.client.post(LOGOUT_URL)
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(self.url)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_revokes_cached_token(self):
+        self.client.get(self.url)
+
+        self.user.set_password('changed')
+        self.user.save()
+
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_last_login_keeps_cached_token(self):
+        self.client.get(self.url)
+
+        get_user_model().objects.get(pk=self.user.pk).save(update_fields=['last_login'])
+
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+
+class TokenCacheTest(SimpleTestCase):
+
+    def test_entries_expire(self):
+        cache = TokenCache(max_size=10, ttl=60)
+        cache.set('key', 'value')
+
+        with mock.patch('bank.authentication.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TokenCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+
+class SharedTokenCacheTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.token = Token.objects.create(user=self.user)
+        self.key = self.token.key
+        self.value = (self.user, self.token)
+
+    @mock.patch('bank.authentication.get_redis')
+    def test_shared_tier_is_shared_between_processes(self, get_redis):
+        get_redis.return_value = FakeRedis()
+        first = TokenCache(max_size=10, ttl=60, shared=True)
+        second = TokenCache(max_size=10, ttl=60, shared=True)
+
+        first.set(self.key, self.value)
+
+        self.assertEqual(second.get(self.key), self.value)
+        self.assertEqual(second.stats()['shared_hits'], 1)
+
+    @mock.patch('bank.authentication.get_redis')
+    def test_revocation_reaches_other_processes(self, get_redis):
+        get_redis.return_value = FakeRedis()
+        first = TokenCache(max_size=10, ttl=60, shared=True)
+        second = TokenCache(max_size=10, ttl=60, shared=True)
+        first.set(self.key, self.value)
+        second.get(self.key)
+
+        first.invalidate(self.key)
+
+        self.assertIsNone(second.get(self.key))
+
+    @mock.patch('bank.authentication.get_redis')
+    def test_local_hits_are_not_served_without_redis(self, get_redis):
+        get_redis.return_value = FakeRedis()
+        cache = TokenCache(max_size=10, ttl=60, shared=True)
+        cache.set(self.key, self.value)
+        get_redis.side_effect = ConnectionError
+
+        with self.assertLogs('bank.authentication', 'WARNING'):
+            self.assertIsNone(cache.get(self.key))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    @mock.patch('bank.authentication.get_redis')
+    def test_shared_tier_holds_no_objects(self, get_redis):
+        get_redis.return_value = FakeRedis()
+        cache = TokenCache(max_size=10, ttl=60, shared=True)
+
+        cache.set(self.key, self.value)
+
+        payload = json.loads(get_redis.return_value.data['bank:token:' + self.key])
+        self.assertEqual(payload['user_id'], self.user.pk)
+
+    @mock.patch('bank.authentication.get_redis')
+    def test_shared_hit_of_inactive_user_is_a_miss(self, get_redis):
+        get_redis.return_value = FakeRedis()
+        first = TokenCache(max_size=10, ttl=60, shared=True)
+        second = TokenCache(max_size=10, ttl=60, shared=True)
+        first.set(self.key, self.value)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+
+        self.assertIsNone(second.get(self.key))
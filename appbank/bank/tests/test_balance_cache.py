@@ -0,0 +1,128 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from bank.authentication import token_cache
+from bank.cache import cached_balance
+from bank.models import *
+from bank.services import credit_payment
+from bank.tests.helpers import sample_account
+
+
+def account_url(pk):
+    return reverse('bank:account-detail', args=[pk])
+
+
+class BalanceRetrieveTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.account = sample_account(balance=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.account.user).key)
+        self.url = account_url(self.account.pk)
+
+    def test_poll_is_served_from_cache(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(self.url)
+
+        self.assertEqual(res.data, {'id': self.account.pk, 'balance': '100.00'})
+        self.assertIn('ETag', res)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_changed_balance_gets_new_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        Action.make_action(Decimal('5.00'), self.account)
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['balance'], '105.00')
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_other_account_is_not_found(self):
+        other = sample_account(username='test2')
+
+        res = self.client.get(account_url(other.pk))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BalanceWriteThroughTest(TransactionTestCase):
+    """on_commit callbacks only run when transactions really commit"""
+
+    def setUp(self):
+        cache.clear()
+        self.account = sample_account(balance=Decimal('100.00'))
+        self.other = sample_account(username='test2', balance=Decimal('10.00'))
+
+    def assertCached(self, account, balance):
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_balance(account.pk), Decimal(balance))
+
+    def test_transfer_writes_both_balances(self):
+        Transfer.make_transfer(Decimal('30.00'), self.account, self.other)
+
+        self.assertCached(self.account, '70.00')
+        self.assertCached(self.other, '40.00')
+
+    def test_batch_transfer_writes_balances(self):
+        Transfer.make_batch_transfer([(self.other.pk, Decimal('1.00')), (self.other.pk, Decimal('2.00'))], self.account)
+
+        self.assertCached(self.account, '97.00')
+        self.assertCached(self.other, '13.00')
+
+    def test_deposit_and_credit_write_balances(self):
+        deposit = Deposit.make_deposit(Decimal('40.00'), self.account)
+        self.assertCached(self.account, '60.00')
+
+        Deposit.close_deposit(deposit, self.account)
+        self.assertCached(self.account, '100.00')
+
+        Credit.make_credit(Decimal('100.00'), self.account)
+        self.assertCached(self.account, '200.00')
+
+    def test_credit_payment_writes_balances(self):
+        Credit.make_credit(Decimal('100.00'), self.account)
+
+        credit_payment()
+
+        self.assertCached(self.account, '189.00')
+
+    def test_failed_transfer_leaves_committed_balance(self):
+        cached_balance(self.other.pk)
+
+        with self.assertRaises(ValueError):
+            Transfer.make_transfer(Decimal('50.00'), self.other, self.account)
+
+        self.assertCached(self.other, '10.00')
+
+    def test_hot_account_balance_includes_pending_credits(self):
+        merchant = sample_account(username='merchant')
+        Action.make_action(Decimal('10.00'), merchant)
+        Account.objects.filter(pk=merchant.pk).update(is_hot=True)
+        self.assertEqual(cached_balance(merchant.pk), Decimal('10.00'))
+
+        Transfer.make_transfer(Decimal('30.00'), self.account, merchant)
+        Transfer.make_batch_transfer([(merchant.pk, Decimal('5.00'))], self.account)
+
+        self.assertEqual(Account.objects.get(pk=merchant.pk).balance, Decimal('10.00'))
+        self.assertEqual(cached_balance(merchant.pk), Decimal('45.00'))
+        self.assertCached(merchant, '45.00')
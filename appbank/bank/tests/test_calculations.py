@@ -0,0 +1,139 @@
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_EVEN
+from fractions import Fraction
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from bank import calculations
+from bank.models import *
+from bank.services import credit_payment, make_interest
+from bank.tests.helpers import sample_account
+
+
+class CalculationsTest(SimpleTestCase):
+
+    def test_minor_units_round_trip(self):
+        amounts = [Decimal('0.00'), Decimal('1004.17'), Decimal('-3.5'), Decimal('9999999999.99')]
+
+        minor = calculations.to_minor(amounts)
+
+        self.assertEqual(minor.dtype, np.int64)
+        self.assertEqual(minor.tolist(), [0, 100417, -350, 999999999999])
+        self.assertEqual(calculations.to_decimal(minor), amounts)
+
+    def test_sub_cent_amounts_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'more than two decimal places'):
+            calculations.to_minor([Decimal('1.005')])
+
+    def test_scale_rounds_half_to_even(self):
+        minor = np.array([5, 15, 25, -5, -15, 14, 16], dtype=np.int64)
+
+        self.assertEqual(calculations.scale(minor, Fraction(1, 10)).tolist(), [0, 2, 2, 0, -2, 1, 2])
+
+    def test_scale_matches_exact_decimal_rounding(self):
+        rate = Fraction(7, 1600)
+        minor = np.arange(-5000, 5000, 7, dtype=np.int64)
+
+        expected = [
+            int((Decimal(int(value)) * 7 / 1600).quantize(Decimal('1'), ROUND_HALF_EVEN)) for value in minor
+        ]
+
+        self.assertEqual(calculations.scale(minor, rate).tolist(), expected)
+
+    def test_overflow_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'too large'):
+            calculations.scale(np.array([10 ** 15], dtype=np.int64), Fraction(10 ** 5, 3))
+
+    def test_repay_never_takes_more_than_left(self):
+        payments, left = calculations.repay(
+            np.array([11000, 500, 0], dtype=np.int64), np.array([1100, 1100, 1100], dtype=np.int64)
+        )
+
+        self.assertEqual(payments.tolist(), [1100, 500, 0])
+        self.assertEqual(left.tolist(), [9900, 0, 0])
+
+    def test_rate_per_row(self):
+        minor = np.array([1000, 1000, 2000, 15], dtype=np.int64)
+
+        result = calculations.scale_by(minor, [1, None, 1, None], {1: Fraction(1, 10), None: Fraction(1, 2)})
+
+        self.assertEqual(result.tolist(), [100, 500, 200, 8])
+
+    def test_projection_matches_repeated_accrual(self):
+        minor = calculations.to_minor([Decimal('1000.00'), Decimal('1.20')])
+
+        interest, amounts = calculations.project_deposits(minor, 3)
+
+        current = minor
+        for period in range(3):
+            current = current + calculations.accrue(current)
+            self.assertEqual(amounts[:, period].tolist(), current.tolist())
+        self.assertEqual(interest[:, 0].tolist(), [417, 0])
+        self.assertEqual((amounts[:, -1] - minor).tolist(), interest.sum(axis=1).tolist())
+
+    def test_credit_projection_ends_at_zero(self):
+        payments, amounts = calculations.project_credits(
+            calculations.to_minor([Decimal('25.00')]), calculations.to_minor([Decimal('100.00')]), 4
+        )
+
+        self.assertEqual(payments.tolist(), [[1000, 1000, 500, 0]])
+        self.assertEqual(amounts.tolist(), [[1500, 500, 0, 0]])
+
+
+class ScheduleApiTest(TestCase):
+
+    def setUp(self):
+        self.account = sample_account(balance=Decimal('1000.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.account.user)
+
+    def test_deposit_schedule_is_what_the_job_books(self):
+        deposit = Deposit.objects.create(amount=Decimal('1000.00'), account=self.account)
+
+        res = self.client.get(reverse('bank:deposit-schedule', args=[deposit.pk]), {'periods': 3})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        schedule = res.data['schedule']
+        self.assertEqual(
+            [(row['period'], row['interest'], row['amount']) for row in schedule],
+            [(1, '4.17', '1004.17'), (2, '4.18', '1008.35'), (3, '4.20', '1012.55')],
+        )
+        self.assertEqual(schedule[1]['due_at'] - schedule[0]['due_at'], timedelta(minutes=1))
+        make_interest()
+        deposit.refresh_from_db()
+        self.assertEqual(str(deposit.amount), res.data['schedule'][0]['amount'])
+
+    def test_credit_schedule_stops_when_paid_off(self):
+        credit = Credit.objects.create(amount=Decimal('25.00'), total_amount=Decimal('100.00'), account=self.account)
+
+        res = self.client.get(reverse('bank:credit-schedule', args=[credit.pk]), {'periods': 12})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['period'], row['payment'], row['amount']) for row in res.data['schedule']], [
+            (1, '10.00', '15.00'),
+            (2, '10.00', '5.00'),
+            (3, '5.00', '0.00'),
+        ])
+        credit_payment()
+        credit.refresh_from_db()
+        self.assertEqual(str(credit.amount), res.data['schedule'][0]['amount'])
+
+    def test_periods_are_limited(self):
+        deposit = Deposit.objects.create(amount=Decimal('1000.00'), account=self.account)
+
+        with self.settings(BANK_SCHEDULE_MAX_PERIODS=5):
+            res = self.client.get(reverse('bank:deposit-schedule', args=[deposit.pk]), {'periods': 6})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_deposit_is_not_found(self):
+        other = sample_account(username='test2', balance=Decimal('1000.00'))
+        deposit = Deposit.objects.create(amount=Decimal('1000.00'), account=other)
+
+        res = self.client.get(reverse('bank:deposit-schedule', args=[deposit.pk]))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,64 @@
+import json
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from bank.benchmarks.cases import CASES
+from bank.management.commands.explain_queries import SEQ_SCAN
+from bank.models import Action
+
+
+class ExplainQueriesTest(TestCase):
+
+    def test_api_queries_use_indexes(self):
+        out = StringIO()
+
+        call_command('explain_queries', seed=300, accounts=30, stdout=out)
+
+        self.assertIn('No sequential scans', out.getvalue())
+
+    def test_seeded_rows_are_rolled_back(self):
+        call_command('explain_queries', seed=10, accounts=2, stdout=StringIO())
+
+        self.assertFalse(Action.objects.exists())
+
+
+class BenchConnectionsTest(TransactionTestCase):
+    # request_started closes connections, which must not happen inside the
+    # transaction of a TestCase
+
+    def test_both_modes_are_reported(self):
+        out = StringIO()
+
+        call_command('bench_connections', requests=5, stdout=out)
+
+        self.assertIn('per-request', out.getvalue())
+        self.assertIn('persistent', out.getvalue())
+
+
+class SeqScanPatternTest(SimpleTestCase):
+
+    def test_sequential_scans_are_found(self):
+        self.assertTrue(SEQ_SCAN.search('Seq Scan on bank_action  (cost=0.00..1.01 rows=1 width=8)'))
+        self.assertTrue(SEQ_SCAN.search('2 0 0 SCAN bank_action'))
+        self.assertTrue(SEQ_SCAN.search('2 0 0 SCAN TABLE bank_action'))
+
+    def test_index_access_is_not_a_sequential_scan(self):
+        self.assertFalse(SEQ_SCAN.search('Index Scan using bank_action_idx on bank_action'))
+        self.assertFalse(SEQ_SCAN.search('5 0 0 SEARCH bank_action USING INDEX bank_action_idx (account_id=?)'))
+        self.assertFalse(SEQ_SCAN.search('3 0 0 SCAN bank_credit USING INDEX bank_credit_open_idx'))
+
+
+class RunBenchmarksTest(TestCase):
+
+    def test_every_case_runs_on_a_small_dataset(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('run_benchmarks', accounts=4, history=40, iterations=1, output=output.name, stdout=StringIO())
+            report = json.load(output)
+
+        self.assertEqual(report['dataset']['accounts'], 4)
+        self.assertEqual(len(report['results']), len(CASES))
+        self.assertEqual([row['name'] for row in report['results'] if row['errors']], [])
+        self.assertTrue(all(row['p99_ms'] >= row['p50_ms'] for row in report['results']))
@@ -0,0 +1,124 @@
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import SimpleTestCase, override_settings
+
+from bank.db import check_connections, conflict_retries, retry_on_conflict
+
+
+class DriverError(Exception):
+
+    def __init__(self, pgcode):
+        self.pgcode = pgcode
+
+
+def conflict():
+    error = OperationalError('could not serialize access')
+    error.__cause__ = DriverError('40001')
+    return error
+
+
+@mock.patch('bank.db.time.sleep')
+@mock.patch('bank.db.connection', in_atomic_block=False)
+class RetryOnConflictTest(SimpleTestCase):
+
+    def test_conflict_is_retried(self, connection, sleep):
+        func = mock.Mock(side_effect=[conflict(), conflict(), 'done'])
+        retries = conflict_retries()
+
+        self.assertEqual(retry_on_conflict()(func)(), 'done')
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(conflict_retries() - retries, 2)
+
+    def test_backoff_grows(self, connection, sleep):
+        func = mock.Mock(side_effect=[conflict(), conflict(), 'done'])
+
+        retry_on_conflict(base_delay=0.1)(func)()
+
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertLessEqual(first, 0.1)
+        self.assertGreater(second, 0.1)
+
+    def test_gives_up_after_attempts(self, connection, sleep):
+        func = mock.Mock(side_effect=conflict())
+
+        with self.assertRaises(OperationalError):
+            retry_on_conflict(attempts=3)(func)()
+        self.assertEqual(func.call_count, 3)
+
+    def test_other_errors_are_not_retried(self, connection, sleep):
+        error = OperationalError('no such table')
+        error.__cause__ = DriverError('42P01')
+        func = mock.Mock(side_effect=error)
+
+        with self.assertRaises(OperationalError):
+            retry_on_conflict()(func)()
+        self.assertEqual(func.call_count, 1)
+
+    def test_not_retried_inside_outer_transaction(self, connection, sleep):
+        connection.in_atomic_block = True
+        func = mock.Mock(side_effect=conflict())
+
+        with self.assertRaises(OperationalError):
+            retry_on_conflict()(func)()
+        self.assertEqual(func.call_count, 1)
+
+
+def database(usable=True, open=True, in_atomic_block=False):
+    return mock.Mock(
+        spec=['connection', 'in_atomic_block', 'is_usable', 'close', 'ensure_connection'],
+        connection=object() if open else None,
+        in_atomic_block=in_atomic_block,
+        **{'is_usable.return_value': usable},
+    )
+
+
+@mock.patch('bank.db.connections')
+class CheckConnectionsTest(SimpleTestCase):
+
+    def test_connection_is_checked_on_first_use(self, connections):
+        broken, healthy = database(usable=False), database()
+        connections.all.return_value = [broken, healthy]
+        ensure_broken = broken.ensure_connection
+
+        check_connections()
+        broken.is_usable.assert_not_called()
+
+        broken.ensure_connection()
+        broken.ensure_connection()
+        healthy.ensure_connection()
+
+        broken.is_usable.assert_called_once_with()
+        broken.close.assert_called_once_with()
+        self.assertEqual(ensure_broken.call_count, 2)
+        healthy.close.assert_not_called()
+
+    def test_unused_connection_is_not_pinged(self, connections):
+        conn = database()
+        connections.all.return_value = [conn]
+
+        check_connections()
+        check_connections()
+
+        conn.is_usable.assert_not_called()
+        conn.ensure_connection()
+        conn.is_usable.assert_called_once_with()
+
+    def test_closed_and_atomic_connections_are_not_pinged(self, connections):
+        closed, atomic = database(open=False), database(in_atomic_block=True)
+        connections.all.return_value = [closed, atomic]
+
+        check_connections()
+        closed.ensure_connection()
+        atomic.ensure_connection()
+
+        closed.is_usable.assert_not_called()
+        atomic.is_usable.assert_not_called()
+
+    @override_settings(BANK_DB_HEALTH_CHECKS=False)
+    def test_can_be_disabled(self, connections):
+        connections.all.return_value = [database(usable=False)]
+
+        check_connections()
+
+        connections.all.assert_not_called()
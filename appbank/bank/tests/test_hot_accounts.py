@@ -0,0 +1,126 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from bank.models import *
+from bank.services import credit_payment, fold_hot_credits
+from bank.tests.helpers import sample_account
+
+
+def balance(account):
+    return Account.objects.get(pk=account.pk).balance
+
+
+class HotAccountTransferTest(TestCase):
+
+    def setUp(self):
+        self.customer = sample_account(balance=Decimal('1000.00'))
+        self.merchant = sample_account(username='merchant', balance=Decimal('0.00'), is_hot=True)
+
+    def test_payment_to_hot_account_is_pending(self):
+        Transfer.make_transfer(Decimal('10.00'), self.customer, Account(pk=self.merchant.pk))
+
+        self.assertEqual(balance(self.customer), Decimal('990.00'))
+        self.assertEqual(balance(self.merchant), Decimal('0.00'))
+        self.assertEqual(HotCredit.objects.get(account=self.merchant).amount, Decimal('10.00'))
+        self.assertEqual(self.merchant.ledger_balance(), Decimal('10.00'))
+
+    def test_hot_recipient_is_not_locked_or_updated(self):
+        Transfer.make_transfer(Decimal('10.00'), self.customer, self.merchant)
+
+        # savepoint pair, lock, sender update, pending credit, transfer,
+        # ledger insert, summary update, activity bucket insert and update
+        with self.assertNumQueries(10):
+            Transfer.make_transfer(Decimal('10.00'), self.customer, self.merchant)
+
+    def test_batch_transfer_to_hot_account(self):
+        other = sample_account(username='test2', balance=Decimal('0.00'))
+
+        transfers, errors = Transfer.make_batch_transfer(
+            [(self.merchant.pk, Decimal('5.00')), (other.pk, Decimal('7.00')), (self.merchant.pk, Decimal('3.00'))],
+            self.customer,
+        )
+
+        self.assertEqual((len(transfers), errors), (3, {}))
+        self.assertEqual(balance(self.customer), Decimal('985.00'))
+        self.assertEqual(balance(other), Decimal('7.00'))
+        self.assertEqual(balance(self.merchant), Decimal('0.00'))
+        self.assertEqual(HotCredit.objects.filter(account=self.merchant).count(), 2)
+
+    def test_fold_moves_pending_credits_into_balance(self):
+        for _ in range(3):
+            Transfer.make_transfer(Decimal('10.00'), self.customer, self.merchant)
+
+        result = fold_hot_credits()
+
+        self.assertEqual(result['rows'], 3)
+        self.assertEqual(balance(self.merchant), Decimal('30.00'))
+        self.assertFalse(HotCredit.objects.exists())
+        self.assertEqual(AccountSummary.objects.get(account=self.merchant).tx_count_30d, 3)
+        self.assertEqual(fold_hot_credits()['rows'], 0)
+
+    def test_fold_in_batches(self):
+        merchants = [self.merchant] + [
+            sample_account(username=f'merchant{i}', balance=Decimal('0.00'), is_hot=True) for i in range(4)
+        ]
+        for merchant in merchants:
+            Transfer.make_transfer(Decimal('1.00'), self.customer, merchant)
+
+        result = fold_hot_credits(batch_size=2)
+
+        self.assertEqual(result['rows'], 5)
+        self.assertFalse(Account.objects.filter(pk__in=[m.pk for m in merchants]).exclude(balance=Decimal('1.00')).exists())
+
+
+class HotAccountDebitTest(TestCase):
+
+    def setUp(self):
+        self.customer = sample_account(balance=Decimal('1000.00'))
+        self.merchant = sample_account(username='merchant', balance=Decimal('5.00'), is_hot=True)
+        Transfer.make_transfer(Decimal('20.00'), self.customer, self.merchant)
+
+    def test_transfer_from_hot_account_uses_pending_credits(self):
+        Transfer.make_transfer(Decimal('25.00'), self.merchant, self.customer)
+
+        self.assertEqual(balance(self.merchant), Decimal('0.00'))
+        self.assertFalse(HotCredit.objects.exists())
+
+    def test_debit_over_exact_total_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'Not enough money'):
+            Transfer.make_transfer(Decimal('25.01'), self.merchant, self.customer)
+
+        self.assertEqual(HotCredit.objects.count(), 1)
+
+    def test_withdraw_settles_first(self):
+        Action.make_action(Decimal('-25.00'), self.merchant)
+
+        self.assertEqual(balance(self.merchant), Decimal('0.00'))
+        self.assertEqual(self.merchant.balance, Decimal('0.00'))
+        self.assertFalse(HotCredit.objects.exists())
+
+    def test_transaction_settles_first(self):
+        Transaction.make_transaction(Decimal('24.00'), self.merchant, 'supplier')
+
+        self.assertEqual(balance(self.merchant), Decimal('1.00'))
+
+    def test_batch_transfer_from_hot_account(self):
+        _, errors = Transfer.make_batch_transfer([(self.customer.pk, Decimal('25.00'))], self.merchant)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(balance(self.merchant), Decimal('0.00'))
+
+    def test_ledger_matches_balance_after_fold(self):
+        fold_hot_credits()
+
+        self.assertEqual(balance(self.merchant) - Decimal('5.00'), self.merchant.ledger_balance())
+
+    def test_credit_payment_settles_first(self):
+        Credit.objects.create(amount=Decimal('100.00'), total_amount=Decimal('100.00'), account=self.merchant)
+
+        with mock.patch('bank.cache.write_balances_through') as write_through:
+            credit_payment()
+
+        self.assertEqual(balance(self.merchant), Decimal('15.00'))
+        self.assertFalse(HotCredit.objects.exists())
+        self.assertEqual(write_through.call_args_list[-1], mock.call({self.merchant.pk: Decimal('15.00')}))
@@ -0,0 +1,147 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from bank.idempotency import DatabaseIdempotencyStore, RedisIdempotencyStore
+from bank.models import *
+from bank.services import purge_idempotency_keys
+from bank.tests.helpers import FakeRedis
+
+ACTION_URL = reverse('bank:action-list')
+TRANSFER_BATCH_URL = reverse('bank:transfer-batch')
+
+
+class IdempotencyApiTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.account = Account.objects.get(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def post_action(self, amount, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(ACTION_URL, {'amount': amount}, **headers)
+
+    def test_retry_is_replayed(self):
+        first = self.post_action(100, key='retry-1')
+        second = self.post_action(100, key='retry-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Action.objects.count(), 1)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 100)
+
+    def test_replay_does_not_touch_bank_tables(self):
+        self.post_action(100, key='retry-1')
+
+        # stored response only
+        with self.assertNumQueries(1):
+            self.post_action(100, key='retry-1')
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        self.post_action(100)
+        self.post_action(100)
+
+        self.assertEqual(Action.objects.count(), 2)
+
+    def test_key_is_scoped_to_user(self):
+        self.post_action(100, key='retry-1')
+        user2 = get_user_model().objects.create_user(username='test2', password='ghbrjkmxbr')
+        self.client.force_authenticate(user=user2)
+
+        res = self.post_action(100, key='retry-1')
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Action.objects.count(), 2)
+
+    def test_key_reused_with_other_request(self):
+        self.post_action(100, key='retry-1')
+
+        res = self.post_action(200, key='retry-1')
+
+        self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_client_errors_are_replayed(self):
+        first = self.post_action(-100, key='retry-1')
+        self.account.balance = 1000
+        self.account.save()
+
+        second = self.post_action(-100, key='retry-1')
+
+        self.assertEqual(first.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Action.objects.exists())
+
+    @mock.patch.dict('django.conf.settings.BANK_IDEMPOTENCY', LOCK_TTL=0)
+    def test_concurrent_duplicate_gets_conflict(self):
+        DatabaseIdempotencyStore().lock((self.user.pk, 'retry-1'), ttl=60)
+
+        res = self.post_action(100, key='retry-1')
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Action.objects.exists())
+
+    def test_concurrent_duplicate_waits_for_first_response(self):
+        store = DatabaseIdempotencyStore()
+        scope = (self.user.pk, 'retry-1')
+        store.lock(scope, ttl=60)
+        record = {'fingerprint': '', 'status': 201, 'data': {'amount': '100.00'}}
+
+        with mock.patch('bank.idempotency.time.sleep', side_effect=lambda _: store.save(scope, record, 60)), \
+                mock.patch('bank.idempotency._fingerprint', return_value=''):
+            res = self.post_action(100, key='retry-1')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res['Idempotent-Replayed'], 'true')
+        self.assertFalse(Action.objects.exists())
+
+    def test_batch_transfer_is_idempotent(self):
+        self.account.balance = 1000
+        self.account.save()
+        user2 = get_user_model().objects.create_user(username='test2', password='ghbrjkmxbr')
+        payload = {'items': [{'to_account': Account.objects.get(user=user2).pk, 'amount': '10.00'}]}
+
+        for _ in range(2):
+            self.client.post(TRANSFER_BATCH_URL, payload, format='json', HTTP_IDEMPOTENCY_KEY='batch-1')
+
+        self.assertEqual(Transfer.objects.count(), 1)
+
+    def test_expired_keys_are_purged(self):
+        self.post_action(100, key='retry-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(purge_idempotency_keys()['rows'], 1)
+        self.post_action(100, key='retry-1')
+        self.assertEqual(Action.objects.count(), 2)
+
+
+@mock.patch('bank.idempotency.get_redis', return_value=FakeRedis())
+class RedisIdempotencyStoreTest(SimpleTestCase):
+
+    def test_lock_is_exclusive(self, get_redis):
+        store = RedisIdempotencyStore()
+
+        self.assertTrue(store.lock((1, 'key'), ttl=10))
+        self.assertFalse(store.lock((1, 'key'), ttl=10))
+        store.unlock((1, 'key'))
+        self.assertTrue(store.lock((1, 'key'), ttl=10))
+
+    def test_saved_record_is_returned(self, get_redis):
+        store = RedisIdempotencyStore()
+        record = {'fingerprint': 'abc', 'status': 201, 'data': {'amount': '100.00'}}
+
+        store.save((1, 'key'), record, ttl=10)
+
+        self.assertEqual(store.get((1, 'key')), record)
+        self.assertIsNone(store.get((2, 'key')))
@@ -0,0 +1,141 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+
+from bank import jobs
+from bank.models import *
+from bank.services import make_interest
+from bank.tests.helpers import sample_account
+
+
+class CheckpointedJobTest(TestCase):
+
+    def setUp(self):
+        self.account = sample_account()
+        self.period = timezone.now()
+        Deposit.objects.bulk_create(
+            Deposit(amount=Decimal('120.00'), account=self.account, next_due_at=self.period) for _ in range(5)
+        )
+        self.pks = list(Deposit.objects.order_by('pk').values_list('pk', flat=True))
+
+    def crash_on_batch(self, number):
+        """Make the number-th batch fail after it wrote its deposits"""
+        record = AccountSummary.record
+        calls = []
+
+        def failing(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == number:
+                raise(RuntimeError('worker lost'))
+            return record(*args, **kwargs)
+
+        return mock.patch.object(AccountSummary, 'record', side_effect=failing)
+
+    def test_run_is_recorded_with_checkpoint(self):
+        make_interest(period=self.period, batch_size=2)
+
+        run = JobRun.objects.get(job='make_interest', period=self.period)
+        checkpoint = run.checkpoints.get()
+        self.assertEqual(run.status, JobRun.DONE)
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual((checkpoint.last_pk, checkpoint.rows, checkpoint.batches), (self.pks[-1], 5, 3))
+        self.assertTrue(checkpoint.done)
+
+    def test_failed_batch_is_rolled_back_with_its_checkpoint(self):
+        with self.crash_on_batch(2), self.assertRaises(RuntimeError), self.assertLogs('bank.jobs', 'ERROR') as logs:
+            make_interest(period=self.period, batch_size=2)
+
+        self.assertIn(f'failed after primary key {self.pks[1]}', logs.output[0])
+        run = JobRun.objects.get(job='make_interest', period=self.period)
+        checkpoint = run.checkpoints.get()
+        self.assertEqual((run.status, run.error), (JobRun.FAILED, 'worker lost'))
+        self.assertEqual((checkpoint.last_pk, checkpoint.rows, checkpoint.done), (self.pks[1], 2, False))
+        self.assertEqual(Deposit.objects.filter(amount=Decimal('120.50')).count(), 2)
+
+    def test_resume_applies_every_row_once(self):
+        with self.crash_on_batch(2), self.assertRaises(RuntimeError), self.assertLogs('bank.jobs', 'ERROR'):
+            make_interest(period=self.period, batch_size=2)
+        run = JobRun.objects.get(job='make_interest', period=self.period)
+
+        rows = jobs.resume(run, batch_size=2)
+
+        run.refresh_from_db()
+        self.assertEqual(rows, 3)
+        self.assertEqual(run.status, JobRun.DONE)
+        self.assertEqual(run.checkpoints.get().rows, 5)
+        self.assertFalse(Deposit.objects.exclude(amount=Decimal('120.50')).exists())
+        self.assertEqual(AccountSummary.objects.get(account=self.account).deposit_total, Decimal('2.50'))
+
+    def test_run_of_a_period_is_not_repeated(self):
+        make_interest(period=self.period)
+
+        self.assertEqual(make_interest(period=self.period)['rows'], 0)
+        self.assertEqual(JobRun.objects.count(), 1)
+
+    def test_start_creates_checkpoint_per_range(self):
+        run = jobs.start('make_interest', self.period, [(1, 4), (4, 7)])
+
+        self.assertEqual(list(run.checkpoints.order_by('lo').values_list('lo', 'hi')), [(1, 4), (4, 7)])
+
+    def test_start_marks_older_running_runs_interrupted(self):
+        old = jobs.start('make_interest', self.period - timedelta(minutes=1))
+
+        jobs.start('make_interest', self.period)
+
+        old.refresh_from_db()
+        self.assertEqual((old.status, old.error), (JobRun.FAILED, 'interrupted'))
+
+    def test_shard_that_never_ran_is_resumed(self):
+        run = jobs.start('make_interest', self.period, [(self.pks[0], self.pks[2]), (self.pks[2], self.pks[-1] + 1)])
+        make_interest(period=self.period, pk_range=(self.pks[0], self.pks[2]))
+
+        self.assertEqual(jobs.resume(run), 3)
+        self.assertFalse(Deposit.objects.exclude(amount=Decimal('120.50')).exists())
+
+
+@mock.patch('bank.management.commands.jobruns.release_lease')
+@mock.patch('bank.management.commands.jobruns.acquire_lease', return_value='token')
+class JobRunsCommandTest(TestCase):
+
+    def setUp(self):
+        account = sample_account()
+        self.period = timezone.now()
+        Deposit.objects.bulk_create(
+            Deposit(amount=Decimal('120.00'), account=account, next_due_at=self.period) for _ in range(3)
+        )
+        self.run = jobs.start('make_interest', self.period)
+
+    def call(self, *args):
+        out = StringIO()
+        call_command('jobruns', *args, stdout=out)
+        return out.getvalue()
+
+    def test_list_and_show(self, acquire, release):
+        self.assertIn('make_interest', self.call('list'))
+        self.assertIn('0/1 ranges', self.call('list', '--status', 'running'))
+        self.assertEqual(self.call('list', '--job', 'credit_payment'), '')
+        self.assertIn('open', self.call('show', str(self.run.pk)))
+
+    def test_resume(self, acquire, release):
+        self.assertIn('3 rows', self.call('resume', str(self.run.pk)))
+
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.status, JobRun.DONE)
+        release.assert_called_once_with('make_interest', 'token')
+        self.assertIn('is done', self.call('resume', str(self.run.pk)))
+
+    def test_resume_waits_for_running_tick(self, acquire, release):
+        acquire.return_value = None
+
+        with self.assertRaisesMessage(CommandError, 'is running'):
+            self.call('resume', '--all')
+
+    def test_unknown_run(self, acquire, release):
+        with self.assertRaisesMessage(CommandError, 'No run'):
+            self.call('show', '0')
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import runpy
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.urls import path, reverse
+from prometheus_client import REGISTRY
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from bank.authentication import token_cache
+from bank.models import Account
+
+ACTION_URL = reverse('bank:action-list')
+METRICS_URL = reverse('metrics')
+
+
+async def slow_view(request):
+    await asyncio.sleep(0.2)
+    return JsonResponse({})
+
+
+urlpatterns = [path('slow/', slow_view, name='slow')]
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.view = 'api:action-list'
+
+    def test_request_is_measured(self):
+        count = sample('bank_request_duration_seconds_count', view=self.view, method='GET')
+        queries = sample('bank_request_db_queries_sum', view=self.view, method='GET')
+
+        with self.assertNumQueries(1):
+            self.client.get(ACTION_URL)
+
+        self.assertEqual(sample('bank_request_duration_seconds_count', view=self.view, method='GET'), count + 1)
+        self.assertEqual(sample('bank_request_db_queries_sum', view=self.view, method='GET'), queries + 1)
+        self.assertEqual(sample('bank_responses_total', view=self.view, method='GET', status='200') > 0, True)
+
+    def test_unmatched_paths_share_a_label(self):
+        count = sample('bank_request_duration_seconds_count', view='unmatched', method='GET')
+
+        self.client.get('/no/such/path/')
+
+        self.assertEqual(sample('bank_request_duration_seconds_count', view='unmatched', method='GET'), count + 1)
+
+    @mock.patch.dict('django.conf.settings.BANK_METRICS', QUERY_BUDGET=0)
+    def test_query_budget_warning(self):
+        exceeded = sample('bank_request_budget_exceeded_total', view=self.view, method='GET', budget='queries')
+
+        with self.assertLogs('bank.middleware', level='WARNING') as logs:
+            self.client.get(ACTION_URL)
+
+        self.assertIn('api:action-list over budget', logs.output[0])
+        self.assertEqual(
+            sample('bank_request_budget_exceeded_total', view=self.view, method='GET', budget='queries'), exceeded + 1
+        )
+
+    @mock.patch.dict('django.conf.settings.BANK_METRICS', TIME_BUDGET=None, QUERY_BUDGET=None)
+    def test_budgets_can_be_disabled(self):
+        with mock.patch('bank.middleware.logger') as logger:
+            self.client.get(ACTION_URL)
+
+        logger.warning.assert_not_called()
+
+
+class AsyncMetricsMiddlewareTest(TransactionTestCase):
+    """Async views run their queries in pool threads with their own
+       connections, so data has to be committed"""
+
+    def setUp(self):
+        token_cache.clear()
+        user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.account = Account.objects.get(user=user)
+        self.token = Token.objects.create(user=user).key
+
+    async def test_queries_of_async_views_are_counted(self):
+        url = reverse('bank:async-account-detail', args=[self.account.pk])
+        labels = {'view': 'api:async-account-detail', 'method': 'GET'}
+        queries = sample('bank_request_db_queries_sum', **labels)
+
+        res = await AsyncClient().get(url, authorization='Token ' + self.token)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # the token and the account, both read in a pool thread
+        self.assertEqual(sample('bank_request_db_queries_sum', **labels), queries + 2)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    async def test_concurrent_requests(self):
+        """Under ASGI the whole middleware stack must not run requests one
+           at a time in the thread of sync code"""
+        client = AsyncClient()
+        count = sample('bank_request_duration_seconds_count', view='slow', method='GET')
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client.get('/slow/') for _ in range(8)))
+        seconds = time.perf_counter() - started
+
+        self.assertLess(seconds, 0.8)
+        self.assertEqual(sample('bank_request_duration_seconds_count', view='slow', method='GET'), count + 8)
+
+
+class MetricsViewTest(TestCase):
+
+    @mock.patch.dict('django.conf.settings.BANK_METRICS', TOKEN='secret')
+    def test_exposition_format(self):
+        self.client.get(reverse('bank:action-list'))
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'bank_request_duration_seconds_bucket{', res.content)
+
+    @mock.patch.dict('django.conf.settings.BANK_METRICS', TOKEN='secret')
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get(METRICS_URL).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(
+            self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret').status_code, status.HTTP_200_OK
+        )
+
+    @override_settings(DEBUG=False)
+    @mock.patch.dict('django.conf.settings.BANK_METRICS', TOKEN='')
+    def test_token_is_required_outside_debug(self):
+        self.assertEqual(self.client.get(METRICS_URL).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(
+            self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer ').status_code, status.HTTP_403_FORBIDDEN
+        )
+
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get(METRICS_URL).status_code, status.HTTP_200_OK)
+
+    def test_debug_false_in_environment_turns_debug_off(self):
+        environ = {'DEBUG': 'False', 'SECRET_KEY': 'x', 'ALLOWED_HOSTS': '*'}
+        with mock.patch.dict(os.environ, environ):
+            self.assertIs(runpy.run_module('appbank.settings')['DEBUG'], False)
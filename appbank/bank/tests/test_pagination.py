@@ -0,0 +1,63 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from bank.models import Action, Account
+from bank.views import ActionViewSet, ActionViewSetPagination
+
+ACTION_URL = reverse('bank:action-list')
+
+
+@mock.patch.object(ActionViewSet, 'pagination_class', ActionViewSetPagination)
+class HistoryPaginationTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.account = Account.objects.get(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        now = timezone.now()
+        for i in range(10):
+            action = Action.objects.create(account=self.account, amount=i)
+            # two actions share every date, id breaks the tie
+            Action.objects.filter(pk=action.pk).update(date=now - timedelta(minutes=i // 2))
+        self.ids = list(Action.objects.order_by('-date', '-id').values_list('id', flat=True))
+
+    def test_page_number_mode_is_default(self):
+        res = self.client.get(ACTION_URL, {'page': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 10)
+        self.assertEqual(len(res.data['results']), 3)
+
+    def test_cursor_pages_walk_whole_history_once(self):
+        seen = []
+        res = self.client.get(ACTION_URL, {'pagination': 'cursor'})
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', res.data)
+            seen.extend(item['id'] for item in res.data['results'])
+            if res.data['next'] is None:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(seen, self.ids)
+
+    def test_cursor_page_size_is_capped(self):
+        with mock.patch.object(ActionViewSetPagination.cursor_pagination_class, 'max_page_size', 4):
+            res = self.client.get(ACTION_URL, {'pagination': 'cursor', 'page_size': 50})
+
+        self.assertEqual(len(res.data['results']), 4)
+
+    def test_cursor_page_does_not_count_rows(self):
+        # account history page only, no COUNT(*)
+        with self.assertNumQueries(1):
+            self.client.get(ACTION_URL, {'pagination': 'cursor'})
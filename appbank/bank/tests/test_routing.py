@@ -0,0 +1,186 @@
+import asyncio
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import path, reverse
+from redis.exceptions import ConnectionError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from bank import routers
+from bank.authentication import token_cache
+from bank.middleware import _client_key
+from bank.models import Account
+from bank.routers import PrimaryReplicaRouter, read_from_replica
+from bank.tests.helpers import FakeRedis
+
+TRANSFER_URL = reverse('bank:transfer-list')
+
+
+async def slow_view(request):
+    await asyncio.sleep(0.2)
+    return JsonResponse({'replica': routers.replica_reads_enabled()})
+
+
+urlpatterns = [path('slow/', slow_view, name='slow')]
+
+
+@mock.patch('bank.routers.has_replica', return_value=True)
+class PrimaryReplicaRouterTest(SimpleTestCase):
+
+    def test_reads_go_to_primary_by_default(self, has_replica):
+        self.assertEqual(Account.objects.all().db, 'default')
+
+    def test_replica_reads(self, has_replica):
+        with read_from_replica():
+            self.assertEqual(Account.objects.all().db, 'replica')
+        self.assertEqual(Account.objects.all().db, 'default')
+
+    def test_locking_reads_and_writes_go_to_primary(self, has_replica):
+        with read_from_replica():
+            self.assertEqual(Account.objects.select_for_update().db, 'default')
+            self.assertEqual(PrimaryReplicaRouter().db_for_write(Account), 'default')
+
+    def test_no_replica_configured(self, has_replica):
+        has_replica.return_value = False
+
+        with read_from_replica():
+            self.assertEqual(Account.objects.all().db, 'default')
+
+    def test_migrations_only_on_primary(self, has_replica):
+        router = PrimaryReplicaRouter()
+
+        self.assertTrue(router.allow_migrate('default', 'bank'))
+        self.assertFalse(router.allow_migrate('replica', 'bank'))
+
+
+@mock.patch('bank.middleware.has_replica', return_value=True)
+class ReplicaRoutingMiddlewareTest(TestCase):
+    """The router is kept on the primary, so the decisions of the
+       middleware are recorded"""
+
+    def setUp(self):
+        token_cache.clear()
+        patcher = mock.patch('bank.routers.has_replica', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.redis = FakeRedis()
+        patcher = mock.patch('bank.middleware.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.decisions = []
+        patcher = mock.patch('bank.middleware.set_replica_reads', side_effect=self.record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.account = Account.objects.get(user=user)
+        self.account.balance = 1000
+        self.account.save()
+        self.other = Account.objects.get(user=get_user_model().objects.create_user(username='test2', password='x'))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+    def record(self, enabled):
+        self.decisions.append(enabled)
+        routers.set_replica_reads(enabled)
+
+    def test_list_reads_from_replica(self, has_replica):
+        self.client.get(TRANSFER_URL)
+
+        self.assertEqual(self.decisions, [True, False])
+
+    def test_writes_are_not_routed(self, has_replica):
+        res = self.client.post(TRANSFER_URL, {'to_account': self.other.pk, 'amount': 10})
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(self.decisions, [False])
+
+    def test_client_is_pinned_after_write(self, has_replica):
+        self.client.post(TRANSFER_URL, {'to_account': self.other.pk, 'amount': 10})
+        self.decisions.clear()
+
+        self.client.get(TRANSFER_URL)
+
+        self.assertEqual(self.decisions, [False, False])
+
+    def test_failed_write_does_not_pin(self, has_replica):
+        self.client.post(TRANSFER_URL, {'to_account': self.other.pk, 'amount': 10 ** 6})
+        self.decisions.clear()
+
+        self.client.get(TRANSFER_URL)
+
+        self.assertEqual(self.decisions, [True, False])
+
+    def test_other_clients_are_not_pinned(self, has_replica):
+        self.client.post(TRANSFER_URL, {'to_account': self.other.pk, 'amount': 10})
+        self.decisions.clear()
+        token = Token.objects.create(user=self.other.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        self.client.get(TRANSFER_URL)
+
+        self.assertEqual(self.decisions, [True, False])
+
+    def test_client_is_pinned_after_login(self, has_replica):
+        client = APIClient()
+        res = client.post('/rest-auth/login/', {'username': 'test', 'password': 'ghbrjkmxbr'})
+        self.assertEqual(res.status_code, 200)
+        self.decisions.clear()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + res.data['key'])
+
+        client.get(TRANSFER_URL)
+
+        self.assertEqual(self.decisions, [False, False])
+
+    def test_tokens_are_read_from_primary(self, has_replica):
+        token = Token.objects.create(user=self.other.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        with mock.patch.object(Token.objects, 'using', wraps=Token.objects.using) as using:
+            self.client.get(TRANSFER_URL)
+
+        using.assert_called_with('default')
+
+    def test_primary_is_used_when_redis_is_down(self, has_replica):
+        with mock.patch.object(self.redis, 'exists', side_effect=ConnectionError):
+            self.client.get(TRANSFER_URL)
+
+        self.assertEqual(self.decisions, [False, False])
+
+
+@override_settings(ROOT_URLCONF=__name__, MIDDLEWARE=['bank.middleware.ReplicaRoutingMiddleware'])
+@mock.patch('bank.middleware.READ_VIEW_NAMES', ('slow',))
+@mock.patch('bank.middleware.has_replica', return_value=True)
+class AsyncReplicaRoutingMiddlewareTest(SimpleTestCase):
+    """Under ASGI the middleware must not run requests one at a time in
+       the thread of sync code"""
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = mock.patch('bank.middleware.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_concurrent_requests(self, has_replica):
+        client = AsyncClient()
+
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(client.get('/slow/') for _ in range(8)))
+        seconds = time.perf_counter() - started
+
+        self.assertEqual([res.json() for res in responses], [{'replica': True}] * 8)
+        self.assertLess(seconds, 0.8)
+        self.assertFalse(routers.replica_reads_enabled())
+
+    async def test_pinned_client(self, has_replica):
+        self.redis.set(_client_key(RequestFactory().get('/', HTTP_AUTHORIZATION='Token abc')), 1)
+
+        res = await AsyncClient().get('/slow/', authorization='Token abc')
+
+        self.assertEqual(res.json(), {'replica': False})
@@ -0,0 +1,192 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from bank.models import *
+from bank.services import make_interest, credit_payment
+from bank.tests.helpers import sample_account
+
+
+# run and checkpoint get_or_create with their savepoints, marking the
+# checkpoint done, looking for open checkpoints and marking the run done
+RUN_QUERIES = 11
+
+
+class MakeInterestTest(TestCase):
+
+    def setUp(self):
+        self.account = sample_account()
+        # the next tick, deposits opened now are due by then
+        self.period = timezone.now() + timedelta(minutes=1)
+
+    def test_interest_is_exact_decimal(self):
+        deposit = Deposit.objects.create(amount=Decimal('1000.00'), account=self.account)
+
+        make_interest(period=self.period)
+
+        deposit.refresh_from_db()
+        self.assertEqual(deposit.amount, Decimal('1004.17'))
+        self.assertGreater(deposit.next_due_at, self.period)
+
+    def test_every_batch_is_processed(self):
+        Deposit.objects.bulk_create(
+            Deposit(amount=Decimal('120.00'), account=self.account) for _ in range(7)
+        )
+
+        result = make_interest(period=self.period, batch_size=3)
+
+        self.assertEqual(result['rows'], 7)
+        self.assertIn('rows_per_second', result)
+        self.assertFalse(Deposit.objects.exclude(amount=Decimal('120.50')).exists())
+
+    def test_rerun_in_same_period_does_not_accrue_twice(self):
+        deposit = Deposit.objects.create(amount=Decimal('1000.00'), account=self.account)
+
+        make_interest(period=self.period)
+        result = make_interest(period=self.period)
+
+        deposit.refresh_from_db()
+        self.assertEqual(result['rows'], 0)
+        self.assertEqual(deposit.amount, Decimal('1004.17'))
+
+    def test_next_period_accrues_again(self):
+        deposit = Deposit.objects.create(amount=Decimal('1000.00'), account=self.account)
+
+        make_interest(period=self.period)
+        make_interest(period=self.period + timedelta(minutes=1))
+
+        deposit.refresh_from_db()
+        self.assertEqual(deposit.amount, Decimal('1008.35'))
+
+
+class CreditPaymentTest(TestCase):
+
+    def setUp(self):
+        self.account = sample_account()
+        self.account.balance = Decimal('1000.00')
+        self.account.save()
+
+    def test_payment_is_tenth_of_total_amount(self):
+        credit = Credit.objects.create(amount=Decimal('110.00'), total_amount=Decimal('110.00'), account=self.account)
+
+        credit_payment()
+
+        credit.refresh_from_db()
+        self.account.refresh_from_db()
+        self.assertEqual(credit.amount, Decimal('99.00'))
+        self.assertEqual(self.account.balance, Decimal('989.00'))
+
+    def test_closed_credit_is_deleted(self):
+        credit = Credit.objects.create(amount=Decimal('5.00'), total_amount=Decimal('110.00'), account=self.account)
+
+        credit_payment()
+
+        self.account.refresh_from_db()
+        self.assertFalse(Credit.objects.filter(pk=credit.pk).exists())
+        self.assertEqual(self.account.balance, Decimal('995.00'))
+
+    def test_credits_of_one_account_across_batches(self):
+        account2 = sample_account(username='test2')
+        for account in (self.account, account2, self.account, self.account, account2):
+            Credit.objects.create(amount=Decimal('100.00'), total_amount=Decimal('100.00'), account=account)
+
+        result = credit_payment(batch_size=2)
+
+        self.account.refresh_from_db()
+        account2.refresh_from_db()
+        self.assertEqual(result['rows'], 5)
+        self.assertEqual(self.account.balance, Decimal('970.00'))
+        self.assertEqual(account2.balance, Decimal('-20.00'))
+        self.assertFalse(Credit.objects.exclude(amount=Decimal('90.00')).exists())
+
+    def test_batch_queries_do_not_depend_on_credit_count(self):
+        for _ in range(10):
+            Credit.objects.create(amount=Decimal('100.00'), total_amount=Decimal('100.00'), account=self.account)
+
+        # products, credits, accounts, account update, credit update, ledger
+        # insert, summary update, checkpoint update, the final empty batch and
+        # a savepoint pair for each of the two atomic blocks, plus the fixed
+        # run bookkeeping of bank.jobs
+        with self.assertNumQueries(13 + RUN_QUERIES):
+            credit_payment()
+
+
+class ProductTermsTest(TestCase):
+
+    def setUp(self):
+        self.account = sample_account()
+        self.account.balance = Decimal('1000.00')
+        self.account.save()
+        self.now = timezone.now()
+
+    def test_deposit_uses_rate_and_interval_of_its_product(self):
+        product = Product.objects.create(
+            kind=Product.DEPOSIT, name='Yearly 12%', annual_rate=Decimal('0.12'), periods_per_year=1,
+            interval=timedelta(days=365),
+        )
+        deposit = Deposit.objects.create(amount=Decimal('100.00'), account=self.account, product=product,
+                                         next_due_at=self.now)
+
+        make_interest(period=self.now)
+
+        deposit.refresh_from_db()
+        self.assertEqual(deposit.amount, Decimal('112.00'))
+        self.assertEqual(deposit.next_due_at, self.now + timedelta(days=365))
+
+    def test_only_due_deposits_are_read(self):
+        due = Deposit.objects.create(amount=Decimal('1000.00'), account=self.account, next_due_at=self.now)
+        Deposit.objects.create(amount=Decimal('1000.00'), account=self.account,
+                               next_due_at=self.now + timedelta(seconds=1))
+
+        result = make_interest(period=self.now)
+
+        self.assertEqual(result['rows'], 1)
+        self.assertEqual(Deposit.objects.get(pk=due.pk).amount, Decimal('1004.17'))
+
+    def test_missed_intervals_are_not_booked_at_once(self):
+        deposit = Deposit.objects.create(amount=Decimal('1000.00'), account=self.account,
+                                         next_due_at=self.now - timedelta(minutes=10))
+
+        make_interest(period=self.now)
+        result = make_interest(period=self.now)
+
+        deposit.refresh_from_db()
+        self.assertEqual(result['rows'], 0)
+        self.assertEqual(deposit.next_due_at, self.now + timedelta(minutes=1))
+
+    def test_empty_tick_is_one_lookup(self):
+        Deposit.objects.create(amount=Decimal('1000.00'), account=self.account,
+                               next_due_at=self.now + timedelta(minutes=1))
+
+        # products, savepoint pair and the empty batch
+        with self.assertNumQueries(4 + RUN_QUERIES):
+            result = make_interest(period=self.now)
+
+        self.assertEqual(result['rows'], 0)
+
+    def test_credit_uses_markup_and_share_of_its_product(self):
+        product = Product.objects.create(
+            kind=Product.CREDIT, name='Short', markup=Decimal('0.2'), repayment_share=Decimal('0.5'),
+        )
+
+        credit = Credit.make_credit(Decimal('100.00'), self.account, product=product)
+        credit_payment(period=credit.next_due_at)
+
+        credit.refresh_from_db()
+        self.assertEqual(credit.total_amount, Decimal('120.00'))
+        self.assertEqual(credit.amount, Decimal('60.00'))
+
+    def test_product_of_other_kind_is_rejected(self):
+        product = Product.default(Product.CREDIT)
+
+        with self.assertRaisesMessage(ValueError, 'Not a deposit product'):
+            Deposit.make_deposit(Decimal('10.00'), self.account, product=product)
+
+    def test_default_terms_without_product_rows(self):
+        Product.objects.all().delete()
+
+        credit = Credit.make_credit(Decimal('100.00'), self.account)
+
+        self.assertEqual(credit.total_amount, Decimal('110.00'))
@@ -0,0 +1,93 @@
+import csv
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from bank.models import *
+
+STATEMENT_URL = reverse('bank:statement-list')
+
+
+class PublicStatementApiTest(TestCase):
+
+    def test_auth_required(self):
+        res = APIClient().get(STATEMENT_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateStatementApiTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.user2 = get_user_model().objects.create_user(username='test2', password='ghbrjkmxbr2')
+        self.account = Account.objects.get(user=self.user)
+        self.account2 = Account.objects.get(user=self.user2)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        Action.make_action(Decimal('1000.00'), self.account)
+        Action.make_action(Decimal('500.00'), self.account2)
+        Transaction.make_transaction(Decimal('10.00'), self.account, 'kfc')
+        Transfer.make_transfer(Decimal('100.00'), self.account, self.account2)
+        Transfer.make_transfer(Decimal('20.00'), self.account2, self.account)
+
+    def get_ndjson(self, params=None):
+        res = self.client.get(STATEMENT_URL, params or {})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [json.loads(line) for line in b''.join(res.streaming_content).decode().splitlines()]
+
+    def test_statement_merges_history_in_date_order(self):
+        rows = self.get_ndjson()
+
+        self.assertEqual(
+            [(row['type'], row['amount']) for row in rows],
+            [('action', '1000.00'), ('transaction', '-10.00'), ('transfer_out', '-100.00'), ('transfer_in', '20.00')]
+        )
+        self.assertEqual(rows[1]['counterparty'], 'kfc')
+        self.assertEqual(rows[2]['counterparty'], self.account2.pk)
+
+    def test_statement_includes_deposit_and_credit_movements(self):
+        deposit = Deposit.make_deposit(Decimal('200.00'), self.account)
+        Deposit.update_deposit(deposit, Decimal('50.00'), self.account)
+        credit = Credit.make_credit(Decimal('300.00'), self.account)
+        Credit.update_credit(credit, Decimal('30.00'), self.account)
+        Deposit.close_deposit(deposit, self.account)
+
+        rows = self.get_ndjson()[4:]
+
+        self.assertEqual(
+            [(row['type'], row['amount']) for row in rows],
+            [('deposit', '-200.00'), ('deposit_withdraw', '50.00'), ('credit', '300.00'),
+             ('credit_repayment', '-30.00'), ('deposit_close', '150.00')]
+        )
+        self.account.refresh_from_db()
+        self.assertEqual(sum(Decimal(row['amount']) for row in self.get_ndjson()), self.account.balance)
+
+    def test_statement_as_csv(self):
+        res = self.client.get(STATEMENT_URL, {'output': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.reader(b''.join(res.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ['date', 'type', 'id', 'amount', 'counterparty'])
+        self.assertEqual(len(rows), 5)
+
+    def test_date_range_filter(self):
+        Action.objects.filter(account=self.account).update(date=timezone.now() - timedelta(days=3))
+
+        rows = self.get_ndjson({'date_from': (timezone.now() - timedelta(days=1)).date().isoformat()})
+
+        self.assertNotIn('action', [row['type'] for row in rows])
+        self.assertEqual(len(rows), 3)
+
+    def test_invalid_params(self):
+        for params in ({'output': 'xml'}, {'date_from': 'yesterday'}):
+            res = self.client.get(STATEMENT_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
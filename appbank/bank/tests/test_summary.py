@@ -0,0 +1,113 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from bank.models import *
+from bank.services import credit_payment, make_interest, refresh_account_summaries
+from bank.tests.helpers import sample_account
+
+SUMMARY_URL = reverse('bank:account-summary')
+
+
+def summary(account):
+    return AccountSummary.objects.get(account=account)
+
+
+class AccountSummaryTest(TestCase):
+
+    def setUp(self):
+        self.account = sample_account(balance=Decimal('1000.00'))
+        self.other = sample_account(username='test2', balance=Decimal('1000.00'))
+
+    def test_new_account_has_empty_summary(self):
+        self.assertEqual(
+            AccountSummary.objects.filter(account=self.account).values('deposit_total', 'credit_outstanding', 'tx_count_30d').get(),
+            {'deposit_total': 0, 'credit_outstanding': 0, 'tx_count_30d': 0},
+        )
+
+    def test_deposits_are_totalled(self):
+        deposit = Deposit.make_deposit(Decimal('300.00'), self.account)
+        Deposit.make_deposit(Decimal('100.00'), self.account)
+        Deposit.update_deposit(deposit, Decimal('50.00'), self.account)
+        self.assertEqual(summary(self.account).deposit_total, Decimal('350.00'))
+
+        Deposit.close_deposit(deposit, self.account)
+        self.assertEqual(summary(self.account).deposit_total, Decimal('100.00'))
+
+    def test_interest_is_added_to_deposit_total(self):
+        Deposit.make_deposit(Decimal('1000.00'), self.account)
+
+        make_interest()
+
+        self.assertEqual(summary(self.account).deposit_total, Decimal('1004.17'))
+
+    def test_outstanding_credit(self):
+        credit = Credit.make_credit(Decimal('100.00'), self.account)
+        self.assertEqual(summary(self.account).credit_outstanding, Decimal('110.00'))
+
+        Credit.update_credit(credit, Decimal('10.00'), self.account)
+        credit_payment()
+
+        self.assertEqual(summary(self.account).credit_outstanding, Decimal('89.00'))
+
+    def test_credit_limit_counts_outstanding_credit(self):
+        self.account.balance = Decimal('10.00')
+        self.account.save()
+        Credit.make_credit(Decimal('900.00'), self.account)
+        Transaction.make_transaction(Decimal('900.00'), self.account, 'shop')
+
+        # the limit of 100 balances is 1000, 990 of it is still owed
+        with self.assertRaisesMessage(ValueError, 'Reduce your credit amount'):
+            Credit.make_credit(Decimal('100.00'), self.account)
+
+    def test_movements_are_counted(self):
+        Action.make_action(Decimal('10.00'), self.account)
+        Transaction.make_transaction(Decimal('10.00'), self.account, 'shop')
+        Transfer.make_transfer(Decimal('10.00'), self.account, self.other)
+        Transfer.make_batch_transfer([(self.other.pk, Decimal('1.00'))] * 2, self.account)
+
+        self.assertEqual(summary(self.account).tx_count_30d, 5)
+        self.assertEqual(summary(self.other).tx_count_30d, 3)
+        self.assertEqual(AccountActivityDay.objects.get(account=self.account).movements, 5)
+
+    def test_expired_days_leave_the_window(self):
+        Action.make_action(Decimal('10.00'), self.account)
+        today = timezone.localdate()
+
+        refresh_account_summaries(today=today + timedelta(days=29))
+        self.assertEqual(summary(self.account).tx_count_30d, 1)
+
+        result = refresh_account_summaries(today=today + timedelta(days=30))
+
+        self.assertEqual(result['rows'], 1)
+        self.assertEqual(summary(self.account).tx_count_30d, 0)
+        self.assertFalse(AccountActivityDay.objects.exists())
+
+
+class AccountSummaryApiTest(TestCase):
+
+    def setUp(self):
+        self.account = sample_account(balance=Decimal('1000.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.account.user)
+
+    def test_summary_is_one_lookup(self):
+        Deposit.make_deposit(Decimal('100.00'), self.account)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(SUMMARY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deposit_total'], '100.00')
+        self.assertEqual(res.data['tx_count_30d'], 0)
+
+    def test_authentication_required(self):
+        res = APIClient().get(SUMMARY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,127 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from appbank.celery import app
+from bank.models import *
+from bank.services import make_interest, shard_ranges
+from bank.tasks import call_make_interest, call_credit_payment, finish_job
+from bank.tests.helpers import sample_account
+
+
+def run_eagerly(test):
+    app.conf.task_always_eager = True
+    test.addCleanup(setattr, app.conf, 'task_always_eager', False)
+
+
+@mock.patch('bank.tasks.release_lease')
+@mock.patch('bank.tasks.acquire_lease', return_value='token')
+class ShardedJobTest(TestCase):
+
+    def setUp(self):
+        self.account = sample_account()
+        self.account.balance = Decimal('1000.00')
+        self.account.save()
+        Deposit.objects.bulk_create(
+            Deposit(amount=Decimal('120.00'), account=self.account) for _ in range(10)
+        )
+
+    def test_shard_ranges_cover_all_rows_once(self, acquire, release):
+        ranges = shard_ranges(Deposit.objects.all(), 3)
+
+        self.assertEqual(len(ranges), 3)
+        self.assertEqual(
+            sum(Deposit.objects.filter(pk__gte=lo, pk__lt=hi).count() for lo, hi in ranges),
+            10
+        )
+
+    def test_pk_range_limits_job_to_shard(self, acquire, release):
+        lo, hi = shard_ranges(Deposit.objects.all(), 2)[0]
+
+        result = make_interest(pk_range=(lo, hi))
+
+        self.assertEqual(result['rows'], 5)
+
+    def test_tick_is_skipped_while_lease_is_held(self, acquire, release):
+        acquire.return_value = None
+
+        self.assertIsNone(call_make_interest(shards=1))
+        self.assertFalse(Deposit.objects.exclude(amount=Decimal('120.00')).exists())
+        release.assert_not_called()
+
+    def test_inline_run_releases_lease(self, acquire, release):
+        result = call_make_interest(shards=1)
+
+        self.assertEqual(result['rows'], 10)
+        release.assert_called_once_with('make_interest', 'token')
+
+    def test_fan_out_over_shards(self, acquire, release):
+        run_eagerly(self)
+        result = call_make_interest(shards=4)
+
+        self.assertEqual(result['shards'], 4)
+        self.assertFalse(Deposit.objects.exclude(amount=Decimal('120.50')).exists())
+        release.assert_called_once_with('make_interest', 'token')
+
+    def test_failed_start_releases_lease(self, acquire, release):
+        for shards in (1, 4):
+            with mock.patch('bank.tasks.jobs.start', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+                call_make_interest(shards=shards)
+
+        self.assertEqual(release.call_args_list, [mock.call('make_interest', 'token')] * 2)
+
+    def test_credit_fan_out_over_shards(self, acquire, release):
+        for _ in range(4):
+            Credit.objects.create(amount=Decimal('100.00'), total_amount=Decimal('100.00'), account=self.account)
+
+        run_eagerly(self)
+        call_credit_payment(shards=2)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('960.00'))
+
+    def test_tick_with_nothing_due_takes_no_lease(self, acquire, release):
+        Deposit.objects.update(next_due_at=timezone.now() + timedelta(minutes=1))
+
+        with self.assertNumQueries(1):
+            result = call_make_interest(shards=4)
+
+        self.assertEqual(result['rows'], 0)
+        acquire.assert_not_called()
+
+    def test_finish_job_aggregates_shards(self, acquire, release):
+        results = [
+            {'rows': 3, 'seconds': 0.5, 'shard': [1, 4]},
+            {'rows': 2, 'seconds': 0.75, 'shard': [4, 6]},
+        ]
+
+        summary = finish_job(results, 'make_interest', 'token')
+
+        self.assertEqual(summary['rows'], 5)
+        self.assertEqual(summary['seconds'], 0.75)
+        self.assertEqual(len(summary['shards']), 2)
+        release.assert_called_once_with('make_interest', 'token')
+
+
+class TaskRoutingTest(TestCase):
+
+    def queue(self, name):
+        return app.amqp.router.route({}, name)['queue'].name
+
+    def test_accrual_jobs_go_to_batch_queue(self):
+        for name in ('call_make_interest', 'call_credit_payment', 'run_job_shard', 'finish_job'):
+            self.assertEqual(self.queue(f'bank.tasks.{name}'), 'batch')
+
+    def test_unrouted_tasks_go_to_interactive_queue(self):
+        self.assertEqual(self.queue('bank.tasks.call_fold_hot_credits'), 'interactive')
+        self.assertEqual(self.queue('bank.tasks.some_new_task'), 'interactive')
+
+    def test_batch_tasks_are_acknowledged_late_and_limited(self):
+        task = app.tasks['bank.tasks.run_job_shard']
+
+        self.assertTrue(task.acks_late)
+        self.assertTrue(task.reject_on_worker_lost)
+        self.assertLess(task.soft_time_limit, task.time_limit)
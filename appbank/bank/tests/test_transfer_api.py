@@ -1,13 +1,15 @@
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from bank.models import Transfer, Account
+from bank.models import Action, Deposit, Transfer, Account
 from bank.views import TransferViewSet
 
 TRANSFER_URL = reverse('bank:transfer-list')
+BATCH_URL = reverse('bank:transfer-batch')
 
 
 class PublicBankApiTest(TestCase):
@@ -105,4 +107,124 @@ class PrivateBankApiTest(TestCase):
         }
         res = self.client.post(TRANSFER_URL, payload)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
-    
\ No newline at end of file
+    
+
+class MakeTransferTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.user2 = get_user_model().objects.create_user(username='test2', password='ghbrjkmxbr2')
+        Account.objects.update(balance=1000)
+        self.account = Account.objects.get(user=self.user)
+        self.account2 = Account.objects.get(user=self.user2)
+
+    def test_stale_account_objects_do_not_overwrite_balances(self):
+        stale = Account.objects.get(pk=self.account.pk)
+        stale2 = Account.objects.get(pk=self.account2.pk)
+
+        Transfer.make_transfer(100, self.account, self.account2)
+        Transfer.make_transfer(50, stale, stale2)
+
+        self.account.refresh_from_db()
+        self.account2.refresh_from_db()
+        self.assertEqual(self.account.balance, 850)
+        self.assertEqual(self.account2.balance, 1150)
+        self.assertEqual(stale.balance, 850)
+
+    def test_balance_is_checked_on_locked_row(self):
+        stale = Account.objects.get(pk=self.account.pk)
+        Account.objects.filter(pk=self.account.pk).update(balance=10)
+
+        with self.assertRaises(ValueError):
+            Transfer.make_transfer(100, stale, self.account2)
+
+    def test_incoming_transfer_is_not_overwritten_by_stale_account(self):
+        stale = Account.objects.get(pk=self.account2.pk)
+
+        Transfer.make_transfer(50, self.account, self.account2)
+        Action.make_action(10, stale)
+        Deposit.make_deposit(100, stale)
+
+        self.account2.refresh_from_db()
+        self.assertEqual(self.account2.balance, 960)
+        self.assertEqual(stale.balance, 960)
+
+
+class BatchTransferApiTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='test', password='ghbrjkmxbr')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.get(user=self.user)
+        self.account.balance = 1000
+        self.account.save()
+        self.recipients = [
+            Account.objects.get(user=get_user_model().objects.create_user(username=f'test{i}', password='ghbrjkmxbr'))
+            for i in range(3)
+        ]
+
+    def post_batch(self, items, partial=False):
+        return self.client.post(BATCH_URL, {'items': items, 'partial': partial}, format='json')
+
+    def test_batch_is_applied(self):
+        items = [{'to_account': account.pk, 'amount': '100.00'} for account in self.recipients]
+        items.append({'to_account': self.recipients[0].pk, 'amount': '50.00'})
+
+        res = self.post_batch(items)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result['status'] for result in res.data['results']], ['ok'] * 4)
+        self.assertEqual(
+            [result['id'] for result in res.data['results']],
+            list(Transfer.objects.filter(from_account=self.account).order_by('pk').values_list('pk', flat=True))
+        )
+        self.account.refresh_from_db()
+        self.recipients[0].refresh_from_db()
+        self.assertEqual(self.account.balance, 650)
+        self.assertEqual(self.recipients[0].balance, 150)
+        self.assertEqual(Transfer.objects.filter(from_account=self.account).count(), 4)
+
+    def test_bad_item_fails_whole_batch(self):
+        items = [
+            {'to_account': self.recipients[0].pk, 'amount': '100.00'},
+            {'to_account': 0, 'amount': '100.00'},
+        ]
+
+        res = self.post_batch(items)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 1000)
+        self.assertFalse(Transfer.objects.exists())
+
+    def test_partial_mode_reports_every_item(self):
+        items = [
+            {'to_account': self.recipients[0].pk, 'amount': '600.00'},
+            {'to_account': 0, 'amount': '10.00'},
+            {'to_account': self.recipients[1].pk, 'amount': '600.00'},
+            {'to_account': self.recipients[2].pk, 'amount': '400.00'},
+        ]
+
+        res = self.post_batch(items, partial=True)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [result.get('error') for result in res.data['results']],
+            [None, 'No such account', 'Not enough money', None]
+        )
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 0)
+        transfers = Transfer.objects.filter(from_account=self.account).order_by('pk')
+        self.assertEqual(res.data['results'][0]['id'], transfers[0].pk)
+        self.assertEqual(res.data['results'][3]['id'], transfers[1].pk)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        items = [{'to_account': account.pk, 'amount': '1.00'} for account in self.recipients] * 20
+
+        # account, savepoint pair, lock, transfer insert, balance update, ledger
+        # insert, summary update, activity bucket insert and update, and the
+        # ids of the transfers where a bulk insert doesn't return them
+        with self.assertNumQueries(10 + (not connection.features.can_return_rows_from_bulk_insert)):
+            res = self.post_batch(items)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
@@ -2,6 +2,7 @@ from rest_framework.routers import DefaultRouter
 from django.urls import path, include
 
 from .views import *
+from . import async_views
 
 app_name='bank'
 
@@ -13,6 +14,13 @@ router.register(r'transaction', TransactionViewSet)
 router.register(r'transfer', TransferViewSet)
 router.register(r'deposit', DepositViewSet)
 router.register(r'credit', CreditViewSet)
+router.register(r'product', ProductViewSet)
+router.register(r'statement', StatementViewSet, basename='statement')
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/account/<int:pk>/', async_views.account_detail, name='async-account-detail'),
+    path('async/profile/<int:pk>/', async_views.profile_detail, name='async-profile-detail'),
+    path('async/action/', async_views.action_list, name='async-action-list'),
+    path('async/transaction/', async_views.transaction_list, name='async-transaction-list'),
+    path('async/transfer/', async_views.transfer_list, name='async-transfer-list'),
 ]
\ No newline at end of file
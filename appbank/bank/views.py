@@ -1,20 +1,43 @@
+from datetime import datetime, time
 
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from django.utils.http import parse_etags
 from rest_framework import viewsets, mixins
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.pagination import PageNumberPagination
 
+from . import calculations
+from .authentication import CachedTokenAuthentication
+from .cache import account_id_for_user, balance_etag, cached_balance
+from .idempotency import idempotent
+from .pagination import HistoryPagination
+from .statements import render_csv, render_ndjson, statement_rows
 from .serializers import *
 from .models import *
 
 
+class AccountMixin:
+    """Resolves the request user's account once per request"""
+
+    def get_account_id(self):
+        if not hasattr(self, '_account_id'):
+            self._account_id = account_id_for_user(self.request.user)
+        return self._account_id
+
+    def get_account(self):
+        """Account row of the request user for changing its balance"""
+        return Account.objects.get(pk=self.get_account_id())
+
+
 class AccountViewSet(viewsets.GenericViewSet,
                      mixins.ListModelMixin,
                      mixins.RetrieveModelMixin):
     serializer_class = AccountSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
 
     def get_queryset(self):
         """User gets only his account"""
@@ -32,6 +55,31 @@ class AccountViewSet(viewsets.GenericViewSet,
 
         return (permission() for permission in permission_classes)
 
+    def retrieve(self, request, *args, **kwargs):
+        """Own balance is served from the balance cache, a poll with the
+           ETag of the last response gets 304"""
+        account_id = account_id_for_user(request.user)
+        if kwargs['pk'] != str(account_id):
+            return super().retrieve(request, *args, **kwargs)
+
+        balance = cached_balance(account_id)
+        etag = balance_etag(account_id, balance)
+        if_none_match = [tag.replace('W/', '', 1) for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))]
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        serializer = self.get_serializer(Account(pk=account_id, balance=balance))
+        return Response(serializer.data, headers={'ETag': etag})
+
+    @action(detail=False, serializer_class=AccountSummarySerializer)
+    def summary(self, request):
+        """Deposit total, outstanding credit and recent activity of the
+           user's account, maintained on every change"""
+        summary = AccountSummary.objects.get(account_id=account_id_for_user(request.user))
+        return Response(self.get_serializer(summary).data)
+
 
 class ProfileViewSet(
                    mixins.RetrieveModelMixin,
@@ -41,7 +89,7 @@ class ProfileViewSet(
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
 
     def get_queryset(self):
         """User gets only his account"""
@@ -60,28 +108,30 @@ class ProfileViewSet(
         return (permission() for permission in permission_classes)
 
 
-class ActionViewSetPagination(PageNumberPagination):
-    page_size = 3
+class ActionViewSetPagination(HistoryPagination):
+    pass
 
 
-class ActionViewSet(mixins.CreateModelMixin,
+class ActionViewSet(AccountMixin,
+                   mixins.CreateModelMixin,
                    mixins.ListModelMixin,
                    viewsets.GenericViewSet):
     queryset = Action.objects.all().order_by('-id')
     serializer_class = ActionSerializer
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     pagination_class = ActionViewSetPagination
 
     def get_queryset(self):
-        return self.queryset.filter(account=Account.objects.get(user=self.request.user)).order_by('-id')
+        return self.queryset.filter(account_id=self.get_account_id()).order_by('-id')
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         try:
-            Action.make_action(**serializer.validated_data, account=Account.objects.get(user=self.request.user))
+            Action.make_action(**serializer.validated_data, account=self.get_account())
         except Exception as e:
             content = {"error": str(e)}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
@@ -94,28 +144,30 @@ class ActionViewSet(mixins.CreateModelMixin,
             headers=headers)
 
 
-class TransactionViewSetPagination(PageNumberPagination):
-    page_size = 3           
+class TransactionViewSetPagination(HistoryPagination):
+    pass
 
 
-class TransactionViewSet(mixins.CreateModelMixin,
+class TransactionViewSet(AccountMixin,
+                         mixins.CreateModelMixin,
                          mixins.ListModelMixin,
                          viewsets.GenericViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     pagination_class = TransactionViewSetPagination
 
     def get_queryset(self):
-        return self.queryset.filter(account=Account.objects.get(user=self.request.user)).order_by('-id')
+        return self.queryset.filter(account_id=self.get_account_id()).order_by('-id')
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         try:
-            Transaction.make_transaction(**serializer.validated_data, account=Account.objects.get(user=self.request.user))  
+            Transaction.make_transaction(**serializer.validated_data, account=self.get_account())  
         except Exception as e:
             content = {"error": str(e)}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
@@ -128,22 +180,24 @@ class TransactionViewSet(mixins.CreateModelMixin,
             headers=headers)
 
 
-class TransferViewSetPagination(PageNumberPagination):
-    page_size = 3           
+class TransferViewSetPagination(HistoryPagination):
+    pass
 
 
-class TransferViewSet(mixins.CreateModelMixin,
+class TransferViewSet(AccountMixin,
+                      mixins.CreateModelMixin,
                       mixins.ListModelMixin,
                       viewsets.GenericViewSet):
     queryset = Transfer.objects.all()
     serializer_class = TransferSerializer
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     pagination_class = TransferViewSetPagination
 
     def get_queryset(self):
-        return self.queryset.filter(from_account=Account.objects.get(user=self.request.user)).order_by('-id')
+        return self.queryset.filter(from_account_id=self.get_account_id()).order_by('-id')
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -155,7 +209,7 @@ class TransferViewSet(mixins.CreateModelMixin,
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            Transfer.make_transfer(**serializer.validated_data, from_account=Account.objects.get(user=self.request.user))  
+            Transfer.make_transfer(**serializer.validated_data, from_account=self.get_account())  
         except Exception as e:
             content = {"error": str(e)}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
@@ -167,22 +221,63 @@ class TransferViewSet(mixins.CreateModelMixin,
             status=status.HTTP_201_CREATED, 
             headers=headers)
 
+    @action(detail=False, methods=['post'], serializer_class=TransferBatchSerializer)
+    @idempotent
+    def batch(self, request, *args, **kwargs):
+        """Many transfers in one request, all or nothing unless partial"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
+
+        try:
+            transfers, errors = Transfer.make_batch_transfer(
+                [(item['to_account'], item['amount']) for item in items],
+                from_account=self.get_account(),
+                partial=serializer.validated_data['partial']
+            )
+        except Exception as e:
+            content = {"error": str(e)}
+            return Response(content, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        for index, item in enumerate(items):
+            result = {'to_account': item['to_account'], 'amount': str(item['amount'])}
+            if index in errors:
+                result.update(status='error', error=errors[index])
+            else:
+                result.update(status='ok', id=transfers[index].pk)
+            results.append(result)
+
+        return Response(
+            {'results': results},
+            status=status.HTTP_201_CREATED if transfers else status.HTTP_400_BAD_REQUEST
+        )
+
 
-class DepositViewSet(viewsets.ModelViewSet):
+class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+    """Deposit and credit products a customer can choose from"""
+    queryset = Product.objects.order_by('kind', 'id')
+    serializer_class = ProductSerializer
+    permission_classes = (IsAuthenticated,)
+    authentication_classes = (CachedTokenAuthentication,)
+
+
+class DepositViewSet(AccountMixin, viewsets.ModelViewSet):
     queryset = Deposit.objects.all()
     serializer_class = DepositSerializer
     permission_classes = (IsAuthenticated, )
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
 
     def get_queryset(self):
-        return self.queryset.filter(account=Account.objects.get(user=self.request.user)).order_by('-id')
+        return self.queryset.filter(account_id=self.get_account_id()).order_by('-id')
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         try:
-            Deposit.make_deposit(**serializer.validated_data, account=Account.objects.get(user=self.request.user))
+            Deposit.make_deposit(**serializer.validated_data, account=self.get_account())
         except Exception as e:
             content = {"error": str(e)}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
@@ -202,7 +297,7 @@ class DepositViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
 
         try:
-            Deposit.update_deposit(instance=instance, **serializer.validated_data, account=Account.objects.get(user=self.request.user))
+            Deposit.update_deposit(instance=instance, **serializer.validated_data, account=self.get_account())
         except Exception as e:
             content = {"error": str(e)}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
@@ -218,33 +313,52 @@ class DepositViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         """Destroy deposit and transfer of balance to account"""
         instance = self.get_object()
-        account = Account.objects.get(user=self.request.user)
 
-        if instance.amount > 0:
-            account.balance += instance.amount
-            account.save()
-        
-        self.perform_destroy(instance)
+        Deposit.close_deposit(instance=instance, account=self.get_account())
         return Response(
             status=status.HTTP_204_NO_CONTENT
         )
 
+    @action(detail=True, serializer_class=ScheduleSerializer)
+    def schedule(self, request, *args, **kwargs):
+        """Interest of the next periods as the interest job will book it"""
+        instance = self.get_object()
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        product = instance.product or Product.default(Product.DEPOSIT)
+        interest, amounts = calculations.project_deposits(
+            calculations.to_minor([instance.amount]), serializer.validated_data['periods'], product.period_rate
+        )
+        rows = zip(calculations.to_decimal(interest[0]), calculations.to_decimal(amounts[0]))
+
+        return Response({'id': instance.pk, 'schedule': [
+            {
+                'period': period,
+                'due_at': instance.next_due_at + (period - 1) * product.interval,
+                'interest': str(value),
+                'amount': str(amount),
+            }
+            for period, (value, amount) in enumerate(rows, 1)
+        ]})
 
-class CreditViewSet(viewsets.ModelViewSet):
+
+class CreditViewSet(AccountMixin, viewsets.ModelViewSet):
     queryset = Credit.objects.all()
     serializer_class = CreditSerializer
     permission_classes = (IsAuthenticated, )
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
 
     def get_queryset(self):
-        return self.queryset.filter(account=Account.objects.get(user=self.request.user)).order_by('-id')
+        return self.queryset.filter(account_id=self.get_account_id()).order_by('-id')
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         try:
-            Credit.make_credit(**serializer.validated_data, account=Account.objects.get(user=self.request.user))
+            Credit.make_credit(**serializer.validated_data, account=self.get_account())
         except Exception as e:
             content = {"error": str(e)}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
@@ -264,7 +378,7 @@ class CreditViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
 
         try:
-            Credit.update_credit(instance=instance, **serializer.validated_data, account=Account.objects.get(user=self.request.user))
+            Credit.update_credit(instance=instance, **serializer.validated_data, account=self.get_account())
         except Exception as e:
             content = {"error": str(e)}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
@@ -280,7 +394,6 @@ class CreditViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         """Close a credit without debt"""
         instance = self.get_object()
-        account = Account.objects.get(user=self.request.user)
 
         try:
             if instance.amount > 0:
@@ -292,4 +405,82 @@ class CreditViewSet(viewsets.ModelViewSet):
         self.perform_destroy(instance)
         return Response(
             status=status.HTTP_204_NO_CONTENT
-        )
\ No newline at end of file
+        )
+
+    @action(detail=True, serializer_class=ScheduleSerializer)
+    def schedule(self, request, *args, **kwargs):
+        """Payments of the next periods as the payment job will take them,
+           the schedule ends when the credit is paid off"""
+        instance = self.get_object()
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        product = instance.product or Product.default(Product.CREDIT)
+        payments, amounts = calculations.project_credits(
+            calculations.to_minor([instance.amount]),
+            calculations.to_minor([instance.total_amount]),
+            serializer.validated_data['periods'],
+            product.share
+        )
+        schedule = []
+        for period, (payment, amount) in enumerate(
+            zip(calculations.to_decimal(payments[0]), calculations.to_decimal(amounts[0])), 1
+        ):
+            if payment <= 0:
+                break
+            schedule.append({
+                'period': period,
+                'due_at': instance.next_due_at + (period - 1) * product.interval,
+                'payment': str(payment),
+                'amount': str(amount),
+            })
+
+        return Response({'id': instance.pk, 'schedule': schedule})
+
+
+class StatementViewSet(AccountMixin, viewsets.GenericViewSet):
+    """Full account statement streamed as NDJSON or CSV: actions,
+       transactions, transfers and deposit and credit movements"""
+    permission_classes = (IsAuthenticated,)
+    authentication_classes = (CachedTokenAuthentication,)
+
+    renderers = {
+        'ndjson': (render_ndjson, 'application/x-ndjson'),
+        'csv': (render_csv, 'text/csv'),
+    }
+
+    def parse_date_param(self, name):
+        """Date or datetime query parameter, None if it is not given"""
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise(ValueError(f'{name} must be an ISO date or datetime'))
+            parsed = datetime.combine(day, time.min)
+
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+    def list(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'ndjson')
+
+        try:
+            if output not in self.renderers:
+                raise(ValueError('output must be ndjson or csv'))
+            date_from = self.parse_date_param('date_from')
+            date_to = self.parse_date_param('date_to')
+        except Exception as e:
+            content = {"error": str(e)}
+            return Response(content, status=status.HTTP_400_BAD_REQUEST)
+
+        render, content_type = self.renderers[output]
+        response = StreamingHttpResponse(
+            render(statement_rows(self.get_account_id(), date_from, date_to)),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="statement.{output}"'
+
+        return response
@@ -11,7 +11,6 @@ then
     echo "PostgreSQL started"
 fi
 
-python manage.py flush --no-input
 python manage.py migrate
 
 exec "$@"
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""Production application server settings, run with `gunicorn -c gunicorn.conf.py`.
+
+WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker serves appbank.asgi
+instead of appbank.wsgi, which the async endpoints need"""
+import multiprocessing
+import os
+import shutil
+
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:8000')
+
+worker_class = os.getenv('WEB_WORKER_CLASS', 'sync')
+if worker_class == 'uvicorn.workers.UvicornWorker':
+    wsgi_app = 'appbank.asgi:application'
+else:
+    wsgi_app = 'appbank.wsgi:application'
+
+# 2 * cores + 1 for blocking workers; an event loop worker keeps a core
+# busy on its own
+_cores = multiprocessing.cpu_count()
+_default_workers = _cores * 2 + 1 if worker_class in ('sync', 'gthread') else _cores
+workers = int(os.getenv('WEB_WORKERS', _default_workers))
+threads = int(os.getenv('WEB_THREADS', 1))
+
+# Import the app once in the master, workers share its pages copy-on-write
+preload_app = os.getenv('WEB_PRELOAD', 'True') == 'True'
+
+# Recycle workers after a jittered number of requests so they don't
+# restart all at once, give in-flight requests time to finish
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.getenv('WEB_MAX_REQUESTS_JITTER', 500))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+timeout = int(os.getenv('WEB_TIMEOUT', 30))
+keepalive = int(os.getenv('WEB_KEEPALIVE', 5))
+
+accesslog = os.getenv('WEB_ACCESS_LOG', None)
+errorlog = '-'
+
+
+def when_ready(server):
+    """Close connections opened in the master while preloading, so forked
+       workers don't share their sockets"""
+    from django.db import connections
+    for connection in connections.all():
+        connection.close()
+
+    from bank import redis_client
+    redis_client._client = None
+
+
+def on_starting(server):
+    """Samples of a previous run must not be added to the new ones"""
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,51 @@
+#!/bin/sh
+# Throughput of runserver against the gunicorn profile on the same
+# machine and database. Run from the appbank directory:
+#
+#   scripts/bench_servers.sh [connections] [requests per connection]
+#
+# Uses the database configured by the SQL_* variables (a throwaway
+# SQLite file when they are unset) and the WEB_* variables of
+# gunicorn.conf.py. Results are written to bench-<server>.json.
+
+set -e
+
+CONNECTIONS=${1:-1000}
+REQUESTS=${2:-10}
+PORT=${BENCH_PORT:-8100}
+
+if [ -z "$SQL_ENGINE" ]; then
+    export SQL_DATABASE=${SQL_DATABASE:-/tmp/appbank-bench.sqlite3}
+fi
+python manage.py migrate --no-input -v 0
+
+wait_for_port() {
+    for _ in $(seq 100); do
+        python -c "import socket; socket.create_connection(('127.0.0.1', $1), 1)" 2>/dev/null && return 0
+        sleep 0.1
+    done
+    echo "server on port $1 did not start" >&2
+    return 1
+}
+
+bench() {
+    name=$1
+    shift
+    "$@" > "bench-$name.log" 2>&1 &
+    pid=$!
+    wait_for_port "$PORT"
+    python manage.py loadtest "$name=http://127.0.0.1:$PORT" \
+        --connections "$CONNECTIONS" --requests "$REQUESTS" --json > "bench-$name.json" || true
+    kill -TERM "$pid"
+    wait "$pid" 2>/dev/null || true
+    echo "== $name"
+    python -c "import json, sys
+for r in json.load(open(sys.argv[1])):
+    print(f\"{r['path']:<28} {r['rps']:>9.1f} req/s  p99 {r['p99_ms']:>8.1f} ms  errors {r['errors']}\")" "bench-$name.json"
+}
+
+# file descriptors for the client and server sockets
+ulimit -n 65536 2>/dev/null || ulimit -n "$(ulimit -Hn)"
+
+bench runserver python manage.py runserver "127.0.0.1:$PORT" --noreload
+WEB_BIND="127.0.0.1:$PORT" bench gunicorn gunicorn -c gunicorn.conf.py